@@ -8,6 +8,8 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
 
+from core.shared_state import get_shared_state
+
 
 class ChannelManager:
     """
@@ -27,7 +29,12 @@ class ChannelManager:
         将指定 provider/model 标记为不可用，记录当前时间。
         """
         model_key = f"{provider}/{model}"
-        self._excluded_models[model_key] = datetime.now()
+        excluded_time = datetime.now()
+        self._excluded_models[model_key] = excluded_time
+        # 多 worker 模式下冷却状态对所有 worker 生效
+        shared = get_shared_state()
+        if shared is not None:
+            await shared.aset_mark(f"channel_excluded|{model_key}", excluded_time.timestamp())
 
     async def is_model_excluded(self, provider: str, model: str, cooldown_period: int = 0) -> bool:
         """
@@ -39,11 +46,16 @@ class ChannelManager:
             cooldown_period: 冷却时间（秒），如果为 0 则使用实例默认值
         """
         model_key = f"{provider}/{model}"
+        period = cooldown_period or self.cooldown_period
+
+        shared = get_shared_state()
+        if shared is not None:
+            return (await shared.amarks_active([(f"channel_excluded|{model_key}", period)]))[0]
+
         excluded_time = self._excluded_models[model_key]
         if not excluded_time:
             return False
 
-        period = cooldown_period or self.cooldown_period
         if datetime.now() - excluded_time > timedelta(seconds=period):
             # 冷却时间已过，清理记录
             del self._excluded_models[model_key]
@@ -61,7 +73,7 @@ class ChannelManager:
             "preferences": {"cooldown_period": 300}
         }
         """
-        available_providers: List[Dict[str, Any]] = []
+        checks = []
         for provider in providers:
             provider_name = provider["provider"]
             # 获取唯一的模型映射字典
@@ -69,9 +81,17 @@ class ChannelManager:
             # target_model 为代理到真实 provider 的目标模型名
             target_model = list(model_dict.values())[0]
             period = provider.get("preferences", {}).get("cooldown_period", self.cooldown_period)
+            checks.append((provider_name, target_model, period or self.cooldown_period))
 
-            # 检查该模型是否被排除
-            if not await self.is_model_excluded(provider_name, target_model, period):
-                available_providers.append(provider)
+        shared = get_shared_state()
+        if shared is not None:
+            # 多 worker 模式：所有 provider 的冷却状态一次读取
+            excluded = await shared.amarks_active(
+                (f"channel_excluded|{provider_name}/{target_model}", period)
+                for provider_name, target_model, period in checks
+            )
+        else:
+            excluded = [await self.is_model_excluded(*check) for check in checks]
 
-        return available_providers
\ No newline at end of file
+        # 仅排除处于冷却期的模型
+        return [provider for provider, is_excluded in zip(providers, excluded) if not is_excluded]
\ No newline at end of file
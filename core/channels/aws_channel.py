@@ -24,7 +24,7 @@ from ..utils import (
     end_of_line,
 )
 from ..response import check_response
-from .claude_channel import gpt2claude_tools_json
+from .claude_channel import convert_claude_tools_cached
 
 
 # ============================================================
@@ -222,10 +222,7 @@ async def get_aws_payload(request, engine, provider, api_key=None):
 
     tools_mode = get_tools_mode(provider)
     if request.tools and tools_mode != "none":
-        tools = []
-        for tool in request.tools:
-            json_tool = await gpt2claude_tools_json(tool.dict()["function"])
-            tools.append(json_tool)
+        tools = convert_claude_tools_cached([tool.dict()["function"] for tool in request.tools])
         payload["tools"] = tools
         if "tool_choice" in payload:
             if isinstance(payload["tool_choice"], dict):
@@ -20,6 +20,7 @@ from ..utils import (
     end_of_line,
 )
 from ..response import check_response
+from ..tool_cache import convert_tools_cached
 
 
 # ============================================================
@@ -90,8 +91,8 @@ async def format_image_message(image_url: str) -> dict:
     }
 
 
-async def gpt2claude_tools_json(json_dict):
-    """将 GPT 格式的工具定义转换为 Claude 格式"""
+def _gpt2claude_tool(json_dict):
+    """将单个 GPT 格式的工具定义转换为 Claude 格式（不修改传入的字典）"""
     json_dict = copy.deepcopy(json_dict)
 
     # 处理 $ref 引用
@@ -148,6 +149,22 @@ async def gpt2claude_tools_json(json_dict):
     return json_dict
 
 
+async def gpt2claude_tools_json(json_dict):
+    """将 GPT 格式的工具定义转换为 Claude 格式"""
+    return _gpt2claude_tool(json_dict)
+
+
+def convert_claude_tools_cached(function_defs):
+    """
+    批量转换 GPT 格式的函数定义，相同的工具列表复用缓存的转换结果
+
+    返回新列表；其中的工具字典在请求间共享，不要原地修改。
+    """
+    return convert_tools_cached(
+        "claude", function_defs, lambda defs: [_gpt2claude_tool(d) for d in defs]
+    )
+
+
 async def patch_passthrough_claude_payload(
     payload: dict,
     modifications: dict,
@@ -308,6 +325,7 @@ async def get_claude_payload(request, engine, provider, api_key=None):
     tools_mode = get_tools_mode(provider)
     if request.tools and tools_mode != "none":
         tools = payload.get("tools", [])  # 保留已有的工具（如插件添加的）
+        tool_entries = []
         for tool in request.tools:
             # 检查是否已经是 Claude 服务器端工具格式（如 web_search_20250305）
             if hasattr(tool, 'dict'):
@@ -319,15 +337,18 @@ async def get_claude_payload(request, engine, provider, api_key=None):
             tool_type = tool_dict.get("type", "")
             if tool_type and ("_20" in tool_type or tool_type.startswith("web_search") or tool_type.startswith("code_execution") or tool_type.startswith("computer_") or tool_type.startswith("text_editor")):
                 # 服务器端工具，直接使用
-                tools.append(tool_dict)
+                tool_entries.append((True, tool_dict))
             elif "function" in tool_dict:
                 # 客户端函数工具，需要转换格式
-                json_tool = await gpt2claude_tools_json(tool_dict["function"])
-                tools.append(json_tool)
+                tool_entries.append((False, tool_dict["function"]))
             else:
                 # 其他格式，尝试转换
-                json_tool = await gpt2claude_tools_json(tool_dict)
-                tools.append(json_tool)
+                tool_entries.append((False, tool_dict))
+
+        # 函数工具整体批量转换（命中缓存时跳过深拷贝和 $ref 展开），再按原顺序合并
+        converted = iter(convert_claude_tools_cached([d for is_server, d in tool_entries if not is_server]))
+        for is_server, tool_dict in tool_entries:
+            tools.append(tool_dict if is_server else next(converted))
         payload["tools"] = tools
         if "tool_choice" in payload:
             if isinstance(payload["tool_choice"], dict):
@@ -21,6 +21,7 @@ from ..utils import (
     upload_image_to_0x0st,
 )
 from ..response import check_response
+from ..tool_cache import convert_tools_cached
 from urllib.parse import urlparse
 
 
@@ -150,10 +151,10 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
     try:
         request_messages = [Message(role="user", content=request.prompt)]
     except Exception:
-        request_messages = copy.deepcopy(request.messages)
+        # 只读遍历原始消息，输出结构直接新建，不再深拷贝整段对话（含 base64 图片）
+        request_messages = request.messages
     for msg in request_messages:
-        if msg.role == "assistant":
-            msg.role = "model"
+        role = "model" if msg.role == "assistant" else msg.role
         
         parts = []
         # 提取该消息可能携带的签名
@@ -175,7 +176,7 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
             parts.append({"text": msg.content})
 
         # 3. 处理工具调用 (Model 角色下)
-        if msg.role == "model" and msg.tool_calls:
+        if role == "model" and msg.tool_calls:
             for i, tc in enumerate(msg.tool_calls):
                 # 转换 arguments
                 try:
@@ -206,7 +207,7 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
             parts[-1]["thoughtSignature"] = msg_signature
 
         # 5. 处理函数响应 (Tool 角色下)
-        if msg.role == "tool":
+        if role == "tool":
             # Google AI Studio API 要求函数响应的角色为 "user"
             # 它将函数执行结果视为由用户/环境提供的上下文
             messages.append({
@@ -218,9 +219,9 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
                     }
                 }]
             })
-        elif msg.role != "system" and parts:
-            messages.append({"role": msg.role, "parts": parts})
-        elif msg.role == "system":
+        elif role != "system" and parts:
+            messages.append({"role": role, "parts": parts})
+        elif role == "system":
             # 系统提示词处理逻辑保持不变
             sys_text = "".join([p.get("text", "") for p in parts if "text" in p])
             sys_text = re.sub(r"_+", "_", sys_text)
@@ -371,26 +372,31 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
             if isinstance(items, dict):
                 process_tool_parameters(items)
 
-    for field, value in request.model_dump(exclude_unset=True).items():
-        if field not in miss_fields and value is not None:
+    # 跳过的字段（尤其是 messages）不参与序列化，避免把整段多模态对话再复制一遍
+    for field, value in request.model_dump(exclude_unset=True, exclude=set(miss_fields)).items():
+        if value is not None:
             if field == "tools" and ("gemini-2.0-flash-thinking" in original_model or "gemini-2.5-flash-image" in original_model or "gemini-3-pro-image" in original_model):
                 continue
             if field == "tools":
-                # 处理每个工具的 function 定义
-                processed_tools = []
-                for tool in value:
-                    # 深度克隆以避免修改原始请求对象
-                    function_def = copy.deepcopy(tool["function"])
-                    # 移除 OpenAI 特有的 strict 字段
-                    function_def.pop("strict", None)
-                    
-                    if "parameters" in function_def:
-                        process_tool_parameters(function_def["parameters"])
+                # 处理每个工具的 function 定义（相同的工具列表复用缓存的转换结果）
+                def convert_tools(tools):
+                    function_defs = []
+                    for tool in tools:
+                        # 深度克隆以避免修改原始请求对象
+                        function_def = copy.deepcopy(tool["function"])
+                        # 移除 OpenAI 特有的 strict 字段
+                        function_def.pop("strict", None)
+
+                        if "parameters" in function_def:
+                            process_tool_parameters(function_def["parameters"])
+
+                        if function_def["name"] not in ["googleSearch", "google_search"]:
+                            function_defs.append(function_def)
+                    return function_defs
 
-                    if function_def["name"] not in ["googleSearch", "google_search"]:
-                        processed_tools.append({"function": function_def})
+                function_declarations = convert_tools_cached("gemini", value, convert_tools)
 
-                if processed_tools:
+                if function_declarations:
                     tool_config = {"function_calling_config": {"mode": "AUTO"}}
                     
                     # 处理 tool_choice (OpenAI 风格 -> Gemini 风格)
@@ -412,7 +418,7 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
 
                     payload.update({
                         "tools": [{
-                            "function_declarations": [tool["function"] for tool in processed_tools]
+                            "function_declarations": function_declarations
                         }],
                         "tool_config": tool_config
                     })
@@ -453,7 +459,7 @@ async def get_gemini_payload(request, engine, provider, api_key=None):
             ]
 
     # 处理 OpenAI extra_body.google 配置，转换 snake_case 到 camelCase 后合并到 generationConfig
-    request_data = request.model_dump(exclude_unset=True)
+    request_data = request.model_dump(exclude_unset=True, include={'extra_body'})
     extra_body = request_data.get('extra_body')
     
     if isinstance(extra_body, dict):
@@ -21,6 +21,7 @@ from ..utils import (
     upload_image_to_0x0st,
 )
 from ..response import check_response
+from ..models import EmbeddingRequest
 
 
 # ============================================================
@@ -148,6 +149,16 @@ async def patch_passthrough_openai_payload(
     return payload
 
 
+def get_embedding_payload(request, provider, original_model, headers):
+    """构建 OpenAI 兼容 /v1/embeddings 请求"""
+    url = BaseAPI(provider['base_url']).embeddings
+    payload = {"model": original_model}
+    for field, value in request.model_dump(exclude_unset=True, exclude={"model", "stream"}).items():
+        if value is not None:
+            payload[field] = value
+    return url, headers, payload
+
+
 async def get_gpt_payload(request, engine, provider, api_key=None):
     """构建 OpenAI 兼容 API 的请求 payload"""
     headers = {
@@ -157,6 +168,9 @@ async def get_gpt_payload(request, engine, provider, api_key=None):
     original_model = model_dict[request.model]
     if api_key:
         headers['Authorization'] = f"Bearer {api_key}"
+
+    if isinstance(request, EmbeddingRequest):
+        return get_embedding_payload(request, provider, original_model, headers)
  
     # 这里统一根据 base_url 拼出真正的聊天端点：
     # - 如果传入的是 https://api.openai.com/v1 → 自动补 /chat/completions
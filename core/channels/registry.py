@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Any, Awaitable, Callable, AsyncIterator, Dict, List, Optional
+from typing import Any, Awaitable, Callable, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
 
@@ -67,6 +67,18 @@ class ChannelDefinition:
     # 透传模式下对 payload 做二次修饰（保持渠道特殊逻辑在渠道文件内）
     passthrough_payload_adapter: Optional[PassthroughPayloadAdapter] = None
     
+    def build_auth_header(self, api_key: str) -> Optional[Tuple[str, str]]:
+        """
+        按 auth_header 模板生成认证头 (名称, 值)
+
+        仅支持 "Header-Name: ...{api_key}..." 形式的模板；签名类认证（AWS、Vertex 等）返回 None。
+        """
+        template = self.auth_header or ""
+        name, sep, value = template.partition(":")
+        if not sep or "{api_key}" not in value or not name.strip():
+            return None
+        return name.strip(), value.strip().replace("{api_key}", api_key)
+
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典，用于 API 响应"""
         return {
@@ -29,7 +29,8 @@ from ..utils import (
     ThreadSafeCircularList,
 )
 from ..response import check_response
-from .claude_channel import gpt2claude_tools_json
+from ..tool_cache import convert_tools_cached
+from .claude_channel import convert_claude_tools_cached
 
 
 # ============================================================
@@ -252,10 +253,9 @@ async def get_vertex_gemini_payload(request, engine, provider, api_key=None):
     systemInstruction = None
     system_prompt = ""
     function_arguments = None
-    request_messages = copy.deepcopy(request.messages)
-    for msg in request_messages:
-        if msg.role == "assistant":
-            msg.role = "model"
+    # 只读遍历原始消息，输出结构直接新建，不再深拷贝整段对话（含 base64 图片）
+    for msg in request.messages:
+        role = "model" if msg.role == "assistant" else msg.role
         tool_calls = None
         if isinstance(msg.content, list):
             content = []
@@ -290,7 +290,7 @@ async def get_vertex_gemini_payload(request, engine, provider, api_key=None):
                     "parts": parts
                 }
             )
-        elif msg.role == "tool":
+        elif role == "tool":
             function_call_name = function_arguments["functionCall"]["name"]
             messages.append(
                 {
@@ -308,9 +308,9 @@ async def get_vertex_gemini_payload(request, engine, provider, api_key=None):
                     }]
                 }
             )
-        elif msg.role != "system" and content:
-            messages.append({"role": msg.role, "parts": content})
-        elif msg.role == "system":
+        elif role != "system" and content:
+            messages.append({"role": role, "parts": content})
+        elif role == "system":
             system_prompt = system_prompt + "\n\n" + content[0]["text"]
     if system_prompt.strip():
         systemInstruction = {"parts": [{"text": system_prompt}]}
@@ -421,16 +421,21 @@ async def get_vertex_gemini_payload(request, engine, provider, api_key=None):
             if isinstance(items, dict):
                 process_tool_parameters(items)
 
-    for field, value in request.model_dump(exclude_unset=True).items():
-        if field not in miss_fields and value is not None:
+    # 跳过的字段（尤其是 messages）不参与序列化，避免把整段多模态对话再复制一遍
+    for field, value in request.model_dump(exclude_unset=True, exclude=set(miss_fields)).items():
+        if value is not None:
             if field == "tools":
-                processed_tools = []
-                for tool in value:
-                    f_def = copy.deepcopy(tool["function"])
-                    f_def.pop("strict", None)
-                    if "parameters" in f_def:
-                        process_tool_parameters(f_def["parameters"])
-                    processed_tools.append(f_def)
+                def convert_tools(tools):
+                    function_defs = []
+                    for tool in tools:
+                        f_def = copy.deepcopy(tool["function"])
+                        f_def.pop("strict", None)
+                        if "parameters" in f_def:
+                            process_tool_parameters(f_def["parameters"])
+                        function_defs.append(f_def)
+                    return function_defs
+
+                processed_tools = convert_tools_cached("vertex-gemini", value, convert_tools)
 
                 payload.update({
                     "tools": [{
@@ -636,16 +641,14 @@ async def get_vertex_claude_payload(request, engine, provider, api_key=None):
         'stream_options',
     ]
 
-    for field, value in request.model_dump(exclude_unset=True).items():
-        if field not in miss_fields and value is not None:
+    # 跳过的字段（尤其是 messages）不参与序列化，避免把整段多模态对话再复制一遍
+    for field, value in request.model_dump(exclude_unset=True, exclude=set(miss_fields)).items():
+        if value is not None:
             payload[field] = value
 
     tools_mode = get_tools_mode(provider)
     if request.tools and tools_mode != "none":
-        tools = []
-        for tool in request.tools:
-            json_tool = await gpt2claude_tools_json(tool.dict()["function"])
-            tools.append(json_tool)
+        tools = convert_claude_tools_cached([tool.dict()["function"] for tool in request.tools])
         payload["tools"] = tools
         if "tool_choice" in payload:
             if isinstance(payload["tool_choice"], dict):
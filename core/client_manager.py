@@ -2,37 +2,261 @@
 HTTP 客户端管理模块
 
 负责统一管理 httpx.AsyncClient 连接池，根据 host + proxy 维度复用客户端。
+
+- 客户端数量有上限（LRU），超出上限或长时间未使用的客户端会在空闲时关闭
+- 渠道可通过 preferences.http_pool 覆盖连接池参数（全局 preferences.http_pool 作为默认值）：
+  max_connections / max_keepalive_connections / keepalive_expiry / http2 / pool_timeout
+- get_stats() 导出每个客户端的连接池状态（活跃、空闲、排队、获取连接超时次数），
+  由自行构建并包装的 transport 观测得到，不读取 httpx / httpcore 的内部字段
 """
 
+import os
+import time
+import asyncio
+from collections import OrderedDict
 from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from urllib.parse import urlparse
-from typing import Dict, Optional
+from urllib.request import getproxies
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 import httpx
+import httpcore
+
+from core.log_config import logger
+from core.utils import safe_get
+
+# 最多同时保留的客户端数量（每个 host + proxy + 连接池参数组合一个）
+CLIENT_POOL_MAX_CLIENTS = int(os.getenv("CLIENT_POOL_MAX_CLIENTS", 256))
+# 客户端超过该时间（秒）未被使用且没有进行中的请求时关闭
+CLIENT_POOL_IDLE_TIMEOUT = float(os.getenv("CLIENT_POOL_IDLE_TIMEOUT", 600))
+# 空闲 keepalive 连接的保留时间（秒），开启连接预热时自动延长到超过预热间隔
+CLIENT_POOL_KEEPALIVE_EXPIRY = float(os.getenv("CLIENT_POOL_KEEPALIVE_EXPIRY", 5.0))
+# 两次空闲检查之间的最短间隔（秒）
+_SWEEP_INTERVAL = 30.0
+
+# 允许渠道覆盖的连接池参数
+POOL_OPTION_KEYS = ("max_connections", "max_keepalive_connections", "keepalive_expiry", "http2", "pool_timeout")
+# 属于 transport（而不是 AsyncClient）的连接参数
+_TRANSPORT_OPTION_KEYS = ("verify", "cert", "http1", "http2", "trust_env")
+
+
+def get_connection_options(provider: Dict[str, Any], config: Optional[Dict[str, Any]]) -> Tuple[Optional[str], Optional[dict]]:
+    """
+    渠道的上游连接参数 (proxy, http_pool)：渠道 preferences 优先于全局 preferences
+
+    config 应为请求固定的配置快照，与本次请求读取的其它配置属于同一代。
+    """
+    proxy = safe_get(provider, "preferences", "proxy", default=safe_get(config, "preferences", "proxy", default=None))
+    pool_options = safe_get(provider, "preferences", "http_pool", default=safe_get(config, "preferences", "http_pool", default=None))
+    return proxy, pool_options
+
+
+def _build_proxy_transport(proxy: str, transport_options: Dict[str, Any]) -> httpx.AsyncBaseTransport:
+    """构建走代理的 transport：socks5 使用 httpx_socks，其余使用 httpx 自带的代理支持"""
+    if urlparse(proxy).scheme.rstrip("h") == "socks5":
+        from httpx_socks import AsyncProxyTransport
+
+        return AsyncProxyTransport.from_url(
+            proxy.replace("socks5h://", "socks5://"),
+            limits=transport_options["limits"],
+            verify=transport_options.get("verify", True),
+            http2=transport_options.get("http2", False),
+        )
+    return httpx.AsyncHTTPTransport(proxy=proxy, **transport_options)
+
+
+@dataclass
+class _ClientEntry:
+    key: str
+    host: str
+    client: httpx.AsyncClient
+    transports: List["_ObservedTransport"]
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+    def counters(self) -> Dict[str, int]:
+        return {
+            "requests": sum(t.requests for t in self.transports),
+            "in_flight": sum(t.in_flight for t in self.transports),
+            "pool_timeouts": sum(t.pool_timeouts for t in self.transports),
+        }
+
+    def pool_state(self) -> Dict[str, int]:
+        """连接池状态（由各 transport 观测到的连接汇总）"""
+        state = {"active": 0, "idle": 0, "waiting": 0}
+        for transport in self.transports:
+            for name, value in transport.pool_state().items():
+                state[name] += value
+        return state
+
+    def is_busy(self) -> bool:
+        return any(t.in_flight for t in self.transports)
+
+
+class _ObservedStream(httpx.AsyncByteStream):
+    """包装响应体，响应关闭时通知 transport"""
+
+    def __init__(self, inner: httpx.AsyncByteStream, on_close: Callable[[], None]) -> None:
+        self.inner = inner
+        self._on_close: Optional[Callable[[], None]] = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.inner:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.inner.aclose()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+
+class _ObservedTransport(httpx.AsyncBaseTransport):
+    """
+    包装底层 transport，统计请求数、进行中的请求、排队数和获取连接超时次数
+
+    - in_flight 从发出请求一直持续到响应体关闭（流式响应读完或被取消）
+    - 排队：请求尚未拿到连接（通过 httpcore 的 trace 扩展观测，首个连接事件即视为出队）
+    - 连接：按响应扩展中的 network_stream 区分；响应关闭后在 keepalive_expiry 内视为空闲连接
+      （服务端提前断开的连接无法观测，空闲数为估计值）
+    """
 
-from core.utils import get_proxy
+    def __init__(self, inner: httpx.AsyncBaseTransport, keepalive_expiry: float = CLIENT_POOL_KEEPALIVE_EXPIRY) -> None:
+        self.inner = inner
+        self.keepalive_expiry = keepalive_expiry
+        self.requests = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.pool_timeouts = 0
+        # network_stream -> 正在使用该连接的响应数（HTTP/2 下可能多于 1）
+        self._busy: Dict[Any, int] = {}
+        # network_stream -> 最后一次释放的时间
+        self._released: Dict[Any, float] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.waiting += 1
+        queued = True
+
+        def dequeue() -> None:
+            nonlocal queued
+            if queued:
+                queued = False
+                self.waiting -= 1
+
+        trace = request.extensions.get("trace")
+
+        async def observe(event_name: str, info: dict) -> None:
+            dequeue()
+            if trace is not None:
+                await trace(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": observe}
+        try:
+            response = await self.inner.handle_async_request(request)
+        except BaseException as e:
+            if isinstance(e, (httpx.PoolTimeout, httpcore.PoolTimeout)):
+                self.pool_timeouts += 1
+            self.in_flight -= 1
+            raise
+        finally:
+            dequeue()
+
+        connection = response.extensions.get("network_stream")
+        if connection is not None:
+            self._busy[connection] = self._busy.get(connection, 0) + 1
+            self._released.pop(connection, None)
+        response.stream = _ObservedStream(response.stream, lambda: self._release(connection))
+        return response
+
+    def _release(self, connection: Any) -> None:
+        self.in_flight -= 1
+        if connection is None:
+            return
+        remaining = self._busy.get(connection, 0) - 1
+        if remaining > 0:
+            self._busy[connection] = remaining
+        else:
+            self._busy.pop(connection, None)
+            self._released[connection] = time.monotonic()
+
+    def pool_state(self) -> Dict[str, int]:
+        now = time.monotonic()
+        for connection, released_at in list(self._released.items()):
+            if now - released_at >= self.keepalive_expiry:
+                del self._released[connection]
+        return {"active": len(self._busy), "idle": len(self._released), "waiting": self.waiting}
+
+    async def aclose(self) -> None:
+        self._released.clear()
+        await self.inner.aclose()
+
+
+def _environment_proxy_mounts(proxy_transport: Callable[[str], httpx.AsyncBaseTransport]) -> Dict[str, Optional[httpx.AsyncBaseTransport]]:
+    """
+    按环境变量（HTTP_PROXY / HTTPS_PROXY / ALL_PROXY / NO_PROXY）生成代理 mounts
+
+    显式传入 transport 后 httpx 不再读取环境变量代理，这里保持与 httpx 默认行为一致；
+    值为 None 的 mount 表示该地址不走代理（使用客户端默认 transport）。
+    """
+    proxies = getproxies()
+    mounts: Dict[str, Optional[httpx.AsyncBaseTransport]] = {}
+    for scheme in ("http", "https", "all"):
+        url = proxies.get(scheme)
+        if url:
+            mounts[f"{scheme}://"] = proxy_transport(url if "://" in url else f"http://{url}")
+    if not mounts:
+        return {}
+    for host in (proxies.get("no") or "").split(","):
+        host = host.strip()
+        if host == "*":
+            return {}
+        if host:
+            mounts[host if "://" in host else f"all://*{host}"] = None
+    return mounts
 
 
 class ClientManager:
     """
     HTTP 客户端管理器
 
-    - 按 host + proxy 维度复用 httpx.AsyncClient
+    - 按 host + proxy（+ 连接池参数）维度复用 httpx.AsyncClient
     - 通过 init() 注入默认配置（headers/http2/verify/follow_redirects 等）
+    - LRU 上限 + 空闲关闭，避免大量按渠道配置的代理导致 socket / 内存泄漏
     """
 
-    def __init__(self, pool_size: int = 300, max_keepalive_connections: int = 100) -> None:
+    def __init__(
+        self,
+        pool_size: int = 300,
+        max_keepalive_connections: int = 100,
+        max_clients: int = CLIENT_POOL_MAX_CLIENTS,
+        idle_timeout: float = CLIENT_POOL_IDLE_TIMEOUT,
+    ) -> None:
         """
         初始化客户端管理器
-        
+
         Args:
             pool_size: 最大并发连接数（增加到300支持更多长时间请求）
             max_keepalive_connections: keepalive 连接数
+            max_clients: 最多保留的客户端数量
+            idle_timeout: 客户端空闲多久（秒）后关闭，<=0 表示不按空闲时间关闭
         """
         self.pool_size = pool_size
         self.max_keepalive_connections = max_keepalive_connections
-        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.max_clients = max(1, int(max_clients))
+        self.idle_timeout = idle_timeout
+        # 未被渠道 http_pool.keepalive_expiry 覆盖时的空闲连接保留时间（开启连接预热时会被调大）
+        self.keepalive_expiry = CLIENT_POOL_KEEPALIVE_EXPIRY
+        self.clients: "OrderedDict[str, _ClientEntry]" = OrderedDict()
         self.default_config: dict = {}
+        # 被淘汰但仍有进行中请求的客户端，空闲后再关闭
+        self._retiring: List[_ClientEntry] = []
+        self._last_sweep = time.monotonic()
+        self.evicted_total = 0
 
     async def init(self, default_config: dict) -> None:
         """
@@ -40,11 +264,80 @@ class ClientManager:
         """
         self.default_config = default_config
 
+    def _build_client(
+        self, proxy: Optional[str], overrides: Optional[dict], pool_options: Dict[str, Any],
+    ) -> Tuple[httpx.AsyncClient, List[_ObservedTransport]]:
+        timeout = httpx.Timeout(
+            connect=15.0,
+            read=None,  # 保持None，由各渠道自行控制超时
+            write=300.0,  # 写入超时增加到300秒（5分钟），支持大型请求体（多图片/PDF）
+            pool=float(pool_options.get("pool_timeout", 10.0)),  # 获取连接的超时（防止永久阻塞）
+        )
+        limits = httpx.Limits(
+            max_connections=int(pool_options.get("max_connections", self.pool_size)),
+            max_keepalive_connections=int(pool_options.get("max_keepalive_connections", self.max_keepalive_connections)),
+            keepalive_expiry=float(pool_options.get("keepalive_expiry", self.keepalive_expiry)),
+        )
+
+        client_config = {
+            **self.default_config,
+            "timeout": timeout,
+            **(overrides or {}),
+        }
+        if "http2" in pool_options:
+            client_config["http2"] = bool(pool_options["http2"])
+
+        # transport 自行构建并包装后通过 transport= / mounts= 传入，连接参数只作用于 transport
+        transport_options = {name: client_config.pop(name) for name in _TRANSPORT_OPTION_KEYS if name in client_config}
+        transport_options["limits"] = limits
+
+        def observed(transport: httpx.AsyncBaseTransport) -> _ObservedTransport:
+            wrapped = _ObservedTransport(transport, keepalive_expiry=limits.keepalive_expiry)
+            transports.append(wrapped)
+            return wrapped
+
+        transports: List[_ObservedTransport] = []
+        if proxy:
+            client_config["transport"] = observed(_build_proxy_transport(proxy, transport_options))
+        else:
+            client_config["transport"] = observed(httpx.AsyncHTTPTransport(**transport_options))
+            if transport_options.get("trust_env", True):
+                client_config["mounts"] = _environment_proxy_mounts(
+                    lambda url: observed(_build_proxy_transport(url, transport_options))
+                )
+        return httpx.AsyncClient(**client_config), transports
+
     @asynccontextmanager
-    async def get_client(self, base_url: str, proxy: Optional[str] = None):
+    async def get_client(
+        self,
+        base_url: str,
+        proxy: Optional[str] = None,
+        overrides: Optional[dict] = None,
+        pool_options: Optional[dict] = None,
+    ):
         """
         获取或创建指定 base_url + proxy 对应的 AsyncClient
+
+        Args:
+            base_url: 请求地址（按 host 维度复用）
+            proxy: 代理地址
+            overrides: 覆盖默认 client 配置（如 {"verify": False}），不同覆盖项使用独立的客户端
+            pool_options: 连接池参数覆盖（见 POOL_OPTION_KEYS），不同参数使用独立的客户端
         """
+        entry = self._get_entry(base_url, proxy, overrides, pool_options)
+        try:
+            yield entry.client
+        finally:
+            # 不在这里关闭客户端，由 LRU / 空闲回收与 close() 统一管理连接池生命周期
+            entry.last_used = time.monotonic()
+
+    def _get_entry(
+        self,
+        base_url: str,
+        proxy: Optional[str],
+        overrides: Optional[dict],
+        pool_options: Optional[dict],
+    ) -> _ClientEntry:
         parsed_url = urlparse(base_url)
         host = parsed_url.netloc
 
@@ -53,71 +346,200 @@ class ClientManager:
             # 规范化 socks5 代理前缀，保持与原实现一致
             proxy_normalized = proxy.replace("socks5h://", "socks5://")
             client_key += f"_{proxy_normalized}"
+        if overrides:
+            client_key += "_" + ",".join(f"{k}={overrides[k]}" for k in sorted(overrides))
+        pool_options = {k: pool_options[k] for k in POOL_OPTION_KEYS if isinstance(pool_options, dict) and pool_options.get(k) is not None}
+        if pool_options:
+            client_key += "_pool:" + ",".join(f"{k}={pool_options[k]}" for k in sorted(pool_options))
 
-        if client_key not in self.clients:
-            timeout = httpx.Timeout(
-                connect=15.0,
-                read=None,  # 保持None，由各渠道自行控制超时
-                write=300.0,  # 写入超时增加到300秒（5分钟），支持大型请求体（多图片/PDF）
-                pool=10.0,  # 获取连接的超时（防止永久阻塞）
-            )
-            limits = httpx.Limits(
-                max_connections=self.pool_size,  # 增加到300
-                max_keepalive_connections=self.max_keepalive_connections
-            )
-
-            client_config = {
-                **self.default_config,
-                "timeout": timeout,
-                "limits": limits,
-            }
+        entry = self.clients.get(client_key)
+        if entry is None:
+            client, transports = self._build_client(proxy, overrides, pool_options)
+            entry = _ClientEntry(key=client_key, host=host, client=client, transports=transports)
+            self.clients[client_key] = entry
+            self._enforce_limit()
+        else:
+            self.clients.move_to_end(client_key)
+        entry.last_used = time.monotonic()
+        self._maybe_sweep()
+        return entry
 
-            client_config = get_proxy(proxy, client_config)
+    async def prewarm(
+        self,
+        base_url: str,
+        proxy: Optional[str] = None,
+        pool_options: Optional[dict] = None,
+        connections: int = 1,
+        timeout: float = 10.0,
+    ) -> int:
+        """
+        预先建立到 base_url 所在 host 的连接（DNS + TCP + TLS），放入连接池备用
+
+        向 host 根路径发送 HEAD 请求，只补足到 connections 个空闲连接；响应状态码不重要。
+
+        Returns:
+            本次新建立的连接数
+        """
+        entry = self._get_entry(base_url, proxy, None, pool_options)
+        missing = connections - entry.pool_state()["idle"]
+        if missing <= 0:
+            return 0
 
-            self.clients[client_key] = httpx.AsyncClient(**client_config)
+        parsed_url = urlparse(base_url)
+        origin = f"{parsed_url.scheme}://{parsed_url.netloc}/"
+        results = await asyncio.gather(
+            *(entry.client.head(origin, timeout=timeout, follow_redirects=False) for _ in range(missing)),
+            return_exceptions=True,
+        )
+        entry.last_used = time.monotonic()
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.debug(f"Connection prewarm to {parsed_url.netloc} failed: {result}")
+        return sum(1 for result in results if not isinstance(result, BaseException))
+
+    def _enforce_limit(self) -> None:
+        """超过上限时淘汰最久未使用的客户端；仍有进行中请求的客户端延后关闭"""
+        while len(self.clients) > self.max_clients:
+            _, entry = self.clients.popitem(last=False)
+            self.evicted_total += 1
+            self._retire(entry)
+
+    def _retire(self, entry: _ClientEntry) -> None:
+        if entry.is_busy():
+            self._retiring.append(entry)
+        else:
+            self._schedule_close([entry])
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep < _SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        self.evict_idle(now)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        关闭空闲超时且没有进行中请求的客户端，以及已淘汰且已空闲的客户端
+
+        Returns:
+            本次关闭的客户端数量
+        """
+        now = time.monotonic() if now is None else now
+        to_close: List[_ClientEntry] = []
+
+        still_retiring = []
+        for entry in self._retiring:
+            (still_retiring if entry.is_busy() else to_close).append(entry)
+        self._retiring = still_retiring
+
+        if self.idle_timeout > 0:
+            # OrderedDict 按最近使用排序，从最旧的开始检查
+            for key, entry in list(self.clients.items()):
+                if now - entry.last_used < self.idle_timeout:
+                    break
+                if entry.is_busy():
+                    continue
+                del self.clients[key]
+                self.evicted_total += 1
+                to_close.append(entry)
+
+        self._schedule_close(to_close)
+        return len(to_close)
+
+    def _schedule_close(self, entries: List[_ClientEntry]) -> None:
+        if not entries:
+            return
+
+        async def _close():
+            for entry in entries:
+                try:
+                    await entry.client.aclose()
+                except Exception as e:
+                    logger.warning(f"Failed to close HTTP client for {entry.host}: {e}")
 
         try:
-            yield self.clients[client_key]
-        finally:
-            # 不在这里关闭客户端，由 close() 统一管理连接池生命周期
+            asyncio.get_running_loop().create_task(_close())
+        except RuntimeError:
             pass
 
+    def get_stats(self) -> Dict[str, Any]:
+        """导出连接池统计信息"""
+        clients = []
+        totals = {"active": 0, "idle": 0, "waiting": 0, "in_flight": 0, "requests": 0, "pool_timeouts": 0}
+        now = time.monotonic()
+        for entry in list(self.clients.values()):
+            item = {
+                "key": entry.key,
+                "host": entry.host,
+                "idle_seconds": round(now - entry.last_used, 1),
+                **entry.pool_state(),
+                **entry.counters(),
+            }
+            for name in totals:
+                totals[name] += item[name]
+            clients.append(item)
+        return {
+            "clients": clients,
+            "total_clients": len(clients),
+            "retiring_clients": len(self._retiring),
+            "max_clients": self.max_clients,
+            "evicted_total": self.evicted_total,
+            **totals,
+        }
+
     async def close(self) -> None:
         """
         关闭所有已创建的 AsyncClient，并清空连接池
         """
-        for client in self.clients.values():
-            await client.aclose()
+        entries = list(self.clients.values()) + self._retiring
         self.clients.clear()
+        self._retiring = []
+        for entry in entries:
+            await entry.client.aclose()
 
     async def reset_client(self, host: str) -> bool:
         """
         重置指定 host 的客户端连接
-        
+
         用于解决 HTTP/2 连接老化导致的 StreamReset 错误
-        
+
         Args:
             host: 要重置的 host
-            
+
         Returns:
             是否找到并重置了客户端
         """
         keys_to_remove = [k for k in self.clients.keys() if host in k]
         if not keys_to_remove:
             return False
-        
+
         for key in keys_to_remove:
-            client = self.clients.pop(key)
-            await client.aclose()
+            entry = self.clients.pop(key)
+            await entry.client.aclose()
         return True
 
     async def reset_all_clients(self) -> int:
         """
         重置所有客户端连接（不需要重启服务）
-        
+
         Returns:
             重置的客户端数量
         """
         count = len(self.clients)
         await self.close()
-        return count
\ No newline at end of file
+        return count
+
+
+# 全局默认客户端管理器（由 main.lifespan 注册），供无法直接访问 app.state 的模块复用连接池
+_default_client_manager: Optional[ClientManager] = None
+
+
+def set_default_client_manager(manager: Optional[ClientManager]) -> None:
+    """注册全局默认客户端管理器"""
+    global _default_client_manager
+    _default_client_manager = manager
+
+
+def get_default_client_manager() -> Optional[ClientManager]:
+    """获取全局默认客户端管理器（未注册时返回 None）"""
+    return _default_client_manager
@@ -0,0 +1,108 @@
+"""
+配置快照（read-copy-update）
+
+每次配置更新都会构建一整代新配置（config / api_keys_db / api_list），
+通过一次引用替换发布到 app.state.config_snapshot；请求开始时固定当前快照，
+整个请求期间只读取这一代配置，不受并发的管理端修改影响。
+
+约定：
+- 已发布快照中的配置视为只读；修改配置时先 copy_config_for_update 复制，
+  再经 update_config 构建新一代，最后由 publish_config 发布
+- provider_views 缓存本代配置下按 (模型规则, 请求模型) 生成的 provider 视图，
+  随快照一起替换，请求热路径无需再逐个复制 provider 字典
+"""
+
+import copy
+import itertools
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from core.utils import ApiKeySettings, ApiKeyList
+
+if TYPE_CHECKING:
+    from fastapi import FastAPI
+
+# 单个快照内 provider 视图缓存的上限（请求模型名带通配符时组合数可能较多）
+MAX_PROVIDER_VIEWS = 4096
+
+_generations = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """一代只读配置"""
+    config: Dict[str, Any]
+    api_keys_db: List[Dict[str, Any]]
+    api_list: Any
+    generation: int
+    provider_views: Dict[Tuple[str, str], List[Dict[str, Any]]] = field(default_factory=dict, compare=False, repr=False)
+
+
+def publish_config(app: "FastAPI", config: Dict[str, Any], api_keys_db: List[Dict[str, Any]], api_list: Any) -> ConfigSnapshot:
+    """
+    发布新一代配置
+
+    中间没有 await，对事件循环中的其它请求而言 config_snapshot 与
+    兼容字段（config / api_keys_db / api_list）是同时切换的。
+    """
+    snapshot = ConfigSnapshot(config, api_keys_db, api_list, next(_generations))
+    app.state.config_snapshot = snapshot
+    app.state.config, app.state.api_keys_db, app.state.api_list = config, api_keys_db, api_list
+    return snapshot
+
+
+def get_config_snapshot(app: "FastAPI") -> ConfigSnapshot:
+    """
+    获取当前配置快照
+
+    兼容直接给 app.state.config / api_list 赋值的旧代码：兼容字段与快照不一致时，按兼容字段重新发布。
+    """
+    state = app.state
+    snapshot = getattr(state, "config_snapshot", None)
+    config = getattr(state, "config", None)
+    api_list = getattr(state, "api_list", None)
+    if snapshot is not None and snapshot.config is config and snapshot.api_list is api_list:
+        return snapshot
+    return publish_config(app, config, getattr(state, "api_keys_db", None), api_list)
+
+
+def get_api_key_settings(app: "FastAPI", config: Dict[str, Any], api_index: Optional[int]) -> Optional[ApiKeySettings]:
+    """
+    获取 api_index 对应的预编译 API Key 配置
+
+    config 属于当前快照时直接取 api_list 中预编译的结果；config 已不是当前一代
+    （请求期间发生了配置更新）时，按该 config 现场构建，保证与调用方读取的是同一代配置。
+    """
+    if api_index is None:
+        return None
+    snapshot = get_config_snapshot(app)
+    if snapshot.config is config and hasattr(snapshot.api_list, "get_settings"):
+        return snapshot.api_list.get_settings(api_index)
+    api_keys = (config or {}).get("api_keys") or []
+    if not 0 <= api_index < len(api_keys) or not isinstance(api_keys[api_index], dict):
+        return None
+    return ApiKeySettings.from_config(api_index, api_keys[api_index])
+
+
+def get_api_list(app: "FastAPI", config: Dict[str, Any]) -> Any:
+    """
+    获取与 config 同一代的 api_list
+
+    config 属于当前快照时直接返回快照中的 api_list；否则按该 config 重建，避免混用两代配置。
+    """
+    snapshot = get_config_snapshot(app)
+    if snapshot.config is config:
+        return snapshot.api_list
+    return ApiKeyList((config or {}).get("api_keys") or [])
+
+
+def copy_config_for_update(config: Dict[str, Any]) -> Dict[str, Any]:
+    """复制当前配置用于修改，避免原地改动正在被请求读取的快照"""
+    return copy.deepcopy(config) if config else {}
+
+
+def remember_provider_views(snapshot: ConfigSnapshot, key: Tuple[str, str], views: List[Dict[str, Any]]) -> None:
+    """缓存本代配置下的 provider 视图（超过上限时整体清空）"""
+    if len(snapshot.provider_views) >= MAX_PROVIDER_VIEWS:
+        snapshot.provider_views.clear()
+    snapshot.provider_views[key] = views
@@ -386,12 +386,8 @@ def parse_gemini_usage(data: Any) -> Optional[Dict[str, int]]:
 # ============== 自定义端点处理函数 ==============
 
 
-async def _get_gemini_models(api_index: int, app):
-    """获取格式化后的 Gemini 模型列表"""
-    from utils import post_all_models
-
-    models = post_all_models(api_index, app.state.config, app.state.api_list, app.state.models_list)
-    
+def _render_gemini_models(models) -> list:
+    """将 OpenAI 风格的模型列表转换为 Gemini 格式"""
     gemini_models = []
     for m in models:
         if not isinstance(m, dict) or not m.get("id"):
@@ -413,6 +409,13 @@ async def _get_gemini_models(api_index: int, app):
     return gemini_models
 
 
+async def _get_gemini_models(api_index: int, app):
+    """获取格式化后的 Gemini 模型列表"""
+    from utils import get_cached_models
+
+    return _render_gemini_models(get_cached_models(app, api_index))
+
+
 async def list_gemini_models_handler(
     request: "Request",
     api_index: int,
@@ -420,10 +423,16 @@ async def list_gemini_models_handler(
 ):
     """
     Gemini 模型列表端点 - GET /v1/models & /v1beta/models
+
+    响应体按 API Key 预先序列化并缓存，支持 If-None-Match / 304。
     """
-    from fastapi.responses import JSONResponse
-    gemini_models = await _get_gemini_models(api_index, request.app)
-    return JSONResponse(content={"models": gemini_models})
+    from utils import get_cached_models_response, cached_models_response
+
+    body, etag = get_cached_models_response(
+        request.app, api_index, "gemini",
+        lambda models: {"models": _render_gemini_models(models)},
+    )
+    return cached_models_response(request.headers.get("if-none-match"), body, etag)
 
 
 async def get_gemini_model_handler(
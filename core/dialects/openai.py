@@ -73,9 +73,13 @@ async def chat_completions_handler(
     OpenAI 是 Canonical 格式，直接解析为 RequestModel 并调用 handler
     """
     from routes.deps import get_model_handler
+    from core.middleware import get_request_json, get_validated_request
 
-    native_body: Dict[str, Any] = await request.json()
-    request_model = await parse_openai_request(native_body, {}, {})
+    # 复用 StatsMiddleware 已校验的 RequestModel，避免对大请求体重复解析和校验
+    request_model = get_validated_request(request, "chat")
+    if request_model is None:
+        native_body: Dict[str, Any] = await get_request_json(request)
+        request_model = await parse_openai_request(native_body, {}, {})
 
     model_handler = get_model_handler()
     return await model_handler.request_model(request_model, api_index, background_tasks)
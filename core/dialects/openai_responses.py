@@ -397,8 +397,9 @@ async def responses_handler(
     将 Responses API 请求转换为 Chat Completions 格式，调用内部处理器
     """
     from routes.deps import get_model_handler
+    from core.middleware import get_request_json
 
-    native_body: Dict[str, Any] = await request.json()
+    native_body: Dict[str, Any] = await get_request_json(request)
 
     # 转换为 RequestModel
     request_model = await parse_responses_request(native_body, {}, {})
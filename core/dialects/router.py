@@ -103,14 +103,14 @@ def _create_dialect_verify_api_key(dialect_id: str):
         # 更新 request_info 中的 API key 信息，确保统计记录正确的 key
         try:
             from core.middleware import request_info
-            from utils import safe_get
+            from core.config_snapshot import get_api_key_settings
 
             info = request_info.get()
             if info:
                 info["api_key"] = token_for_stats
-                config = app.state.config
-                info["api_key_name"] = safe_get(config, "api_keys", api_index, "name", default=None)
-                info["api_key_group"] = safe_get(config, "api_keys", api_index, "group", default=None)
+                key_settings = get_api_key_settings(app, app.state.config, api_index)
+                info["api_key_name"] = key_settings.name if key_settings is not None else None
+                info["api_key_group"] = key_settings.group if key_settings is not None else None
         except Exception:
             pass
 
@@ -130,13 +130,14 @@ def _create_generic_handler(dialect_id: str, endpoint: EndpointDefinition):
     ):
         from routes.deps import get_model_handler
         from core.streaming import LoggingStreamingResponse
+        from core.middleware import get_request_json
 
         dialect = get_dialect(dialect_id)
         if not dialect or not dialect.parse_request:
             return openai_error_response(f"{dialect_id} dialect not registered", 500)
 
         try:
-            native_body: Dict[str, Any] = await request.json()
+            native_body: Dict[str, Any] = await get_request_json(request)
         except Exception:
             native_body = {}
 
@@ -0,0 +1,197 @@
+"""
+Embedding 请求微批处理
+
+RAG 索引等场景会并发发送大量只有一两条输入的 embedding 请求，每个请求都要占用一次上游
+往返和一次上游 key 的限流额度。开启后（EMBEDDING_BATCH_WINDOW_MS > 0），同一渠道、同一
+模型且参数相同的并发请求会在时间窗口内合并为一次上游调用（合并后的输入条数不超过
+EMBEDDING_BATCH_MAX_INPUTS），结果按原顺序拆回各请求，usage 按各请求的输入量分摊。
+
+批次由第一个加入的请求提供发送函数，上游 key 只选择一次；上游出错时批次内所有请求收到
+同一个异常，由各自的重试逻辑处理。
+
+环境变量：
+- EMBEDDING_BATCH_WINDOW_MS：合并窗口（毫秒），默认 0（关闭）
+- EMBEDDING_BATCH_MAX_INPUTS：单次上游调用的最大输入条数，默认 256
+"""
+
+import os
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.log_config import logger
+
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", 0))
+EMBEDDING_BATCH_MAX_INPUTS = int(os.getenv("EMBEDDING_BATCH_MAX_INPUTS", 256))
+
+# 支持合并的引擎（上游为 OpenAI 兼容的 /v1/embeddings，输入可以是数组）
+BATCHABLE_ENGINES = frozenset({"openai"})
+
+# 发送函数：接收合并后的输入列表，返回 (上游响应, 附加信息)
+SendFunc = Callable[[list], Awaitable[Tuple[Dict[str, Any], Any]]]
+
+
+def normalize_embedding_input(value) -> Optional[Tuple[str, list, int]]:
+    """
+    把 input 规范化为输入列表
+
+    Returns:
+        (输入类型, 输入列表, 权重)；输入类型为 "text" 或 "tokens"，两种类型不能混在一次上游调用中。
+        权重用于分摊 usage：token 数组按 token 数，文本按字符数近似。无法合并的输入返回 None。
+    """
+    if isinstance(value, str):
+        return "text", [value], max(len(value), 1)
+    if not isinstance(value, list) or not value:
+        return None
+    if all(isinstance(item, str) for item in value):
+        return "text", list(value), sum(max(len(item), 1) for item in value)
+    if all(isinstance(item, int) for item in value):
+        return "tokens", [value], len(value)
+    if all(isinstance(item, list) for item in value):
+        return "tokens", list(value), sum(max(len(item), 1) for item in value)
+    return None
+
+
+def plan_embedding_batch(request, provider_name: str, engine: str, original_model: str) -> Optional[Tuple[tuple, list, int]]:
+    """
+    判断请求能否合并
+
+    Returns:
+        (批次 key, 输入列表, 权重)；不能合并时返回 None
+    """
+    if engine not in BATCHABLE_ENGINES or provider_name.startswith("sk-"):
+        return None
+    normalized = normalize_embedding_input(request.input)
+    if normalized is None:
+        return None
+    kind, inputs, weight = normalized
+    batch_key = (provider_name, original_model, kind, request.encoding_format, request.dimensions, request.user)
+    return batch_key, inputs, weight
+
+
+def _apportion(total: int, weights: List[int]) -> List[int]:
+    """按权重把整数 total 分摊到各成员（最大余数法，合计与 total 一致）"""
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        weights, weight_sum = [1] * len(weights), len(weights)
+    exact = [total * weight / weight_sum for weight in weights]
+    shares = [int(value) for value in exact]
+    remainder = total - sum(shares)
+    for index in sorted(range(len(exact)), key=lambda i: exact[i] - shares[i], reverse=True)[:remainder]:
+        shares[index] += 1
+    return shares
+
+
+def split_embedding_result(result: Dict[str, Any], members: List[Tuple[int, int, int]]) -> List[Dict[str, Any]]:
+    """
+    把合并调用的响应拆回各成员
+
+    Args:
+        result: 上游 OpenAI 格式响应
+        members: 各成员的 (输入起始位置, 输入条数, 权重)
+    """
+    data = sorted(result.get("data") or [], key=lambda item: item.get("index", 0))
+    expected = sum(count for _, count, _ in members)
+    if len(data) != expected:
+        raise ValueError(f"Upstream returned {len(data)} embeddings for {expected} batched inputs")
+    if len(members) == 1:
+        return [result]
+
+    usage = result.get("usage")
+    weights = [weight for _, _, weight in members]
+    shares = {}
+    if isinstance(usage, dict):
+        shares = {name: _apportion(value, weights) for name, value in usage.items() if isinstance(value, int)}
+
+    outputs = []
+    for position, (offset, count, _) in enumerate(members):
+        output = dict(result)
+        output["data"] = [{**item, "index": index} for index, item in enumerate(data[offset:offset + count])]
+        if isinstance(usage, dict):
+            output["usage"] = {**usage, **{name: values[position] for name, values in shares.items()}}
+        outputs.append(output)
+    return outputs
+
+
+@dataclass
+class _Batch:
+    send: SendFunc
+    future: asyncio.Future
+    inputs: list = field(default_factory=list)
+    # (输入起始位置, 输入条数, 权重)
+    members: List[Tuple[int, int, int]] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    # 所有成员都已取消时避免 "exception was never retrieved" 警告
+    if not future.cancelled():
+        future.exception()
+
+
+class EmbeddingBatcher:
+    """按批次 key 合并并发 embedding 请求"""
+
+    def __init__(self, window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS):
+        self.window = max(window_ms, 0) / 1000
+        self.max_inputs = max_inputs
+        self._open: Dict[tuple, _Batch] = {}
+        self._tasks: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_inputs > 1
+
+    async def submit(self, batch_key: tuple, inputs: list, weight: int, send: SendFunc) -> Tuple[Dict[str, Any], Any]:
+        """
+        加入批次并等待结果
+
+        Returns:
+            (本请求对应的响应, 发送函数返回的附加信息)
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._open.get(batch_key)
+        if batch is not None and len(batch.inputs) + len(inputs) > self.max_inputs:
+            self._flush(batch_key, batch)
+            batch = None
+        if batch is None:
+            batch = _Batch(send=send, future=loop.create_future())
+            batch.future.add_done_callback(_consume_exception)
+            batch.timer = loop.call_later(self.window, self._flush, batch_key, batch)
+            self._open[batch_key] = batch
+
+        position = len(batch.members)
+        batch.members.append((len(batch.inputs), len(inputs), weight))
+        batch.inputs.extend(inputs)
+        if len(batch.inputs) >= self.max_inputs:
+            self._flush(batch_key, batch)
+
+        # shield：单个请求被取消不影响同批次的其它请求
+        results, meta = await asyncio.shield(batch.future)
+        return results[position], meta
+
+    def _flush(self, batch_key: tuple, batch: _Batch) -> None:
+        if self._open.get(batch_key) is not batch:
+            return
+        del self._open[batch_key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        if len(batch.members) > 1:
+            logger.debug(f"Sending {len(batch.members)} embedding requests ({len(batch.inputs)} inputs) as one upstream call")
+        try:
+            result, meta = await batch.send(batch.inputs)
+            batch.future.set_result((split_embedding_result(result, batch.members), meta))
+        except asyncio.CancelledError:
+            batch.future.cancel()
+            raise
+        except Exception as e:
+            batch.future.set_exception(e)
+
+
+embedding_batcher = EmbeddingBatcher()
@@ -8,6 +8,7 @@
 import json
 import asyncio
 from collections import defaultdict
+from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
 from time import time
 from urllib.parse import urlparse
@@ -20,9 +21,12 @@ from starlette.responses import Response
 
 from core.log_config import logger
 from core.streaming import LoggingStreamingResponse
-from core.request import get_payload
+from core.request import get_payload, PayloadCache
 from core.response import fetch_response, fetch_response_stream, check_response
-from core.stats import update_stats
+from core.stats import update_stats, is_paid_key_enabled, record_local_key_usage
+from db import DISABLE_DATABASE
+from core.raw_capture import defer_capture
+from core.embedding_batcher import embedding_batcher, plan_embedding_batch
 from core.models import (
     RequestModel,
     ImageGenerationRequest,
@@ -32,6 +36,9 @@ from core.models import (
 )
 from core.utils import get_engine, provider_api_circular_list, truncate_for_logging
 from core.routing import get_right_order_providers
+from core.config_snapshot import get_config_snapshot, get_api_key_settings
+from core.client_manager import get_connection_options
+from core.moderation import get_moderated_content, moderation_verdict_cache, read_moderation_flagged
 from core.error_response import openai_error_response
 from utils import safe_get, error_handling_wrapper
 
@@ -44,6 +51,9 @@ DEFAULT_TIMEOUT = 600
 # 调试模式标志
 is_debug = False
 
+# 当前调用链上已经进入的 API Key 索引（本地聚合器 Key 嵌套调度时用于检测循环引用）
+_local_dispatch_chain: ContextVar[tuple] = ContextVar("local_dispatch_chain", default=())
+
 
 def set_debug_mode(debug: bool):
     """设置调试模式"""
@@ -51,6 +61,11 @@ def set_debug_mode(debug: bool):
     is_debug = debug
 
 
+def _is_moderation_cancel(error: BaseException, current_info: Dict[str, Any]) -> bool:
+    """请求是否因审查不通过被主动取消（上游渠道本身没有出错，不计入渠道失败）"""
+    return isinstance(error, asyncio.CancelledError) and bool(current_info.get("moderation_cancelled"))
+
+
 def _fire_and_forget_channel_stats(update_channel_stats_func: Callable, *args, **kwargs) -> None:
     """异步写入 ChannelStat，不依赖 FastAPI BackgroundTasks。
 
@@ -103,6 +118,94 @@ def get_preference_value(provider_timeouts: Dict[str, Any], original_model: str)
     return timeout_value
 
 
+class PreferenceTable(defaultdict):
+    """
+    渠道/模型偏好配置表（如 model_timeout、keepalive_interval）
+
+    结构：{channel_id: {model: value}, "global": {model: value, "default": value}}
+    额外携带 get_preference 的解析结果缓存。配置更新时整表重建（见 refresh_preference_tables），
+    缓存随旧表一起失效。
+    """
+
+    # 防止异常请求模型名导致缓存无限增长
+    MAX_RESOLVED = 65536
+
+    def __init__(self, default_value):
+        super().__init__(lambda: defaultdict(lambda: default_value))
+        self.default_value = default_value
+        self.resolved: Dict[tuple, Any] = {}
+
+
+def init_preference(all_config, preference_key, default_timeout=DEFAULT_TIMEOUT) -> PreferenceTable:
+    """
+    从配置构建偏好配置表
+
+    Args:
+        all_config: 完整配置
+        preference_key: 偏好名（model_timeout / keepalive_interval）
+        default_timeout: 全局默认值
+
+    Returns:
+        PreferenceTable
+    """
+    # 存储超时配置
+    preference_dict = {}
+    preferences = safe_get(all_config, "preferences", default={})
+    providers = safe_get(all_config, "providers", default=[])
+    if preferences:
+        if isinstance(preferences.get(preference_key), int):
+            preference_dict["default"] = preferences.get(preference_key)
+        else:
+            for model_name, timeout_value in preferences.get(preference_key, {"default": default_timeout}).items():
+                preference_dict[model_name] = timeout_value
+            if "default" not in preferences.get(preference_key, {}):
+                preference_dict["default"] = default_timeout
+
+    result = PreferenceTable(default_timeout)
+    for provider in providers:
+        provider_preference_settings = safe_get(provider, "preferences", preference_key, default={})
+        if provider_preference_settings:
+            for model_name, timeout_value in provider_preference_settings.items():
+                result[provider['provider']][model_name] = timeout_value
+
+    result["global"] = preference_dict
+
+    return result
+
+
+def refresh_preference_tables(app: "FastAPI") -> None:
+    """
+    配置更新后重建超时/keepalive 偏好表（同时使解析缓存失效），
+    并移除已删除或限流配置发生变化的 API Key 限流器（其余 key 的限流窗口保持不变）
+    """
+    old_timeouts = getattr(app.state, "provider_timeouts", None)
+    default_timeout = getattr(old_timeouts, "default_value", DEFAULT_TIMEOUT)
+    app.state.provider_timeouts = init_preference(app.state.config, "model_timeout", default_timeout)
+    app.state.keepalive_interval = init_preference(app.state.config, "keepalive_interval", 99999)
+
+    rate_limit_registry = getattr(app.state, "user_api_keys_rate_limit", None)
+    if hasattr(rate_limit_registry, "prune"):
+        rate_limit_registry.prune()
+
+
+def _resolve_preference(
+    preference_config: Dict[str, Any],
+    channel_id: str,
+    original_model: str,
+    request_model_name: str,
+    default_value: int
+) -> int:
+    provider_timeouts = safe_get(preference_config, channel_id, default=preference_config["global"])
+    timeout_value = get_preference_value(provider_timeouts, request_model_name)
+    if timeout_value is None:
+        timeout_value = get_preference_value(provider_timeouts, original_model)
+    if timeout_value is None:
+        timeout_value = get_preference_value(preference_config["global"], original_model)
+    if timeout_value is None:
+        timeout_value = preference_config["global"].get("default", default_value)
+    return timeout_value
+
+
 def get_preference(
     preference_config: Dict[str, Any],
     channel_id: str,
@@ -112,7 +215,8 @@ def get_preference(
     """
     获取偏好配置值（如超时时间、keepalive 间隔）
     
-    按照 channel_id -> request_model_name -> original_model -> global default 的顺序查找
+    按照 channel_id -> request_model_name -> original_model -> global default 的顺序查找。
+    preference_config 为 PreferenceTable 时，解析结果按 (渠道, 模型, 默认值) 记忆化，稳态为 O(1)。
     
     Args:
         preference_config: 偏好配置字典
@@ -124,14 +228,19 @@ def get_preference(
         偏好配置值
     """
     original_model, request_model_name = original_request_model
-    provider_timeouts = safe_get(preference_config, channel_id, default=preference_config["global"])
-    timeout_value = get_preference_value(provider_timeouts, request_model_name)
-    if timeout_value is None:
-        timeout_value = get_preference_value(provider_timeouts, original_model)
-    if timeout_value is None:
-        timeout_value = get_preference_value(preference_config["global"], original_model)
-    if timeout_value is None:
-        timeout_value = preference_config["global"].get("default", default_value)
+    resolved = getattr(preference_config, "resolved", None)
+    if resolved is None:
+        return _resolve_preference(preference_config, channel_id, original_model, request_model_name, default_value)
+
+    cache_key = (channel_id, original_model, request_model_name, default_value)
+    try:
+        return resolved[cache_key]
+    except KeyError:
+        pass
+    timeout_value = _resolve_preference(preference_config, channel_id, original_model, request_model_name, default_value)
+    if len(resolved) >= PreferenceTable.MAX_RESOLVED:
+        resolved.clear()
+    resolved[cache_key] = timeout_value
     return timeout_value
 
 
@@ -145,7 +254,9 @@ async def process_request(
     endpoint: Optional[str] = None,
     role: Optional[str] = None,
     timeout_value: int = DEFAULT_TIMEOUT,
-    keepalive_interval: Optional[int] = None
+    keepalive_interval: Optional[int] = None,
+    payload_cache: Optional[PayloadCache] = None,
+    config: Optional[Dict[str, Any]] = None,
 ) -> Response:
     """
     向单个 provider 发送请求并处理响应
@@ -161,6 +272,8 @@ async def process_request(
         role: 用户角色
         timeout_value: 超时时间
         keepalive_interval: keepalive 间隔
+        payload_cache: 单次请求内的 payload 构建缓存（重试时复用）
+        config: 请求固定的配置快照，未传入时使用当前快照
         
     Returns:
         响应对象
@@ -169,8 +282,20 @@ async def process_request(
         Exception: 请求失败时抛出异常
     """
     timeout_value = int(timeout_value)
+    if config is None:
+        config = get_config_snapshot(app).config
     model_dict = provider["_model_dict_cache"]
     original_model = model_dict[request.model]
+
+    # 开启 embedding 微批处理时，可合并的请求在选择上游 key 之前进入批次
+    if isinstance(request, EmbeddingRequest) and embedding_batcher.enabled:
+        engine, _ = get_engine(provider, endpoint, original_model)
+        plan = plan_embedding_batch(request, provider['provider'], engine, original_model)
+        if plan is not None:
+            return await process_embedding_request_batched(
+                request, provider, app, request_info_getter, update_channel_stats_func,
+                engine, original_model, timeout_value, plan, config,
+            )
     
     if provider['provider'].startswith("sk-"):
         api_key = provider['provider']
@@ -190,14 +315,16 @@ async def process_request(
 
     last_message_role = safe_get(request, "messages", -1, "role", default=None)
     
-    url, headers, payload = await get_payload(request, engine, provider, api_key)
+    url, headers, payload = await get_payload(request, engine, provider, api_key, payload_cache=payload_cache)
     headers.update(safe_get(provider, "preferences", "headers", default={}))  # add custom headers
     
 
     current_info = request_info_getter()
     
     # 记录发送到上游的请求头和请求体（如果配置了保留时间）
-    if current_info.get("raw_data_expires_at"):
+    # 失败采集模式下只保存引用，请求失败时才截断
+    deferred = defer_capture(current_info, upstream_request_headers=headers, upstream_request_body=payload)
+    if not deferred and current_info.get("raw_data_expires_at"):
         try:
             # 记录上游请求头（过滤敏感头信息）
             safe_upstream_headers = {k: v for k, v in headers.items()
@@ -220,21 +347,20 @@ async def process_request(
         try:
             # 从 provider_api_circular_list 中获取所有 keys
             circular_list = provider_api_circular_list.get(provider['provider'])
-            if circular_list and hasattr(circular_list, 'items'):
-                api_keys_list = circular_list.items
-                if api_key in api_keys_list:
-                    current_info["provider_key_index"] = api_keys_list.index(api_key)
+            if circular_list and hasattr(circular_list, 'get_item_index'):
+                key_index = circular_list.get_item_index(api_key)
+                if key_index is not None:
+                    current_info["provider_key_index"] = key_index
         except (ValueError, TypeError, AttributeError):
             pass
 
-    proxy = safe_get(app.state.config, "preferences", "proxy", default=None)  # global proxy
-    proxy = safe_get(provider, "preferences", "proxy", default=proxy)  # provider proxy
+    proxy, pool_options = get_connection_options(provider, config)
     
     # 获取该渠道启用的插件列表
     enabled_plugins = safe_get(provider, "preferences", "enabled_plugins", default=None)
 
     try:
-        async with app.state.client_manager.get_client(url, proxy) as client:
+        async with app.state.client_manager.get_client(url, proxy, pool_options=pool_options) as client:
             if request.stream:
                 generator = fetch_response_stream(client, url, headers, payload, engine, original_model, timeout_value, enabled_plugins=enabled_plugins)
                 wrapped_generator, first_response_time = await error_handling_wrapper(
@@ -302,15 +428,114 @@ async def process_request(
     except (Exception, HTTPException, asyncio.CancelledError, httpx.ReadError,
             httpx.RemoteProtocolError, httpx.LocalProtocolError, httpx.ReadTimeout,
             httpx.ConnectError) as e:
+        if not _is_moderation_cancel(e, current_info):
+            _fire_and_forget_channel_stats(
+                update_channel_stats_func,
+                current_info["request_id"],
+                channel_id,
+                request.model,
+                current_info["api_key"],
+                success=False,
+                provider_api_key=api_key,
+            )
+        raise e
+
+
+async def process_embedding_request_batched(
+    request: EmbeddingRequest,
+    provider: Dict[str, Any],
+    app: "FastAPI",
+    request_info_getter: Callable[[], Dict[str, Any]],
+    update_channel_stats_func: Callable,
+    engine: str,
+    original_model: str,
+    timeout_value: int,
+    plan: tuple,
+    config: Optional[Dict[str, Any]] = None,
+) -> Response:
+    """
+    合并发送 embedding 请求
+
+    同一批次只调用第一个请求提供的发送函数：选择一次上游 key、发出一次上游请求。
+    拆分后的响应带有本请求分摊的 usage，统计与渠道计数仍按单个请求记录。
+    """
+    batch_key, inputs, weight = plan
+    if config is None:
+        config = get_config_snapshot(app).config
+    channel_id = f"{provider['provider']}"
+    current_info = request_info_getter()
+    current_info["model"] = request.model
+    current_info["provider_id"] = channel_id
+
+    async def send(batch_inputs: list):
+        if provider.get("api"):
+            api_key = await provider_api_circular_list[provider['provider']].next(original_model)
+        else:
+            api_key = None
+        merged_request = request.model_copy(update={"input": batch_inputs})
+        url, headers, payload = await get_payload(merged_request, engine, provider, api_key)
+        headers.update(safe_get(provider, "preferences", "headers", default={}))
+
+        proxy, pool_options = get_connection_options(provider, config)
+        async with app.state.client_manager.get_client(url, proxy, pool_options=pool_options) as client:
+            generator = fetch_response(client, url, headers, payload, engine, original_model, timeout_value)
+            wrapped_generator, _ = await error_handling_wrapper(
+                generator, channel_id, engine, False,
+                app.state.error_triggers,
+                request_url=url,
+                app=app,
+            )
+            first_element = await anext(wrapped_generator)
+        result = await asyncio.to_thread(json.loads, first_element.lstrip("data: "))
+        return result, api_key
+
+    start_time = time()
+    api_key = None
+    try:
+        result, api_key = await embedding_batcher.submit(batch_key, inputs, weight, send)
+        encoded_element = await asyncio.to_thread(json.dumps, result)
+
+        async def non_stream_iter():
+            yield encoded_element
+
+        response = LoggingStreamingResponse(
+            non_stream_iter(),
+            media_type="application/json",
+            current_info=current_info,
+            app=app,
+            debug=is_debug
+        )
+        if api_key:
+            circular_list = provider_api_circular_list.get(provider['provider'])
+            key_index = circular_list.get_item_index(api_key) if circular_list else None
+            if key_index is not None:
+                current_info["provider_key_index"] = key_index
+
         _fire_and_forget_channel_stats(
             update_channel_stats_func,
             current_info["request_id"],
             channel_id,
             request.model,
             current_info["api_key"],
-            success=False,
+            success=True,
             provider_api_key=api_key,
         )
+        current_info["first_response_time"] = time() - start_time
+        current_info["success"] = True
+        current_info["status_code"] = 200
+        current_info["provider"] = channel_id
+        return response
+    except (Exception, HTTPException, asyncio.CancelledError) as e:
+        if not _is_moderation_cancel(e, current_info):
+            _fire_and_forget_channel_stats(
+                update_channel_stats_func,
+                current_info["request_id"],
+                channel_id,
+                request.model,
+                current_info["api_key"],
+                success=False,
+                provider_api_key=api_key,
+            )
         raise e
 
 
@@ -507,6 +732,7 @@ async def process_request_passthrough(
     role: Optional[str] = None,
     timeout_value: int = DEFAULT_TIMEOUT,
     keepalive_interval: Optional[int] = None,
+    config: Optional[Dict[str, Any]] = None,
 ) -> Response:
     """
     透传模式请求处理：
@@ -519,6 +745,8 @@ async def process_request_passthrough(
     from core.channels import get_channel
 
     timeout_value = int(timeout_value)
+    if config is None:
+        config = get_config_snapshot(app).config
     model_dict = provider["_model_dict_cache"]
     original_model = model_dict[request.model]
 
@@ -576,7 +804,8 @@ async def process_request_passthrough(
     channel_id = f"{provider['provider']}"
     current_info["dialect_id"] = passthrough_ctx.dialect_id
 
-    if current_info.get("raw_data_expires_at"):
+    deferred = defer_capture(current_info, upstream_request_headers=headers, upstream_request_body=payload)
+    if not deferred and current_info.get("raw_data_expires_at"):
         safe_upstream_headers = {
             k: v for k, v in headers.items()
             if k.lower() not in ("authorization", "x-api-key", "api-key", "x-goog-api-key")
@@ -601,11 +830,10 @@ async def process_request_passthrough(
         except (ValueError, TypeError, AttributeError):
             pass
 
-    proxy = safe_get(app.state.config, "preferences", "proxy", default=None)
-    proxy = safe_get(provider, "preferences", "proxy", default=proxy)
+    proxy, pool_options = get_connection_options(provider, config)
 
     try:
-        async with app.state.client_manager.get_client(url, proxy) as client:
+        async with app.state.client_manager.get_client(url, proxy, pool_options=pool_options) as client:
             last_message_role = safe_get(request, "messages", -1, "role", default=None)
 
             if request.stream:
@@ -650,15 +878,16 @@ async def process_request_passthrough(
     except (Exception, HTTPException, asyncio.CancelledError, httpx.ReadError,
             httpx.RemoteProtocolError, httpx.LocalProtocolError, httpx.ReadTimeout,
             httpx.ConnectError) as e:
-        _fire_and_forget_channel_stats(
-            update_channel_stats_func,
-            current_info["request_id"],
-            channel_id,
-            request.model,
-            current_info["api_key"],
-            success=False,
-            provider_api_key=api_key,
-        )
+        if not _is_moderation_cancel(e, current_info):
+            _fire_and_forget_channel_stats(
+                update_channel_stats_func,
+                current_info["request_id"],
+                channel_id,
+                request.model,
+                current_info["api_key"],
+                success=False,
+                provider_api_key=api_key,
+            )
         raise e
 
     response.headers["x-zoaholic-passthrough"] = "request"
@@ -709,6 +938,96 @@ class ModelRequestHandler:
         self.last_provider_indices = defaultdict(lambda: -1)
         self.locks = defaultdict(asyncio.Lock)
 
+    async def _request_local_api_key(
+        self,
+        request_data: Union[RequestModel, ImageGenerationRequest, AudioTranscriptionRequest, ModerationRequest, EmbeddingRequest],
+        api_index: int,
+        local_api_index: int,
+        background_tasks: BackgroundTasks,
+        endpoint: Optional[str] = None,
+        dialect_id: Optional[str] = None,
+        original_payload: Optional[Dict[str, Any]] = None,
+        original_headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """
+        将请求在进程内转交给被当作渠道的本地聚合器 Key（sk-）继续调度
+
+        不再回环请求 127.0.0.1 的 /v1 接口，省去序列化、本机 socket 往返和第二遍中间件。
+        调用链上再次出现同一个 Key 时视为循环引用，抛出 508 交由外层重试逻辑处理。
+        """
+        chain = _local_dispatch_chain.get() + (api_index,)
+        if local_api_index in chain:
+            raise HTTPException(
+                status_code=508,
+                detail=f"Local API key reference cycle detected: {self.app.state.api_list[local_api_index][:11]}",
+            )
+        # 内层 Key 的检查与回环调度时经过中间件一致：余额、限流
+        local_api_key = self.app.state.api_list[local_api_index]
+        if not DISABLE_DATABASE and await is_paid_key_enabled(self.app, local_api_key) is False:
+            raise HTTPException(status_code=429, detail="Balance is insufficient, please check your account.")
+        await self.app.state.user_api_keys_rate_limit[local_api_key].next(request_data.model)
+
+        token = _local_dispatch_chain.set(chain)
+        try:
+            await self._check_local_key_moderation(request_data, api_index, local_api_index, background_tasks)
+            response = await self.request_model(
+                request_data, local_api_index, background_tasks,
+                endpoint=endpoint,
+                dialect_id=dialect_id,
+                original_payload=original_payload,
+                original_headers=original_headers,
+            )
+        finally:
+            _local_dispatch_chain.reset(token)
+
+        # 成功转交后为内层 Key 记账（写入统计时额外生成一条该 Key 的记录）
+        key_settings = get_api_key_settings(self.app, get_config_snapshot(self.app).config, local_api_index)
+        record_local_key_usage(
+            self.request_info_getter(), local_api_key,
+            api_key_name=key_settings.name if key_settings is not None else None,
+            api_key_group=key_settings.group if key_settings is not None else None,
+        )
+        return response
+
+    async def _check_local_key_moderation(
+        self,
+        request_data,
+        api_index: int,
+        local_api_index: int,
+        background_tasks: BackgroundTasks,
+    ) -> None:
+        """
+        内层 Key 开启 ENABLE_MODERATION 时执行道德审查（回环调度时由中间件完成）
+
+        外层 Key 也开启审查时，同一内容已由中间件审查过（speculative 模式下结论到达前不会放行响应），
+        不再重复审查；否则优先使用结论缓存，未命中时通过内层 Key 调用审查接口。
+        """
+        config = get_config_snapshot(self.app).config
+        local_settings = get_api_key_settings(self.app, config, local_api_index)
+        if local_settings is None or not local_settings.enable_moderation:
+            return
+        outer_settings = get_api_key_settings(self.app, config, api_index)
+        if outer_settings is not None and outer_settings.enable_moderation:
+            return
+        content = get_moderated_content(request_data)
+        if not content:
+            return
+
+        is_flagged = moderation_verdict_cache.get(content)
+        if is_flagged is None:
+            response = await self.request_model(
+                ModerationRequest(input=content), local_api_index, background_tasks, endpoint="/v1/moderations",
+            )
+            is_flagged = await read_moderation_flagged(response)
+            moderation_verdict_cache.put(content, is_flagged)
+
+        if is_flagged:
+            logger.error(f"Content did not pass the moral check: {content}")
+            current_info = self.request_info_getter()
+            current_info["is_flagged"] = True
+            current_info["text"] = content
+            raise HTTPException(status_code=400, detail="Content did not pass the moral check, please modify and try again.")
+
     async def request_model(
         self,
         request_data: Union[RequestModel, ImageGenerationRequest, AudioTranscriptionRequest, ModerationRequest, EmbeddingRequest],
@@ -734,16 +1053,18 @@ class ModelRequestHandler:
         Returns:
             响应对象
         """
-        config = self.app.state.config
+        # 固定本次请求使用的配置快照，期间的配置更新不影响本次请求
+        snapshot = get_config_snapshot(self.app)
+        config = snapshot.config
         request_model_name = request_data.model
-        
-        if not safe_get(config, 'api_keys', api_index, 'model'):
+        key_settings = get_api_key_settings(self.app, config, api_index)
+
+        if key_settings is None or not key_settings.models:
             raise HTTPException(status_code=404, detail=f"No matching model found: {request_model_name}")
 
         # 调度算法优先级：API Key preferences > 全局 preferences > 默认值
-        scheduling_algorithm = safe_get(
-            config, 'api_keys', api_index, "preferences", "SCHEDULING_ALGORITHM",
-            default=safe_get(config, "preferences", "SCHEDULING_ALGORITHM", default="fixed_priority")
+        scheduling_algorithm = key_settings.preference("SCHEDULING_ALGORITHM") or safe_get(
+            config, "preferences", "SCHEDULING_ALGORITHM", default="fixed_priority"
         )
 
         # 估算请求 token 数
@@ -771,11 +1092,8 @@ class ModelRequestHandler:
                 ) % num_matching_providers
                 start_index = self.last_provider_indices[request_model_name]
 
-        auto_retry = safe_get(config, 'api_keys', api_index, "preferences", "AUTO_RETRY", default=True)
-        role = safe_get(
-            config, 'api_keys', api_index, "role", 
-            default=safe_get(config, 'api_keys', api_index, "api", default="None")[:8]
-        )
+        auto_retry = key_settings.preference("AUTO_RETRY", True)
+        role = key_settings.role
 
         index = 0
         # 获取配置的最大重试次数上限，默认为 10
@@ -832,6 +1150,9 @@ class ModelRequestHandler:
         retry_path: List[Dict[str, Any]] = []
         current_retry_count = 0
 
+        # 重试时复用同引擎候选渠道的 payload 构建结果；只有一次尝试时不缓存，避免多复制一份请求体
+        payload_cache = PayloadCache() if max_attempts > 1 else None
+
         while True:
             if index >= max_attempts:
                 break
@@ -853,35 +1174,16 @@ class ModelRequestHandler:
 
             original_request_model = (original_model, request_data.model)
             
-            # 处理本地 sk- 代理
-            if provider_name.startswith("sk-") and provider_name in self.app.state.api_list:
-                local_provider_api_index = self.app.state.api_list.index(provider_name)
-                local_provider_scheduling_algorithm = safe_get(
-                    config, 'api_keys', local_provider_api_index, "preferences", 
-                    "SCHEDULING_ALGORITHM", default="fixed_priority"
-                )
-                local_provider_matching_providers = await get_right_order_providers(
-                    request_model_name, config, local_provider_api_index, 
-                    local_provider_scheduling_algorithm, self.app, 
-                    request_total_tokens=request_total_tokens
-                )
-                local_timeout_value = 0
-                for local_provider in local_provider_matching_providers:
-                    local_provider_name = local_provider['provider']
-                    if not local_provider_name.startswith("sk-"):
-                        local_timeout_value += get_preference(
-                            self.app.state.provider_timeouts, local_provider_name, 
-                            original_request_model, self.default_timeout
-                        )
-                local_provider_num_matching_providers = len(local_provider_matching_providers)
+            # 本地聚合器 Key（sk-）：在进程内递归调度，超时由下层各渠道自行控制
+            local_api_index = None
+            if provider_name.startswith("sk-") and provider_name in snapshot.api_list:
+                local_api_index = snapshot.api_list.index(provider_name)
+                local_timeout_value = self.default_timeout
             else:
                 local_timeout_value = get_preference(
                     self.app.state.provider_timeouts, provider_name, 
                     original_request_model, self.default_timeout
                 )
-                local_provider_num_matching_providers = 1
-
-            local_timeout_value = local_timeout_value * local_provider_num_matching_providers
 
             keepalive_interval = get_preference(
                 self.app.state.keepalive_interval, provider_name, 
@@ -894,6 +1196,17 @@ class ModelRequestHandler:
 
             try:
                 passthrough_ctx = None
+                if local_api_index is not None:
+                    response = await self._request_local_api_key(
+                        request_data, api_index, local_api_index, background_tasks,
+                        endpoint, dialect_id, original_payload, original_headers,
+                    )
+                    current_info = self.request_info_getter()
+                    if retry_path:
+                        current_info["retry_path"] = json.dumps(retry_path, ensure_ascii=False)
+                    current_info["retry_count"] = current_retry_count
+                    return response
+
                 if dialect_id and original_payload is not None and isinstance(request_data, RequestModel):
                     from core.dialects.passthrough import evaluate_passthrough
                     passthrough_ctx = await evaluate_passthrough(
@@ -913,10 +1226,13 @@ class ModelRequestHandler:
                     role=role,
                     timeout_value=local_timeout_value,
                     keepalive_interval=keepalive_interval,
+                    config=config,
                 ) if process_fn is process_request_passthrough else await process_request(
                     request_data, provider, background_tasks, self.app,
                     self.request_info_getter, self.update_channel_stats_func,
-                    endpoint, role, local_timeout_value, keepalive_interval
+                    endpoint, role, local_timeout_value, keepalive_interval,
+                    payload_cache=payload_cache,
+                    config=config,
                 )
 
                 # 成功时记录重试路径和重试次数
@@ -1021,6 +1337,8 @@ class ModelRequestHandler:
                     # provider 列表发生变化（或重新排序）时，重算最大尝试次数
                     retry_count = _calc_retry_count(matching_providers)
                     max_attempts = num_matching_providers + retry_count
+                    if payload_cache is None and max_attempts > 1:
+                        payload_cache = PayloadCache()
                     if num_matching_providers != last_num_matching_providers:
                         index = 0
 
@@ -1037,10 +1355,8 @@ class ModelRequestHandler:
                     await provider_api_circular_list[channel_id].set_cooling(current_api, cooling_time=cooling_time)
 
                 # 有些错误并没有请求成功，所以需要删除请求记录
-                if (current_api 
-                    and any(error in error_message for error in exclude_error_rate_limit) 
-                    and provider_api_circular_list[provider_name].requests[current_api][original_model]):
-                    provider_api_circular_list[provider_name].requests[current_api][original_model].pop()
+                if current_api and any(error in error_message for error in exclude_error_rate_limit):
+                    await provider_api_circular_list[provider_name].discard_last_request(current_api, original_model)
 
                 # 根据错误消息调整状态码
                 if "string_above_max_length" in error_message:
@@ -1101,6 +1417,9 @@ class ModelRequestHandler:
                     break
 
                 # 不重试：直接返回本次错误
+                if _local_dispatch_chain.get():
+                    # 作为本地聚合器 Key 被嵌套调度：交给外层 Key 的重试逻辑，由外层统一写入统计
+                    raise HTTPException(status_code=status_code, detail=error_message)
                 # 失败时也记录重试信息和统计
                 current_info = self.request_info_getter()
                 if retry_path:
@@ -1120,6 +1439,8 @@ class ModelRequestHandler:
                 )
 
         # 所有重试都失败
+        if _local_dispatch_chain.get():
+            raise HTTPException(status_code=status_code, detail=f"All {request_data.model} error: {error_message}")
         current_info = self.request_info_getter()
         current_info["first_response_time"] = -1
         current_info["success"] = False
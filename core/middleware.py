@@ -25,8 +25,16 @@ from starlette.types import ASGIApp, Receive, Send, Scope, Message
 
 from core.log_config import logger
 from core.models import ModerationRequest, UnifiedRequest
-from core.stats import update_stats
+from core.stats import update_stats, is_paid_key_enabled
+from core.raw_capture import decide_capture, start_deferred_capture, CAPTURE_FULL, CAPTURE_FAILURES
 from core.utils import truncate_for_logging
+from core.config_snapshot import get_api_key_settings
+from core.moderation import (
+    MODERATION_MODE_SPECULATIVE,
+    get_moderation_mode,
+    get_moderated_content,
+    moderation_verdict_cache,
+)
 from core.error_response import openai_error_response
 from utils import safe_get
 from db import DISABLE_DATABASE
@@ -35,6 +43,48 @@ from db import DISABLE_DATABASE
 # 请求级统计信息上下文
 request_info = contextvars.ContextVar("request_info", default={})
 
+# StatsMiddleware 写入 ASGI scope["state"] 的键，供下游路由复用已解析的请求体
+PARSED_BODY_STATE_KEY = "parsed_body"
+UNIFIED_REQUEST_STATE_KEY = "unified_request"
+
+
+async def get_request_json(request: Request) -> Any:
+    """
+    获取请求体 JSON
+
+    优先复用 StatsMiddleware 已解析的结果；否则读取 body 并在线程中解析，
+    解析结果写回 scope["state"]，同一请求内只解析一次。
+
+    Raises:
+        json.JSONDecodeError: 请求体不是合法 JSON
+    """
+    state = request.scope.setdefault("state", {})
+    if PARSED_BODY_STATE_KEY in state:
+        return state[PARSED_BODY_STATE_KEY]
+
+    body = await request.body()
+    # 使用 asyncio.to_thread 避免大请求体阻塞事件循环
+    parsed = await asyncio.to_thread(json.loads, body)
+    state[PARSED_BODY_STATE_KEY] = parsed
+    return parsed
+
+
+def get_validated_request(request: Request, request_type: str) -> Optional[Any]:
+    """
+    获取 StatsMiddleware 已校验的请求模型（UnifiedRequest.data）
+
+    仅当类型匹配时返回，否则返回 None，由调用方自行解析。
+    """
+    state = request.scope.get("state") or {}
+    model = state.get(UNIFIED_REQUEST_STATE_KEY)
+    if model is not None and getattr(model, "request_type", None) == request_type:
+        return model
+    return None
+
+
+class _ModerationFlagged(Exception):
+    """推测式审查判定违规时，用于中止被挂起的下游响应"""
+
 
 def get_api_key_from_headers(headers: list) -> Optional[str]:
     """
@@ -95,7 +145,7 @@ class StatsMiddleware:
     - 解析请求体，构造 UnifiedRequest，用于：
         - 记录 model
         - 进行 per-api-key 的限流（user_api_keys_rate_limit）
-        - 提取需要审查的文本，调用 /v1/moderations
+        - 提取需要审查的文本，调用 /v1/moderations（MODERATION_MODE=speculative 时与上游请求并发执行）
     - 对流式响应包装为 LoggingStreamingResponse 以记录 usage
 
     使用纯 ASGI 实现，通过缓存 body 并重放给下游，不会"吃掉"请求体。
@@ -184,6 +234,7 @@ class StatsMiddleware:
         token = None
         api_index = None
         enable_moderation = False
+        key_settings = None
         config = app.state.config
 
         if is_dialect:
@@ -199,48 +250,35 @@ class StatsMiddleware:
                 return
 
             try:
-                api_list = app.state.api_list
-                api_index = api_list.index(token)
+                api_index = app.state.api_list.index(token)
             except ValueError:
                 api_index = None
 
-            if api_index is not None:
-                enable_moderation = safe_get(
-                    config,
-                    "api_keys",
-                    api_index,
-                    "preferences",
-                    "ENABLE_MODERATION",
-                    default=False,
-                )
-                if not DISABLE_DATABASE:
-                    check_api_key = safe_get(config, "api_keys", api_index, "api")
-                    # 余额检查
-                    if (
-                        safe_get(
-                            app.state.paid_api_keys_states,
-                            check_api_key,
-                            "enabled",
-                            default=None,
-                        )
-                        is False
-                        and not path.startswith("/v1/token_usage")
-                    ):
-                        response = openai_error_response("Balance is insufficient, please check your account.", 429)
-                        await response(scope, receive, send)
-                        return
-            else:
+            if api_index is None:
                 response = openai_error_response("Invalid or missing API Key", 403)
                 await response(scope, receive, send)
                 return
 
+            key_settings = get_api_key_settings(app, config, api_index)
+            if key_settings is not None:
+                enable_moderation = key_settings.enable_moderation
+                # 余额检查
+                if (
+                    not DISABLE_DATABASE
+                    and await is_paid_key_enabled(app, key_settings.api) is False
+                    and not path.startswith("/v1/token_usage")
+                ):
+                    response = openai_error_response("Balance is insufficient, please check your account.", 429)
+                    await response(scope, receive, send)
+                    return
+
         # 获取 client IP
         client = scope.get("client")
         client_ip = client[0] if client else "unknown"
 
         # 获取用户key相关信息
-        api_key_name = safe_get(config, "api_keys", api_index, "name", default=None)
-        api_key_group = safe_get(config, "api_keys", api_index, "group", default=None)
+        api_key_name = key_settings.name if key_settings is not None else None
+        api_key_group = key_settings.group if key_settings is not None else None
 
         # 初始化 request_info
         request_id = str(uuid.uuid4())
@@ -292,20 +330,30 @@ class StatsMiddleware:
                     break
             body_bytes = b"".join(body_chunks)
 
-            if body_bytes:
+            # 只有模型记录/限流/审查需要解析请求体（方言端点由路由自行鉴权，跳过）
+            # 解析结果写入 scope["state"]，下游通过 get_request_json 复用，不再重复解析
+            if body_bytes and api_index is not None:
                 try:
                     # 使用 asyncio.to_thread 避免大请求体阻塞事件循环
                     parsed_body = await asyncio.to_thread(json.loads, body_bytes)
                 except json.JSONDecodeError:
                     parsed_body = None
+                else:
+                    scope.setdefault("state", {})[PARSED_BODY_STATE_KEY] = parsed_body
 
         # 获取原始数据保留时间配置（小时），默认为0表示不保存
         raw_data_retention_hours = safe_get(
             config, "preferences", "log_raw_data_retention_hours", default=0
         )
-        
-        # 如果配置了保留时间，保存请求头和请求体
-        if raw_data_retention_hours > 0:
+
+        # 在复制/截断请求体之前决定采集方式（按 API Key / 模型采样，失败请求单独兜底）
+        request_model_name = parsed_body.get("model") if isinstance(parsed_body, dict) else None
+        capture_mode = decide_capture(config, api_index, request_model_name, raw_data_retention_hours, key_settings=key_settings)
+
+        if capture_mode == CAPTURE_FAILURES:
+            # 只保存引用，请求失败时才在写入统计前截断
+            start_deferred_capture(current_info, raw_data_retention_hours, headers_dict, body_bytes)
+        elif capture_mode == CAPTURE_FULL:
             # 过滤敏感头信息
             safe_headers = {k: v for k, v in headers_dict.items()
                           if k not in ("authorization", "x-api-key")}
@@ -333,13 +381,17 @@ class StatsMiddleware:
             else:
                 return await receive()
 
+        speculative_moderation: Optional[asyncio.Task] = None
         try:
             # 如果能解析为 UnifiedRequest，则执行模型记录/限流/审查
             # 注意：方言端点的 api_index 为 None，跳过限流（方言路由自己处理认证）
             if parsed_body and should_attempt_unified_request(parsed_body) and api_index is not None:
                 try:
-                    request_model = await asyncio.to_thread(UnifiedRequest.model_validate, parsed_body)
+                    # 传入浅拷贝：UnifiedRequest 的 before 校验器会向输入 dict 写入 data 字段，
+                    # 不能污染共享给下游的 parsed_body
+                    request_model = await asyncio.to_thread(UnifiedRequest.model_validate, dict(parsed_body))
                     request_model = request_model.data
+                    scope.setdefault("state", {})[UNIFIED_REQUEST_STATE_KEY] = request_model
                     if self.debug:
                         pass
                     model = request_model.model
@@ -354,38 +406,28 @@ class StatsMiddleware:
                         await response(scope, receive_wrapper, send)
                         return
 
-                    moderated_content = None
-                    if request_model.request_type == "chat":
-                        moderated_content = request_model.get_last_text_message()
-                    elif request_model.request_type == "image":
-                        moderated_content = request_model.prompt
-                    elif request_model.request_type == "tts":
-                        moderated_content = request_model.input
-                    elif request_model.request_type == "moderation":
-                        pass
-                    elif request_model.request_type == "embedding":
-                        if isinstance(request_model.input, list) and len(request_model.input) > 0 and isinstance(request_model.input[0], str):
-                            moderated_content = "\n".join(request_model.input)
-                        else:
-                            moderated_content = request_model.input
-                    else:
-                        logger.error("Unknown request type: %s", request_model.request_type)
+                    moderated_content = get_moderated_content(request_model)
 
                     if enable_moderation and moderated_content:
-                        background_tasks_for_moderation = BackgroundTasks()
-                        moderation_response = await self._moderate_content(moderated_content, api_index, background_tasks_for_moderation, app)
-                        is_flagged = moderation_response.get("results", [{}])[0].get("flagged", False)
-
-                        if is_flagged:
-                            logger.error("Content did not pass the moral check: %s", moderated_content)
-                            process_time = time() - start_time
-                            current_info["process_time"] = process_time
-                            current_info["is_flagged"] = is_flagged
-                            current_info["text"] = moderated_content
-                            await update_stats(current_info, app=app)
-                            response = openai_error_response("Content did not pass the moral check, please modify and try again.", 400)
-                            await response(scope, receive_wrapper, send)
-                            return
+                        cached_verdict = moderation_verdict_cache.get(moderated_content)
+                        if cached_verdict is None and get_moderation_mode(config, api_index, key_settings=key_settings) == MODERATION_MODE_SPECULATIVE:
+                            # 推测式审查：与上游请求并发执行，结论到达前暂存响应
+                            # 审查请求使用独立的 request_info，避免覆盖本次请求的统计字段
+                            moderation_context = contextvars.copy_context()
+                            moderation_context.run(request_info.set, dict(current_info))
+                            speculative_moderation = asyncio.create_task(
+                                self._is_content_flagged(moderated_content, api_index, app),
+                                context=moderation_context,
+                            )
+                        else:
+                            if cached_verdict is None:
+                                is_flagged = await self._is_content_flagged(moderated_content, api_index, app)
+                            else:
+                                is_flagged = cached_verdict
+
+                            if is_flagged:
+                                await self._reject_flagged(moderated_content, current_info, start_time, app, scope, receive_wrapper, send)
+                                return
                 except ValidationError as e:
                     # 不在中间件返回 422，避免对非统一请求路由造成影响
                     # 也不打印庞大的 Payload，防止日志刷屏
@@ -405,7 +447,13 @@ class StatsMiddleware:
                 await send(message)
 
             # 调用下游应用
-            await self.app(scope, receive_wrapper, send_wrapper)
+            if speculative_moderation is not None:
+                await self._run_with_speculative_moderation(
+                    scope, receive_wrapper, send_wrapper, speculative_moderation, current_info,
+                    lambda: self._reject_flagged(moderated_content, current_info, start_time, app, scope, receive_wrapper, send),
+                )
+            else:
+                await self.app(scope, receive_wrapper, send_wrapper)
 
         except ValidationError as e:
             logger.error(
@@ -427,8 +475,73 @@ class StatsMiddleware:
             response = openai_error_response(f"Internal server error: {str(e)}", 500)
             await response(scope, receive_wrapper, send)
         finally:
+            if speculative_moderation is not None and not speculative_moderation.done():
+                speculative_moderation.cancel()
             request_info.reset(current_request_info)
 
+    async def _run_with_speculative_moderation(
+        self, scope: Scope, receive: Receive, send: Send,
+        moderation_task: asyncio.Task, current_info: dict, reject,
+    ) -> None:
+        """
+        与审查并发执行下游应用。
+
+        - 审查结论到达前，下游发出的响应消息被挂起（流式响应同样被阻塞在首个消息）
+        - 审查不通过：取消下游任务（随之关闭上游连接），返回 400；
+          取消前在 current_info 中标记 moderation_cancelled，渠道不会因此记一次失败
+        - 审查通过：放行所有响应消息
+        """
+
+        async def gated_send(message: Message) -> None:
+            if await asyncio.shield(moderation_task):
+                raise _ModerationFlagged()
+            await send(message)
+
+        app_task = asyncio.create_task(self.app(scope, receive, gated_send))
+        try:
+            await asyncio.wait({app_task, moderation_task}, return_when=asyncio.FIRST_COMPLETED)
+            try:
+                is_flagged = await moderation_task
+            except Exception:
+                app_task.cancel()
+                raise
+
+            if is_flagged:
+                current_info["moderation_cancelled"] = True
+                app_task.cancel()
+                try:
+                    await app_task
+                except (asyncio.CancelledError, Exception):
+                    pass
+                await reject()
+                return
+
+            await app_task
+        finally:
+            if not app_task.done():
+                app_task.cancel()
+
+    async def _is_content_flagged(self, content: str, api_index: int, app: Any) -> bool:
+        """调用审查接口判断内容是否违规，并写入结论缓存"""
+        background_tasks_for_moderation = BackgroundTasks()
+        moderation_response = await self._moderate_content(content, api_index, background_tasks_for_moderation, app)
+        is_flagged = bool(moderation_response.get("results", [{}])[0].get("flagged", False))
+        moderation_verdict_cache.put(content, is_flagged)
+        return is_flagged
+
+    async def _reject_flagged(
+        self, content: str, current_info: dict, start_time: float, app: Any,
+        scope: Scope, receive: Receive, send: Send,
+    ) -> None:
+        """记录违规请求统计并返回 400"""
+        logger.error("Content did not pass the moral check: %s", content)
+        current_info["process_time"] = time() - start_time
+        current_info["is_flagged"] = True
+        current_info["text"] = content
+        await update_stats(current_info, app=app)
+        response = openai_error_response("Content did not pass the moral check, please modify and try again.", 400)
+        await response(scope, receive, send)
+
     async def _moderate_content(
         self, content: str, api_index: int, background_tasks: BackgroundTasks, app: Any
     ):
@@ -0,0 +1,121 @@
+"""
+道德审查辅助模块
+
+提供：
+- ModerationVerdictCache：按内容哈希缓存审查结论，重复内容不再重复审查
+- get_moderation_mode：解析审查模式（blocking / speculative）
+- get_moderated_content：提取请求中需要审查的文本
+- read_moderation_flagged：从审查接口的响应中读取结论
+"""
+
+import os
+import json
+import hashlib
+from time import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils import safe_get
+from core.utils import ApiKeySettings
+from core.models import RequestModel, ImageGenerationRequest, TextToSpeechRequest, EmbeddingRequest
+
+
+MODERATION_MODE_BLOCKING = "blocking"
+MODERATION_MODE_SPECULATIVE = "speculative"
+
+
+class ModerationVerdictCache:
+    """
+    审查结论缓存
+
+    - key：审查文本的 sha256
+    - value：(flagged, 写入时间)
+    - 超过 max_items 按 LRU 淘汰，超过 ttl 秒视为过期
+    """
+
+    def __init__(self, max_items: int = 4096, ttl: int = 3600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple[bool, float]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(content: str) -> str:
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, content: str) -> Optional[bool]:
+        """返回缓存的结论；未命中或已过期返回 None"""
+        key = self.make_key(content)
+        item = self._items.get(key)
+        if item is None:
+            return None
+        flagged, created_at = item
+        if self.ttl > 0 and time() - created_at > self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return flagged
+
+    def put(self, content: str, flagged: bool) -> None:
+        if self.max_items <= 0:
+            return
+        key = self.make_key(content)
+        self._items[key] = (bool(flagged), time())
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+moderation_verdict_cache = ModerationVerdictCache(
+    max_items=int(os.getenv("MODERATION_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("MODERATION_CACHE_TTL", 3600)),
+)
+
+
+def get_moderation_mode(config: dict, api_index: int, key_settings: Optional[ApiKeySettings] = None) -> str:
+    """
+    获取审查模式，优先级：API Key preferences > 全局 preferences > 默认 blocking
+
+    - blocking：审查通过后才转发请求（默认，与旧行为一致）
+    - speculative：审查与上游请求并发执行，结论到达前暂存响应，不通过则取消上游请求
+
+    key_settings 为调用方已取得的预编译配置；未传入时按 api_index 从 config 读取。
+    """
+    if key_settings is None:
+        key_settings = ApiKeySettings.from_config(api_index, safe_get(config, "api_keys", api_index, default={}))
+    mode = key_settings.preference("MODERATION_MODE") or safe_get(
+        config, "preferences", "MODERATION_MODE", default=MODERATION_MODE_BLOCKING
+    )
+    if mode == MODERATION_MODE_SPECULATIVE:
+        return MODERATION_MODE_SPECULATIVE
+    return MODERATION_MODE_BLOCKING
+
+
+def get_moderated_content(request_model) -> Optional[str]:
+    """提取需要审查的文本；不需要审查的请求类型（审查、语音转写）返回 None"""
+    if isinstance(request_model, RequestModel):
+        return request_model.get_last_text_message()
+    if isinstance(request_model, ImageGenerationRequest):
+        return request_model.prompt
+    if isinstance(request_model, TextToSpeechRequest):
+        return request_model.input
+    if isinstance(request_model, EmbeddingRequest):
+        if isinstance(request_model.input, list) and len(request_model.input) > 0 and isinstance(request_model.input[0], str):
+            return "\n".join(request_model.input)
+        return request_model.input
+    return None
+
+
+async def read_moderation_flagged(response) -> bool:
+    """读取 /v1/moderations 响应（流式或普通响应）中的 flagged 结论"""
+    body_iterator = getattr(response, "body_iterator", None)
+    if body_iterator is None:
+        body = response.body
+    else:
+        body = b""
+        async for chunk in body_iterator:
+            body += chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+    data = json.loads(body.decode("utf-8"))
+    return bool((data.get("results") or [{}])[0].get("flagged", False))
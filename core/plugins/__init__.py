@@ -45,12 +45,14 @@ from .interceptors import (
     unregister_response_interceptor,
     apply_request_interceptors,
     apply_response_interceptors,
+    has_response_interceptors,
     # 插件参数解析工具
     parse_plugin_entry,
     parse_enabled_plugins,
     get_plugin_options,
     is_plugin_enabled,
 )
+from .stream_utils import ThinkingTagSplitter
 
 __all__ = [
     # 扩展点
@@ -75,9 +77,12 @@ __all__ = [
     "unregister_response_interceptor",
     "apply_request_interceptors",
     "apply_response_interceptors",
+    "has_response_interceptors",
     # 插件参数工具
     "parse_plugin_entry",
     "parse_enabled_plugins",
     "get_plugin_options",
     "is_plugin_enabled",
+    # 流式处理工具
+    "ThinkingTagSplitter",
 ]
\ No newline at end of file
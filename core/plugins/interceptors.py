@@ -43,8 +43,11 @@ register_response_interceptor("my_plugin", my_response_interceptor, priority=50)
 
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass, field
+from bisect import bisect_left
 import asyncio
+import os
 import re
+import time
 
 from ..log_config import logger
 
@@ -188,6 +191,53 @@ ResponseInterceptor = Callable[
     "asyncio.coroutines.coroutine"
 ]
 
+# 编译后拦截器链缓存的条目上限（按 (类型, enabled_plugins) 区分，超过时整体清空）
+MAX_COMPILED_CHAINS = 1024
+
+# 拦截器耗时直方图的桶上界（毫秒），最后一个桶为 +Inf
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500)
+# 单次调用超过该耗时（毫秒）时告警，<=0 表示关闭
+SLOW_INTERCEPTOR_MS = float(os.getenv("PLUGIN_SLOW_INTERCEPTOR_MS", 0))
+# 同一拦截器两次慢调用告警的最小间隔（秒），避免逐 chunk 刷屏
+_SLOW_WARNING_INTERVAL = 60.0
+
+
+@dataclass
+class InterceptorMetrics:
+    """单个拦截器的调用统计"""
+    calls: int = 0
+    errors: int = 0
+    slow_calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    buckets: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    last_error: Optional[str] = None
+    last_slow_warning: float = 0.0
+
+    def observe(self, elapsed_ms: float, error: Optional[BaseException] = None) -> None:
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        if error is not None:
+            self.errors += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        histogram = {f"le_{bound:g}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)}
+        histogram["+Inf"] = self.buckets[-1]
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "slow_calls": self.slow_calls,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "histogram": histogram,
+            "last_error": self.last_error,
+        }
+
 
 @dataclass
 class InterceptorEntry:
@@ -198,6 +248,7 @@ class InterceptorEntry:
     enabled: bool = True
     plugin_name: Optional[str] = None
     metadata: Dict[str, Any] = field(default_factory=dict)
+    metrics: InterceptorMetrics = field(default_factory=InterceptorMetrics, compare=False, repr=False)
 
 
 class InterceptorRegistry:
@@ -205,11 +256,123 @@ class InterceptorRegistry:
     拦截器注册表
     
     管理 request 和 response 拦截器的注册、注销和调用。
+
+    按 enabled_plugins 过滤并排序后的拦截器链会被编译缓存，
+    注册/注销/启用/禁用拦截器时整体失效；请勿直接修改 InterceptorEntry.enabled。
     """
     
     def __init__(self):
         self._request_interceptors: Dict[str, InterceptorEntry] = {}
         self._response_interceptors: Dict[str, InterceptorEntry] = {}
+        self._compiled_chains: Dict[Tuple[str, Any], Tuple[InterceptorEntry, ...]] = {}
+
+    # ==================== 拦截器链编译 ====================
+
+    def _invalidate_chains(self) -> None:
+        self._compiled_chains.clear()
+
+    def _compile_chain(self, kind: str, enabled_plugins: Optional[List[str]]) -> Tuple[InterceptorEntry, ...]:
+        """
+        获取按优先级排序、已按 enabled_plugins 过滤的拦截器链
+
+        属于插件的拦截器需要该插件被显式启用（enabled_plugins 为 None 或空列表时全部跳过），
+        不属于插件的拦截器始终执行。同一 enabled_plugins 只在首次调用时解析。
+        """
+        if isinstance(enabled_plugins, list):
+            key = (kind, tuple(enabled_plugins))
+        else:
+            key = (kind, enabled_plugins)
+        try:
+            chain = self._compiled_chains.get(key)
+        except TypeError:
+            # enabled_plugins 中含不可哈希的条目，不缓存
+            key, chain = None, None
+        if chain is not None:
+            return chain
+
+        if kind == "request":
+            interceptors = self.get_request_interceptors(enabled_only=True)
+        else:
+            interceptors = self.get_response_interceptors(enabled_only=True)
+
+        # 解析 enabled_plugins，提取插件名（忽略参数部分用于过滤）
+        enabled_plugin_names = set(parse_enabled_plugins(enabled_plugins).keys())
+        chain = tuple(
+            interceptor for interceptor in interceptors
+            if not interceptor.plugin_name or interceptor.plugin_name in enabled_plugin_names
+        )
+        if key is not None:
+            if len(self._compiled_chains) >= MAX_COMPILED_CHAINS:
+                self._compiled_chains.clear()
+            self._compiled_chains[key] = chain
+        return chain
+
+    # ==================== 调用统计 ====================
+
+    def _record_call(self, kind: str, interceptor: InterceptorEntry, started: float, error: Optional[BaseException] = None) -> None:
+        """记录一次拦截器调用的耗时与异常，超过 SLOW_INTERCEPTOR_MS 时按间隔告警"""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics = interceptor.metrics
+        metrics.observe(elapsed_ms, error)
+        if SLOW_INTERCEPTOR_MS > 0 and elapsed_ms > SLOW_INTERCEPTOR_MS:
+            metrics.slow_calls += 1
+            now = time.monotonic()
+            if now - metrics.last_slow_warning >= _SLOW_WARNING_INTERVAL:
+                metrics.last_slow_warning = now
+                logger.warning(
+                    f"Slow {kind} interceptor '{interceptor.id}' (plugin={interceptor.plugin_name}): "
+                    f"{elapsed_ms:.1f}ms > {SLOW_INTERCEPTOR_MS:g}ms, {metrics.slow_calls} slow calls so far"
+                )
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        获取拦截器调用统计
+
+        按拦截点（request / response）汇总，并给出每个拦截器与每个插件的明细。
+        """
+        plugins: Dict[str, Dict[str, Any]] = {}
+        result: Dict[str, Any] = {}
+        for kind, interceptors in (
+            ("request_interceptors", self._request_interceptors),
+            ("response_interceptors", self._response_interceptors),
+        ):
+            entries = []
+            calls = errors = 0
+            total_ms = 0.0
+            for i in sorted(interceptors.values(), key=lambda x: x.priority):
+                metrics = i.metrics
+                calls += metrics.calls
+                errors += metrics.errors
+                total_ms += metrics.total_ms
+                entries.append({"id": i.id, "plugin_name": i.plugin_name, "enabled": i.enabled, **metrics.to_dict()})
+                if i.plugin_name:
+                    plugin = plugins.setdefault(i.plugin_name, {"calls": 0, "errors": 0, "total_ms": 0.0})
+                    plugin["calls"] += metrics.calls
+                    plugin["errors"] += metrics.errors
+                    plugin["total_ms"] = round(plugin["total_ms"] + metrics.total_ms, 3)
+            result[kind] = {
+                "calls": calls,
+                "errors": errors,
+                "total_ms": round(total_ms, 3),
+                "interceptors": entries,
+            }
+        result["plugins"] = plugins
+        result["slow_threshold_ms"] = SLOW_INTERCEPTOR_MS
+        return result
+
+    def reset_metrics(self) -> None:
+        """清零所有拦截器的调用统计"""
+        for interceptors in (self._request_interceptors, self._response_interceptors):
+            for interceptor in interceptors.values():
+                interceptor.metrics = InterceptorMetrics()
+
+    def get_request_chain(self, enabled_plugins: Optional[List[str]] = None) -> Tuple[InterceptorEntry, ...]:
+        """获取对该 enabled_plugins 生效的请求拦截器链（按优先级排序）"""
+        return self._compile_chain("request", enabled_plugins)
+
+    def get_response_chain(self, enabled_plugins: Optional[List[str]] = None) -> Tuple[InterceptorEntry, ...]:
+        """获取对该 enabled_plugins 生效的响应拦截器链（按优先级排序）"""
+        return self._compile_chain("response", enabled_plugins)
     
     # ==================== 请求拦截器 ====================
     
@@ -252,6 +415,7 @@ class InterceptorRegistry:
             metadata=metadata or {},
         )
         self._request_interceptors[interceptor_id] = entry
+        self._invalidate_chains()
         logger.debug(f"Registered request interceptor: {interceptor_id} (priority={priority})")
         return entry
     
@@ -259,6 +423,7 @@ class InterceptorRegistry:
         """注销请求拦截器"""
         if interceptor_id in self._request_interceptors:
             del self._request_interceptors[interceptor_id]
+            self._invalidate_chains()
             logger.debug(f"Unregistered request interceptor: {interceptor_id}")
             return True
         return False
@@ -304,30 +469,21 @@ class InterceptorRegistry:
         Returns:
             (url, headers, payload) 经过所有拦截器处理后的结果
         """
-        interceptors = self.get_request_interceptors(enabled_only=True)
-        
-        # 解析 enabled_plugins，提取插件名（忽略参数部分用于过滤）
-        enabled_plugin_names = None
-        if enabled_plugins is not None:
-            enabled_plugin_names = set(parse_enabled_plugins(enabled_plugins).keys())
-        
-        for interceptor in interceptors:
-            # 如果拦截器属于某个插件，需要该插件被显式启用
-            # enabled_plugins 为 None 或空列表时，跳过所有插件拦截器
-            if interceptor.plugin_name:
-                if not enabled_plugin_names or interceptor.plugin_name not in enabled_plugin_names:
-                    continue
-            
+        for interceptor in self.get_request_chain(enabled_plugins):
+            started = time.perf_counter()
             try:
                 result = await interceptor.callback(request, engine, provider, api_key, url, headers, payload)
-                if result is not None:
-                    if isinstance(result, tuple) and len(result) == 3:
-                        url, headers, payload = result
-                    else:
-                        logger.warning(f"Request interceptor '{interceptor.id}' returned invalid result, expected (url, headers, payload)")
             except Exception as e:
+                self._record_call("request", interceptor, started, e)
                 logger.error(f"Request interceptor '{interceptor.id}' error: {e}")
                 # 继续执行其他拦截器
+                continue
+            self._record_call("request", interceptor, started)
+            if result is not None:
+                if isinstance(result, tuple) and len(result) == 3:
+                    url, headers, payload = result
+                else:
+                    logger.warning(f"Request interceptor '{interceptor.id}' returned invalid result, expected (url, headers, payload)")
         
         return url, headers, payload
     
@@ -368,6 +524,7 @@ class InterceptorRegistry:
             metadata=metadata or {},
         )
         self._response_interceptors[interceptor_id] = entry
+        self._invalidate_chains()
         logger.debug(f"Registered response interceptor: {interceptor_id} (priority={priority})")
         return entry
     
@@ -375,6 +532,7 @@ class InterceptorRegistry:
         """注销响应拦截器"""
         if interceptor_id in self._response_interceptors:
             del self._response_interceptors[interceptor_id]
+            self._invalidate_chains()
             logger.debug(f"Unregistered response interceptor: {interceptor_id}")
             return True
         return False
@@ -414,27 +572,18 @@ class InterceptorRegistry:
         Returns:
             经过所有拦截器处理后的响应数据
         """
-        interceptors = self.get_response_interceptors(enabled_only=True)
-        
-        # 解析 enabled_plugins，提取插件名（忽略参数部分用于过滤）
-        enabled_plugin_names = None
-        if enabled_plugins is not None:
-            enabled_plugin_names = set(parse_enabled_plugins(enabled_plugins).keys())
-        
-        for interceptor in interceptors:
-            # 如果拦截器属于某个插件，需要该插件被显式启用
-            # enabled_plugins 为 None 或空列表时，跳过所有插件拦截器
-            if interceptor.plugin_name:
-                if not enabled_plugin_names or interceptor.plugin_name not in enabled_plugin_names:
-                    continue
-            
+        for interceptor in self.get_response_chain(enabled_plugins):
+            started = time.perf_counter()
             try:
                 result = await interceptor.callback(response_chunk, engine, model, is_stream)
-                if result is not None:
-                    response_chunk = result
             except Exception as e:
+                self._record_call("response", interceptor, started, e)
                 logger.error(f"Response interceptor '{interceptor.id}' error: {e}")
                 # 继续执行其他拦截器
+                continue
+            self._record_call("response", interceptor, started)
+            if result is not None:
+                response_chunk = result
         
         return response_chunk
     
@@ -444,6 +593,7 @@ class InterceptorRegistry:
         """启用请求拦截器"""
         if interceptor_id in self._request_interceptors:
             self._request_interceptors[interceptor_id].enabled = True
+            self._invalidate_chains()
             return True
         return False
     
@@ -451,6 +601,7 @@ class InterceptorRegistry:
         """禁用请求拦截器"""
         if interceptor_id in self._request_interceptors:
             self._request_interceptors[interceptor_id].enabled = False
+            self._invalidate_chains()
             return True
         return False
     
@@ -458,6 +609,7 @@ class InterceptorRegistry:
         """启用响应拦截器"""
         if interceptor_id in self._response_interceptors:
             self._response_interceptors[interceptor_id].enabled = True
+            self._invalidate_chains()
             return True
         return False
     
@@ -465,6 +617,7 @@ class InterceptorRegistry:
         """禁用响应拦截器"""
         if interceptor_id in self._response_interceptors:
             self._response_interceptors[interceptor_id].enabled = False
+            self._invalidate_chains()
             return True
         return False
     
@@ -495,6 +648,7 @@ class InterceptorRegistry:
             count += 1
         
         if count > 0:
+            self._invalidate_chains()
             logger.debug(f"Unregistered {count} interceptors for plugin: {plugin_name}")
         
         return count
@@ -577,6 +731,7 @@ class InterceptorRegistry:
         """清空所有拦截器"""
         self._request_interceptors.clear()
         self._response_interceptors.clear()
+        self._invalidate_chains()
 
 
 # 全局拦截器注册表实例
@@ -653,6 +808,11 @@ async def apply_request_interceptors(
     )
 
 
+def has_response_interceptors(enabled_plugins: Optional[List[str]] = None) -> bool:
+    """是否有对该 enabled_plugins 生效的响应拦截器（流式热路径据此跳过逐 chunk 调用）"""
+    return bool(get_interceptor_registry().get_response_chain(enabled_plugins))
+
+
 async def apply_response_interceptors(
     response_chunk: Any,
     engine: str,
@@ -0,0 +1,104 @@
+"""
+插件流式处理工具
+
+提供在流式响应中按标签拆分思维链与正文的增量解析器，供插件共享使用。
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+REASONING = "reasoning"
+CONTENT = "content"
+
+
+class ThinkingTagSplitter:
+    """
+    增量思维链标签拆分器
+
+    跨 chunk 维护一个小状态机：在思维链内查找结束标签，在思维链外查找开始标签，
+    标签被 chunk 边界截断时只保留可能构成标签前缀的尾部。每个 chunk 只扫描一次，
+    不会回头重扫已输出的文本。
+
+    用法：
+    ```python
+    splitter = ThinkingTagSplitter("<think>", "</think>")
+    for kind, text in splitter.feed(delta_text):
+        ...  # kind 为 "reasoning" 或 "content"
+    for kind, text in splitter.flush():
+        ...
+    ```
+    """
+
+    def __init__(
+        self,
+        open_tag: Optional[str] = "<thinking>",
+        close_tag: str = "</thinking>",
+        start_inside: bool = False,
+    ):
+        """
+        Args:
+            open_tag: 思维链开始标签；为 None 时只识别一次结束标签，之后全部视为正文
+                      （适用于已预填充开始标签的场景）
+            close_tag: 思维链结束标签
+            start_inside: 初始是否处于思维链内
+        """
+        self.inside = start_inside
+        self._pending = ""
+        self._open = self._compile(open_tag)
+        self._close = self._compile(close_tag)
+
+    @staticmethod
+    def _compile(tag: Optional[str]) -> Optional[Tuple["re.Pattern", str]]:
+        if not tag:
+            return None
+        return re.compile(re.escape(tag), re.IGNORECASE), tag.lower()
+
+    @staticmethod
+    def _partial_tag_length(text: str, start: int, tag_lower: str) -> int:
+        """text 末尾可能是标签前缀的最长长度（不含完整标签）"""
+        max_len = min(len(tag_lower) - 1, len(text) - start)
+        if max_len <= 0 or tag_lower[0] not in text[-max_len:].lower():
+            return 0
+        for length in range(max_len, 0, -1):
+            if text[-length:].lower() == tag_lower[:length]:
+                return length
+        return 0
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """
+        输入一段增量文本，返回可以立即输出的 (类型, 文本) 片段列表
+        """
+        if not text:
+            return []
+        buf = self._pending + text if self._pending else text
+        self._pending = ""
+        segments: List[Tuple[str, str]] = []
+        pos = 0
+        while pos < len(buf):
+            tag = self._close if self.inside else self._open
+            kind = REASONING if self.inside else CONTENT
+            if tag is None:
+                segments.append((kind, buf[pos:]))
+                break
+            pattern, tag_lower = tag
+            match = pattern.search(buf, pos)
+            if match:
+                if match.start() > pos:
+                    segments.append((kind, buf[pos:match.start()]))
+                self.inside = not self.inside
+                pos = match.end()
+                continue
+            keep = self._partial_tag_length(buf, pos, tag_lower)
+            end = len(buf) - keep
+            if end > pos:
+                segments.append((kind, buf[pos:end]))
+            self._pending = buf[end:]
+            break
+        return segments
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """流结束时输出残留的尾部（不完整的标签按当前类型原样输出）"""
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, ""
+        return [(REASONING if self.inside else CONTENT, pending)]
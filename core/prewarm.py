@@ -0,0 +1,118 @@
+"""
+上游连接预热
+
+启动时（以及之后按固定间隔）向每个已配置渠道的 base_url + proxy 预先建立少量连接，
+使部署后或长时间空闲后的第一个请求不必再承担 DNS / TCP / TLS（经 socks 代理时尤甚）的建连耗时。
+
+环境变量：
+- CONNECTION_PREWARM：是否开启，默认关闭
+- CONNECTION_PREWARM_CONNECTIONS：每个目标保持的空闲连接数，默认 1
+- CONNECTION_PREWARM_INTERVAL：保温间隔（秒），默认 60，<=0 表示只在启动时预热一次
+
+空闲连接默认 5 秒即被回收（CLIENT_POOL_KEEPALIVE_EXPIRY），早于下一次保温就被关闭的连接只会
+徒增上游流量。开启保温时默认的 keepalive_expiry 延长为保温间隔 + CLIENT_POOL_KEEPALIVE_EXPIRY；
+渠道通过 http_pool.keepalive_expiry 显式设置了更短的值时，启动时给出警告。
+"""
+
+import os
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.env import env_bool
+from core.log_config import logger
+from utils import safe_get
+from core.client_manager import CLIENT_POOL_KEEPALIVE_EXPIRY, get_connection_options
+
+PREWARM_CONNECTIONS = int(os.getenv("CONNECTION_PREWARM_CONNECTIONS", 1))
+PREWARM_INTERVAL = float(os.getenv("CONNECTION_PREWARM_INTERVAL", 60))
+# 同时进行预热的目标数上限
+_PREWARM_CONCURRENCY = 16
+
+
+def prewarm_enabled() -> bool:
+    return env_bool("CONNECTION_PREWARM", False)
+
+
+def collect_prewarm_targets(config: Optional[Dict[str, Any]]) -> List[Tuple[str, Optional[str], Optional[dict]]]:
+    """
+    收集需要预热的 (base_url, proxy, pool_options)，proxy / pool_options 的取值与 process_request 一致
+
+    跳过已禁用的渠道，同一 host + proxy + 连接池参数只保留一个。
+    """
+    targets = []
+    seen = set()
+    for provider in safe_get(config, "providers", default=[]) or []:
+        if provider.get("enabled") is False:
+            continue
+        base_url = provider.get("base_url") or ""
+        if not base_url.startswith(("http://", "https://")):
+            continue
+        proxy, pool_options = get_connection_options(provider, config)
+        host = base_url.split("/")[2]
+        key = (host, proxy, repr(sorted(pool_options.items())) if isinstance(pool_options, dict) else None)
+        if key in seen:
+            continue
+        seen.add(key)
+        targets.append((base_url, proxy, pool_options))
+    return targets
+
+
+async def prewarm_connections(app) -> int:
+    """
+    对当前配置中的全部目标预热一次
+
+    Returns:
+        新建立的连接数
+    """
+    client_manager = getattr(app.state, "client_manager", None)
+    if client_manager is None:
+        return 0
+    targets = collect_prewarm_targets(getattr(app.state, "config", None))
+    semaphore = asyncio.Semaphore(_PREWARM_CONCURRENCY)
+
+    async def warm(base_url: str, proxy: Optional[str], pool_options: Optional[dict]) -> int:
+        async with semaphore:
+            try:
+                return await client_manager.prewarm(base_url, proxy, pool_options, connections=PREWARM_CONNECTIONS)
+            except Exception as e:
+                logger.debug(f"Connection prewarm to {base_url} failed: {e}")
+                return 0
+
+    opened = await asyncio.gather(*(warm(*target) for target in targets))
+    return sum(opened)
+
+
+def extend_keepalive_for_prewarm(app) -> None:
+    """让预热的空闲连接保留到下一次保温之后；显式设置了更短 keepalive_expiry 的目标给出警告"""
+    if PREWARM_INTERVAL <= 0:
+        return
+    client_manager = getattr(app.state, "client_manager", None)
+    if client_manager is not None:
+        client_manager.keepalive_expiry = max(
+            client_manager.keepalive_expiry, PREWARM_INTERVAL + CLIENT_POOL_KEEPALIVE_EXPIRY
+        )
+    for base_url, _, pool_options in collect_prewarm_targets(getattr(app.state, "config", None)):
+        keepalive_expiry = pool_options.get("keepalive_expiry") if isinstance(pool_options, dict) else None
+        if keepalive_expiry is not None and float(keepalive_expiry) <= PREWARM_INTERVAL:
+            logger.warning(
+                f"Connection prewarm for {base_url}: http_pool.keepalive_expiry={keepalive_expiry}s is not longer "
+                f"than CONNECTION_PREWARM_INTERVAL={PREWARM_INTERVAL}s, warmed connections will expire before the next tick"
+            )
+
+
+async def run_keep_warm(app) -> None:
+    """启动时预热一次，之后按 PREWARM_INTERVAL 周期性补足空闲连接"""
+    extend_keepalive_for_prewarm(app)
+    try:
+        opened = await prewarm_connections(app)
+        logger.info(f"Connection prewarm: opened {opened} connections")
+    except Exception as e:
+        logger.error(f"Connection prewarm failed: {e}")
+    if PREWARM_INTERVAL <= 0:
+        return
+    while True:
+        await asyncio.sleep(PREWARM_INTERVAL)
+        try:
+            await prewarm_connections(app)
+        except Exception as e:
+            logger.error(f"Error in connection keep-warm task: {e}")
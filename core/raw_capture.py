@@ -0,0 +1,163 @@
+"""
+原始数据采集策略
+
+在读取/截断任何请求体之前决定本次请求的采集方式：
+- full：完整采集请求头、请求体、上游请求/响应与返回给用户的响应（旧行为）
+- failures：只保存对原始数据的引用，不做解码/截断；请求失败时才在写入统计前物化
+- none：完全不采集
+
+配置（均位于 preferences，API Key 级 preferences 优先于全局）：
+- log_raw_data_retention_hours：保留时间（小时），0 表示不采集
+- log_raw_data_sample_rate：成功请求的采样率，0~1（大于 1 按百分比处理），默认 1；
+  也可写成 {模型前缀: 采样率, "default": 采样率} 按模型配置
+- log_raw_data_capture_failures：未被采样的请求失败时是否仍然采集，默认 true
+"""
+
+import json
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from utils import safe_get
+from core.log_config import logger
+from core.utils import ApiKeySettings, truncate_for_logging
+
+CAPTURE_FULL = "full"
+CAPTURE_FAILURES = "failures"
+CAPTURE_NONE = "none"
+
+# request_info 中保存待物化原始数据引用的键（不会写入数据库）
+PENDING_CAPTURE_KEY = "_raw_capture_pending"
+
+_SENSITIVE_HEADERS = {"authorization", "x-api-key", "api-key", "x-goog-api-key"}
+
+# 独立的随机数生成器：core.utils 中的部分函数会对全局 random 重新播种
+_sampler = random.Random()
+
+
+def _normalize_rate(value: Any) -> Optional[float]:
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        return None
+    if rate > 1:
+        rate = rate / 100
+    return min(max(rate, 0.0), 1.0)
+
+
+def _rate_for_model(setting: Any, model: Optional[str]) -> Optional[float]:
+    if isinstance(setting, dict):
+        if model:
+            for prefix, value in setting.items():
+                if prefix != "default" and model.startswith(prefix):
+                    return _normalize_rate(value)
+        return _normalize_rate(setting.get("default"))
+    return _normalize_rate(setting)
+
+
+def _get_preference(config: dict, api_index: Optional[int], name: str, key_settings: Optional[ApiKeySettings] = None) -> Any:
+    """
+    读取 API Key / 全局 preferences（safe_get 会把 0 / False 当作缺失，这里需要区分）
+
+    key_settings 为调用方已取得的预编译配置；未传入时按 api_index 从 config 读取。
+    """
+    if key_settings is None and api_index is not None:
+        key_settings = ApiKeySettings.from_config(api_index, safe_get(config, "api_keys", api_index, default={}))
+    if key_settings is not None and key_settings.preference(name) is not None:
+        return key_settings.preference(name)
+    global_prefs = safe_get(config, "preferences", default={})
+    if isinstance(global_prefs, dict):
+        return global_prefs.get(name)
+    return None
+
+
+def get_sample_rate(config: dict, api_index: Optional[int], model: Optional[str], key_settings: Optional[ApiKeySettings] = None) -> float:
+    """获取成功请求的采样率，优先级：API Key preferences > 全局 preferences > 1"""
+    setting = _get_preference(config, api_index, "log_raw_data_sample_rate", key_settings)
+    rate = _rate_for_model(setting, model) if setting is not None else None
+    return 1.0 if rate is None else rate
+
+
+def decide_capture(
+    config: dict,
+    api_index: Optional[int],
+    model: Optional[str],
+    retention_hours,
+    key_settings: Optional[ApiKeySettings] = None,
+) -> str:
+    """决定本次请求的原始数据采集方式"""
+    try:
+        if float(retention_hours or 0) <= 0:
+            return CAPTURE_NONE
+    except (TypeError, ValueError):
+        return CAPTURE_NONE
+
+    rate = get_sample_rate(config, api_index, model, key_settings)
+    if rate >= 1 or (rate > 0 and _sampler.random() < rate):
+        return CAPTURE_FULL
+
+    capture_failures = _get_preference(config, api_index, "log_raw_data_capture_failures", key_settings)
+    return CAPTURE_NONE if capture_failures is False else CAPTURE_FAILURES
+
+
+def start_deferred_capture(info: Dict[str, Any], retention_hours, request_headers: dict, request_body: bytes) -> None:
+    """失败采集模式：只保存引用，不复制、不截断"""
+    info[PENDING_CAPTURE_KEY] = {
+        "retention_hours": retention_hours,
+        "request_headers": request_headers,
+        "request_body": request_body,
+    }
+
+
+def defer_capture(info: Optional[Dict[str, Any]], **fields: Any) -> bool:
+    """
+    在失败采集模式下记录原始数据引用
+
+    Returns:
+        本次请求处于失败采集模式时返回 True
+    """
+    if not info:
+        return False
+    pending = info.get(PENDING_CAPTURE_KEY)
+    if pending is None:
+        return False
+    pending.update(fields)
+    return True
+
+
+def _safe_headers_json(headers: Optional[dict]) -> Optional[str]:
+    if not headers:
+        return None
+    safe_headers = {k: v for k, v in headers.items() if str(k).lower() not in _SENSITIVE_HEADERS}
+    return json.dumps(safe_headers, ensure_ascii=False)
+
+
+def _materialize(pending: Dict[str, Any]) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {"request_headers": _safe_headers_json(pending.get("request_headers"))}
+    if pending.get("request_body"):
+        fields["request_body"] = truncate_for_logging(pending["request_body"])
+    if pending.get("upstream_request_headers") is not None:
+        fields["upstream_request_headers"] = _safe_headers_json(pending["upstream_request_headers"])
+    upstream_payload = pending.get("upstream_request_body")
+    if isinstance(upstream_payload, dict):
+        fields["upstream_request_body"] = truncate_for_logging(
+            {k: v for k, v in upstream_payload.items() if k != "file"}
+        )
+    if pending.get("upstream_response_body") is not None:
+        fields["upstream_response_body"] = truncate_for_logging(pending["upstream_response_body"])
+    return fields
+
+
+async def finalize_capture(info: Dict[str, Any]) -> None:
+    """写入统计前调用：失败采集模式下，请求失败时物化原始数据，否则丢弃引用"""
+    pending = info.pop(PENDING_CAPTURE_KEY, None)
+    if pending is None or info.get("success"):
+        return
+    try:
+        fields = await asyncio.to_thread(_materialize, pending)
+    except Exception as e:
+        logger.error(f"Error materializing deferred raw data capture: {str(e)}")
+        return
+    info.update({k: v for k, v in fields.items() if v is not None})
+    info["raw_data_expires_at"] = datetime.now(timezone.utc) + timedelta(hours=float(pending["retention_hours"]))
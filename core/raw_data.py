@@ -0,0 +1,110 @@
+"""
+日志原始数据侧表
+
+request_stats 主表只保留摘要字段，请求头 / 请求体 / 响应体等大字段压缩后写入
+request_raw_data 侧表（每个字段一行），仅在查看日志详情时按需加载，并按 expires_at 独立过期。
+
+D1 后端不使用侧表，原始数据仍内联在 request_stats 中。
+旧版本写入的内联数据在读取时作为兜底，直到被过期清理。
+"""
+
+import gzip
+import asyncio
+from typing import Dict, List, Any, Optional
+
+from sqlalchemy import select
+
+from db import RequestRawData, DB_TYPE, DISABLE_DATABASE
+
+# 写入侧表的大字段（retry_path 较小且用于列表展示，仍保留在主表）
+RAW_BODY_FIELDS = (
+    "request_headers",
+    "request_body",
+    "upstream_request_headers",
+    "upstream_request_body",
+    "upstream_response_body",
+    "response_body",
+)
+
+_ENCODING_GZIP = "gzip"
+# 超过该大小的数据在线程中压缩，避免阻塞事件循环
+_THREAD_COMPRESS_THRESHOLD = 64 * 1024
+
+
+def raw_side_table_enabled() -> bool:
+    """当前数据库后端是否使用原始数据侧表"""
+    return not DISABLE_DATABASE and (DB_TYPE or "sqlite").lower() != "d1"
+
+
+def compress_text(text: str) -> bytes:
+    return gzip.compress(text.encode("utf-8"), compresslevel=6, mtime=0)
+
+
+def decompress_text(data: bytes, encoding: str) -> str:
+    if encoding == _ENCODING_GZIP:
+        return gzip.decompress(data).decode("utf-8", errors="replace")
+    raise ValueError(f"Unsupported raw data encoding: {encoding}")
+
+
+def _build_rows(fields: Dict[str, str], expires_at) -> List[Dict[str, Any]]:
+    return [
+        {
+            "field": field,
+            "encoding": _ENCODING_GZIP,
+            "data": compress_text(value),
+            "expires_at": expires_at,
+        }
+        for field, value in fields.items()
+    ]
+
+
+def pop_raw_fields(info: Dict[str, Any]) -> Dict[str, str]:
+    """从统计字典中取出非空的大字段（原字典中删除这些键）"""
+    fields = {}
+    for field in RAW_BODY_FIELDS:
+        value = info.pop(field, None)
+        if value is None or value == "":
+            continue
+        fields[field] = value.replace('\x00', '') if isinstance(value, str) else str(value)
+    return fields
+
+
+async def build_raw_rows(fields: Dict[str, str], expires_at) -> List[Dict[str, Any]]:
+    """压缩大字段，返回待写入侧表的行（不含 log_id）"""
+    if not fields:
+        return []
+    total_size = sum(len(v) for v in fields.values())
+    if total_size >= _THREAD_COMPRESS_THRESHOLD:
+        return await asyncio.to_thread(_build_rows, fields, expires_at)
+    return _build_rows(fields, expires_at)
+
+
+def add_raw_rows(session, log_id: int, rows: List[Dict[str, Any]]) -> None:
+    """在调用方事务内写入侧表"""
+    for row in rows:
+        session.add(RequestRawData(log_id=log_id, **row))
+
+
+async def load_raw_fields(session, log_id: int) -> Dict[str, str]:
+    """读取并解压某条日志的全部原始数据字段"""
+    result = await session.execute(
+        select(RequestRawData.field, RequestRawData.encoding, RequestRawData.data)
+        .where(RequestRawData.log_id == log_id)
+    )
+    rows = result.fetchall()
+    if not rows:
+        return {}
+    return await asyncio.to_thread(
+        lambda: {row.field: decompress_text(row.data, row.encoding) for row in rows}
+    )
+
+
+def merge_inline_fields(raw_fields: Dict[str, str], row: Any) -> Dict[str, Optional[str]]:
+    """侧表优先，缺失的字段回退到主表中旧版本写入的内联数据"""
+    merged: Dict[str, Optional[str]] = {}
+    for field in RAW_BODY_FIELDS:
+        value = raw_fields.get(field)
+        if value is None:
+            value = getattr(row, field, None) if not isinstance(row, dict) else row.get(field)
+        merged[field] = value
+    return merged
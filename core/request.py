@@ -5,11 +5,16 @@
 所有渠道通过 channels 模块的注册中心获取适配器
 """
 
+import copy
+import json
+
 from .models import RequestModel, Message
 from .utils import (
     get_engine,
     get_model_dict,
     safe_get,
+    collect_image_urls,
+    prefetch_images,
 )
 from .plugins.interceptors import apply_request_interceptors
 
@@ -62,34 +67,111 @@ def _prepend_system_prompt(request: RequestModel, system_prompt: str) -> Request
                 else:
                     new_content = system_prompt
                 
-                new_msg = Message(
-                    role=msg.role,
-                    name=msg.name,
-                    content=new_content,
-                    tool_calls=msg.tool_calls,
-                    tool_call_id=msg.tool_call_id
-                )
-                new_messages.append(new_msg)
+                new_messages.append(msg.model_copy(update={"content": new_content}))
                 system_prepended = True
             else:
                 new_messages.append(msg)
-        
-        # 创建新的请求对象
-        request_dict = request.model_dump(exclude={'messages'})
-        request_dict['messages'] = [m.model_dump() if hasattr(m, 'model_dump') else m for m in new_messages]
-        return RequestModel(**request_dict)
     else:
         # 如果没有 system 消息，在消息列表开头插入一个新的 system 消息
         system_message = Message(role="system", content=system_prompt)
         new_messages = [system_message] + list(request.messages)
-        
-        # 创建新的请求对象
-        request_dict = request.model_dump(exclude={'messages'})
-        request_dict['messages'] = [m.model_dump() if hasattr(m, 'model_dump') else m for m in new_messages]
-        return RequestModel(**request_dict)
 
+    # 浅复制请求对象：只替换消息列表，其余消息（含 base64 图片）与原请求共享，不做序列化往返
+    return request.model_copy(update={"messages": new_messages})
+
+
+class PayloadCache:
+    """
+    单次请求内的 payload 构建缓存
+
+    重试/故障转移时，同一引擎、渠道适配器读取的配置相同的候选渠道会复用渠道适配器的构建结果
+    （系统提示词合并、图片处理、工具转换等），只重新应用 key、参数覆写和请求拦截器。
+    指纹只包含 BUILD_FIELDS / BUILD_PREFERENCES 中适配器实际读取的字段，渠道名、key、
+    权重、限流、代理等不影响构建的配置不同的兄弟渠道也能复用；适配器新增读取的 provider
+    字段时需同步加入这两个列表。
+
+    生命周期与一次 request_model 调用相同，不跨请求共享。
+    """
+
+    # 渠道适配器（含 get_model_dict / get_tools_mode）读取的 provider 顶层字段
+    BUILD_FIELDS = (
+        "base_url", "model", "model_prefix", "tools", "image", "engine",
+        "project_id", "client_email", "private_key", "aws_access_key", "aws_secret_key", "account_id",
+    )
+    # 渠道适配器读取的 preferences 字段（system_prompt 已合并进请求，由请求 id 区分）
+    BUILD_PREFERENCES = ("post_body_parameter_overrides", "transforms", "route")
 
-async def get_payload(request: RequestModel, engine, provider, api_key=None):
+    def __init__(self):
+        self._prepared: dict = {}
+        self._built: dict = {}
+        self._fingerprints: dict = {}
+        self.hits = 0
+        self.misses = 0
+
+    def provider_fingerprint(self, provider: dict) -> str:
+        """provider 中渠道适配器实际读取的配置指纹"""
+        cached = self._fingerprints.get(id(provider))
+        if cached is not None and cached[0] is provider:
+            return cached[1]
+        preferences = provider.get("preferences") or {}
+        body_fields = {
+            "fields": {k: provider[k] for k in self.BUILD_FIELDS if k in provider},
+            "preferences": {
+                k: preferences[k] for k in self.BUILD_PREFERENCES
+                if isinstance(preferences, dict) and k in preferences
+            },
+        }
+        fingerprint = json.dumps(body_fields, sort_keys=True, ensure_ascii=False, default=str)
+        self._fingerprints[id(provider)] = (provider, fingerprint)
+        return fingerprint
+
+    def get_prepared_request(self, request: RequestModel, system_prompt) -> RequestModel:
+        """合并渠道系统提示词后的请求（同一提示词只重建一次）"""
+        key = (id(request), str(system_prompt), request.stream)
+        cached = self._prepared.get(key)
+        if cached is not None and cached[0] is request:
+            return cached[1]
+        prepared = _prepend_system_prompt(request, system_prompt)
+        self._prepared[key] = (request, prepared)
+        return prepared
+
+    def get_built(self, key, api_key):
+        """
+        获取已构建的 (url, headers, payload) 副本
+
+        key 不同时，只在渠道通过 auth_header 模板认证、且 key 仅出现在该认证头中时，
+        按模板重新生成认证头后复用；其余情况（签名类认证、key 出现在 URL 中等）不跨 key 复用。
+        """
+        entry = self._built.get(key)
+        if entry is None:
+            return None
+        cached_key, url, headers, payload, auth_channel = entry
+        if cached_key != api_key:
+            if auth_channel is None or not isinstance(api_key, str) or not api_key:
+                return None
+            header_name, header_value = auth_channel.build_auth_header(api_key)
+            headers = {**headers, header_name: header_value}
+        self.hits += 1
+        return url, dict(headers), copy.deepcopy(payload)
+
+    def put_built(self, key, channel, api_key, url, headers, payload) -> None:
+        self.misses += 1
+        self._built[key] = (api_key, url, dict(headers), copy.deepcopy(payload), self._auth_channel(channel, api_key, url, headers))
+
+    @staticmethod
+    def _auth_channel(channel, api_key, url, headers):
+        """构建结果能否通过渠道的认证头模板换 key：返回渠道定义，否则返回 None"""
+        if channel is None or not isinstance(api_key, str) or not api_key or api_key in url:
+            return None
+        auth = channel.build_auth_header(api_key)
+        if auth is None or headers.get(auth[0]) != auth[1]:
+            return None
+        if any(isinstance(v, str) and api_key in v for k, v in headers.items() if k != auth[0]):
+            return None
+        return channel
+
+
+async def get_payload(request: RequestModel, engine, provider, api_key=None, payload_cache: "PayloadCache" = None):
     """
     通过渠道注册中心获取请求适配器并构建 payload
     
@@ -98,6 +180,7 @@ async def get_payload(request: RequestModel, engine, provider, api_key=None):
         engine: 引擎类型 (openai, gemini, claude, azure, aws, vertex-gemini, vertex-claude, openrouter, cloudflare)
         provider: 提供商配置
         api_key: API 密钥
+        payload_cache: 单次请求内的构建缓存（重试时复用渠道适配器的构建结果）
         
     Returns:
         tuple: (url, headers, payload)
@@ -106,8 +189,11 @@ async def get_payload(request: RequestModel, engine, provider, api_key=None):
     
     # 检查渠道是否配置了系统提示词，如果有则追加到请求中
     channel_system_prompt = safe_get(provider, "preferences", "system_prompt", default=None)
-    if channel_system_prompt:
-        request = _prepend_system_prompt(request, channel_system_prompt)
+    if channel_system_prompt and getattr(request, "messages", None) is not None:
+        if payload_cache is not None:
+            request = payload_cache.get_prepared_request(request, channel_system_prompt)
+        else:
+            request = _prepend_system_prompt(request, channel_system_prompt)
      
     channel = get_channel(engine)
     
@@ -117,8 +203,25 @@ async def get_payload(request: RequestModel, engine, provider, api_key=None):
             provider = {**provider, 'base_url': channel.default_base_url}
     
     if channel and channel.request_adapter:
-        # 先由具体渠道适配器构建 URL / headers / payload
-        url, headers, payload = await channel.request_adapter(request, engine, provider, api_key)
+        built = None
+        build_key = None
+        if payload_cache is not None:
+            build_key = (engine, payload_cache.provider_fingerprint(provider), request.model, request.stream, id(request))
+            built = payload_cache.get_built(build_key, api_key)
+
+        if built is not None:
+            url, headers, payload = built
+        else:
+            # 渠道适配器按顺序逐个处理图片，这里先并发预取，后续直接命中图片缓存
+            if provider.get("image", True):
+                image_urls = collect_image_urls(getattr(request, "messages", None))
+                if len(image_urls) > 1:
+                    await prefetch_images(image_urls)
+
+            # 先由具体渠道适配器构建 URL / headers / payload
+            url, headers, payload = await channel.request_adapter(request, engine, provider, api_key)
+            if payload_cache is not None:
+                payload_cache.put_built(build_key, channel, api_key, url, headers, payload)
 
         # 统一应用参数覆写（支持 all/*、模型别名、原始模型名，且深度合并）
         overrides = safe_get(provider, "preferences", "post_body_parameter_overrides", default={})
@@ -13,6 +13,7 @@ from typing import Optional, List, Any
 from .log_config import logger
 from .middleware import request_info
 from .utils import safe_get, truncate_for_logging
+from .raw_capture import defer_capture
 
 
 async def check_response(response, error_log):
@@ -36,7 +37,8 @@ async def check_response(response, error_log):
         # 记录失败的上游响应（使用深度截断，保留结构同时限制大小）
         try:
             current_info = request_info.get()
-            if current_info and current_info.get("raw_data_expires_at") is not None:
+            deferred = defer_capture(current_info, upstream_response_body=error_str)
+            if not deferred and current_info and current_info.get("raw_data_expires_at") is not None:
                 current_info["upstream_response_body"] = truncate_for_logging(error_str)
         except Exception as e:
             logger.error(f"Error saving upstream error response: {str(e)}")
@@ -180,10 +182,12 @@ async def fetch_response_stream(
     通过渠道注册中心获取流式响应适配器并处理响应流
     """
     from .channels import get_channel
-    from .plugins.interceptors import apply_response_interceptors
+    from .plugins.interceptors import apply_response_interceptors, has_response_interceptors
     
     channel = get_channel(engine)
     if channel and channel.stream_adapter:
+        # 拦截器链为空时整条流都不再逐 chunk 进入拦截器
+        intercept = has_response_interceptors(enabled_plugins)
         async for chunk in channel.stream_adapter(client, url, headers, payload, model, timeout):
             # 如果适配器返回的是字典且包含 error，则它是一个预处理过的错误
             if isinstance(chunk, dict) and "error" in chunk:
@@ -191,7 +195,8 @@ async def fetch_response_stream(
                 continue
                 
             # 应用响应拦截器
-            chunk = await apply_response_interceptors(chunk, engine, model, is_stream=True, enabled_plugins=enabled_plugins)
+            if intercept:
+                chunk = await apply_response_interceptors(chunk, engine, model, is_stream=True, enabled_plugins=enabled_plugins)
             yield chunk
         
         return
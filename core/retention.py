@@ -0,0 +1,255 @@
+"""
+日志保留与原始数据过期清理
+
+所有清理都按主键区间分批执行：
+- 先通过索引（timestamp / raw_data_expires_at）定位待处理行的主键范围
+- 每批只处理 RETENTION_BATCH_SIZE 个主键，单独提交事务并持有 db_semaphore
+- 批次之间短暂让出，保证 update_stats 等实时写入不会被长时间阻塞
+"""
+
+import os
+import asyncio
+from datetime import datetime
+from typing import Optional, Callable, Awaitable
+
+from sqlalchemy import select, update, delete, func, or_
+
+from core.log_config import logger
+from db import RequestStat, ChannelStat, RequestRawData, async_session_scope, DB_TYPE
+
+# 每批处理的主键区间大小
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 1000))
+# 批次之间的暂停时间（秒）
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.1))
+# 每处理多少批输出一次进度日志
+_PROGRESS_LOG_EVERY = 50
+
+RAW_DATA_COLUMNS = (
+    "request_headers",
+    "request_body",
+    "upstream_request_headers",
+    "upstream_request_body",
+    "upstream_response_body",
+    "response_body",
+    "retry_path",
+)
+
+# 上一次原始数据清理的时间点；只需处理 [上次, 本次) 之间新过期的行
+_raw_data_cleaned_until: Optional[datetime] = None
+
+
+def _is_d1() -> bool:
+    return (DB_TYPE or "sqlite").lower() == "d1"
+
+
+def _row_count(result) -> int:
+    if isinstance(result, dict):
+        return int((result.get("meta") or {}).get("changes") or 0)
+    return int(getattr(result, "rowcount", 0) or 0)
+
+
+async def _run_in_id_batches(
+    label: str,
+    id_range: Optional[tuple[int, int]],
+    run_batch: Callable[[int, int], Awaitable[int]],
+) -> int:
+    """
+    在 [low, high] 主键范围内按 RETENTION_BATCH_SIZE 分批执行 run_batch(lo, hi)
+
+    Returns:
+        受影响的总行数
+    """
+    if not id_range:
+        return 0
+    from core.stats import db_semaphore
+
+    low, high = id_range
+    total = 0
+    batches = 0
+    cursor = low
+    while cursor <= high:
+        upper = min(cursor + RETENTION_BATCH_SIZE - 1, high)
+        async with db_semaphore:
+            total += await run_batch(cursor, upper)
+        batches += 1
+        cursor = upper + 1
+
+        if batches % _PROGRESS_LOG_EVERY == 0:
+            logger.info(f"{label}: processed id {upper}/{high}, affected {total} rows so far")
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+    return total
+
+
+# ============== 原始数据过期 ==============
+
+async def _raw_data_id_range(since: Optional[datetime], until: datetime) -> Optional[tuple[int, int]]:
+    if _is_d1():
+        from db import d1_client
+
+        sql = "SELECT MIN(id) AS low, MAX(id) AS high FROM request_stats WHERE raw_data_expires_at < ?"
+        params = [until]
+        if since is not None:
+            sql += " AND raw_data_expires_at >= ?"
+            params.append(since)
+        row = await d1_client.query_one(sql, params) or {}
+        low, high = row.get("low"), row.get("high")
+    else:
+        query = select(func.min(RequestStat.id), func.max(RequestStat.id)).where(
+            RequestStat.raw_data_expires_at < until
+        )
+        if since is not None:
+            query = query.where(RequestStat.raw_data_expires_at >= since)
+        async with async_session_scope() as session:
+            low, high = (await session.execute(query)).one()
+    if low is None or high is None:
+        return None
+    return int(low), int(high)
+
+
+async def purge_expired_raw_data(now: datetime) -> int:
+    """
+    清空已过期日志的原始数据字段（保留日志记录本身），并删除侧表中已过期的原始数据
+
+    主表内联字段每次只处理上一次清理之后新过期的行；进程启动后的第一次调用处理全部历史过期行。
+
+    Returns:
+        主表被清空的行数 + 侧表被删除的行数
+    """
+    global _raw_data_cleaned_until
+    since = _raw_data_cleaned_until
+    id_range = await _raw_data_id_range(since, now)
+
+    if _is_d1():
+        from db import d1_client
+
+        set_clause = ", ".join(f"{c} = NULL" for c in RAW_DATA_COLUMNS)
+        not_null_clause = " OR ".join(f"{c} IS NOT NULL" for c in RAW_DATA_COLUMNS)
+        sql = (
+            f"UPDATE request_stats SET {set_clause} "
+            "WHERE id BETWEEN ? AND ? AND raw_data_expires_at < ? "
+            f"AND ({not_null_clause})"
+        )
+
+        async def run_batch(low: int, high: int) -> int:
+            return _row_count(await d1_client.execute(sql, [low, high, now]))
+    else:
+        has_raw_data = or_(*(getattr(RequestStat, c).isnot(None) for c in RAW_DATA_COLUMNS))
+
+        async def run_batch(low: int, high: int) -> int:
+            async with async_session_scope() as session:
+                result = await session.execute(
+                    update(RequestStat)
+                    .where(RequestStat.id.between(low, high))
+                    .where(RequestStat.raw_data_expires_at < now)
+                    .where(has_raw_data)
+                    .values({c: None for c in RAW_DATA_COLUMNS})
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                return _row_count(result)
+
+    total = await _run_in_id_batches("Raw data cleanup", id_range, run_batch)
+    if not _is_d1():
+        total += await _purge_expired_raw_side_rows(now)
+    _raw_data_cleaned_until = now
+    return total
+
+
+async def _purge_expired_raw_side_rows(now: datetime) -> int:
+    """按 expires_at 索引定位并分批删除原始数据侧表中已过期的行"""
+    async with async_session_scope() as session:
+        low, high = (
+            await session.execute(
+                select(func.min(RequestRawData.id), func.max(RequestRawData.id))
+                .where(RequestRawData.expires_at < now)
+            )
+        ).one()
+    if low is None or high is None:
+        return 0
+
+    async def run_batch(low: int, high: int) -> int:
+        async with async_session_scope() as session:
+            result = await session.execute(
+                delete(RequestRawData)
+                .where(RequestRawData.id.between(low, high))
+                .where(RequestRawData.expires_at < now)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            return _row_count(result)
+
+    return await _run_in_id_batches("Raw data cleanup (request_raw_data)", (int(low), int(high)), run_batch)
+
+
+# ============== 日志保留 ==============
+
+async def _log_id_range(table_name: str, model, cutoff: datetime) -> Optional[tuple[int, int]]:
+    if _is_d1():
+        from db import d1_client
+
+        row = await d1_client.query_one(
+            f"SELECT MIN(id) AS low, MAX(id) AS high FROM {table_name} WHERE timestamp < ?",
+            [cutoff],
+        ) or {}
+        low, high = row.get("low"), row.get("high")
+    else:
+        async with async_session_scope() as session:
+            low, high = (
+                await session.execute(
+                    select(func.min(model.id), func.max(model.id)).where(model.timestamp < cutoff)
+                )
+            ).one()
+    if low is None or high is None:
+        return None
+    return int(low), int(high)
+
+
+async def _delete_logs_before(table_name: str, model, cutoff: datetime) -> int:
+    id_range = await _log_id_range(table_name, model, cutoff)
+
+    if _is_d1():
+        from db import d1_client
+
+        sql = f"DELETE FROM {table_name} WHERE id BETWEEN ? AND ? AND timestamp < ?"
+
+        async def run_batch(low: int, high: int) -> int:
+            return _row_count(await d1_client.execute(sql, [low, high, cutoff]))
+    else:
+        async def run_batch(low: int, high: int) -> int:
+            async with async_session_scope() as session:
+                if model is RequestStat:
+                    # 同批删除对应日志的原始数据侧表行
+                    await session.execute(
+                        delete(RequestRawData)
+                        .where(RequestRawData.log_id.between(low, high))
+                        .where(
+                            RequestRawData.log_id.in_(
+                                select(RequestStat.id)
+                                .where(RequestStat.id.between(low, high))
+                                .where(RequestStat.timestamp < cutoff)
+                            )
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                result = await session.execute(
+                    delete(model)
+                    .where(model.id.between(low, high))
+                    .where(model.timestamp < cutoff)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+                return _row_count(result)
+
+    return await _run_in_id_batches(f"Log retention ({table_name})", id_range, run_batch)
+
+
+async def delete_expired_logs(cutoff: datetime) -> tuple[int, int]:
+    """
+    分批删除 cutoff 之前的日志行（先 request_stats，再 channel_stats）
+
+    Returns:
+        (request_stats 删除行数, channel_stats 删除行数)
+    """
+    deleted_requests = await _delete_logs_before("request_stats", RequestStat, cutoff)
+    deleted_channels = await _delete_logs_before("channel_stats", ChannelStat, cutoff)
+    return deleted_requests, deleted_channels
@@ -15,7 +15,8 @@ from core.utils import (
     circular_list_encoder,
     provider_api_circular_list,
 )
-from utils import safe_get
+from utils import safe_get, get_local_models_list
+from core.config_snapshot import get_config_snapshot, get_api_key_settings, get_api_list, remember_provider_views
 
 if TYPE_CHECKING:
     from fastapi import FastAPI
@@ -140,11 +141,9 @@ async def get_provider_rules(
             models_list = []
 
             # api_keys 中 api 为 sk- 时，表示继承 api_keys，将 api_keys 中的 api key 当作 渠道
-            if provider_name.startswith("sk-") and provider_name in app.state.api_list:
-                if app.state.models_list.get(provider_name):
-                    models_list = app.state.models_list[provider_name]
-                else:
-                    models_list = []
+            api_list = get_api_list(app, config)
+            if provider_name.startswith("sk-") and provider_name in api_list:
+                models_list = get_local_models_list(app, config, api_list).get(provider_name) or []
             else:
                 for provider in config['providers']:
                     model_dict = provider["_model_dict_cache"]
@@ -185,6 +184,9 @@ def get_provider_list(
 ) -> List[Dict[str, Any]]:
     """
     根据 provider 规则列表生成 provider 配置列表
+
+    生成的 provider 视图按 (规则, 请求模型) 缓存在当前配置快照中，
+    同一代配置下的请求直接复用（视图为只读，调用方不要修改）。
     
     Args:
         provider_rules: provider 规则列表
@@ -195,79 +197,96 @@ def get_provider_list(
     Returns:
         provider 配置列表
     """
+    snapshot = get_config_snapshot(app)
+    cacheable = snapshot.config is config
+
     provider_list = []
-    
     for item in provider_rules:
-        provider_name = item.split("/")[0]
-        if provider_name.startswith("sk-") and provider_name in app.state.api_list:
-            # 加载本地聚合器 Key 的分组
-            try:
-                local_index = app.state.api_list.index(provider_name)
-                local_groups = safe_get(app.state.api_keys_db, local_index, "groups", default=["default"])
-            except ValueError:
-                local_groups = ["default"]
-            if isinstance(local_groups, str):
-                local_groups = [local_groups] if local_groups else ["default"]
-            if not isinstance(local_groups, list) or not local_groups:
-                local_groups = ["default"]
-
-            provider_list.append({
-                "provider": provider_name,
-                "base_url": "http://127.0.0.1:8000/v1/chat/completions",
-                "model": [{request_model: request_model}],
-                "tools": True,
-                "_model_dict_cache": {request_model: request_model},
-                "groups": local_groups,
-            })
-        else:
-            for provider in config['providers']:
-                model_dict = provider["_model_dict_cache"]
-                if not model_dict:
-                    continue
-                model_name_split = "/".join(item.split("/")[1:])
-                if "/" in item and provider['provider'] == provider_name and model_name_split in model_dict.keys():
-                    if request_model in model_dict.keys() and model_name_split == request_model:
-                        new_provider = {
-                            "provider": provider["provider"],
-                            "base_url": provider.get("base_url", ""),
-                            "api": provider.get("api", None),
-                            "model": [{model_dict[model_name_split]: request_model}],
-                            "preferences": provider.get("preferences", {}),
-                            "tools": provider.get("tools", False),
-                            "_model_dict_cache": provider["_model_dict_cache"],
-                            "project_id": provider.get("project_id", None),
-                            "private_key": provider.get("private_key", None),
-                            "client_email": provider.get("client_email", None),
-                            "cf_account_id": provider.get("cf_account_id", None),
-                            "aws_access_key": provider.get("aws_access_key", None),
-                            "aws_secret_key": provider.get("aws_secret_key", None),
-                            "engine": provider.get("engine", None),
-                            "groups": provider.get("groups", ["default"]),
-                        }
-                        provider_list.append(new_provider)
-
-                    elif request_model.endswith("*") and model_name_split.startswith(request_model.rstrip("*")):
-                        new_provider = {
-                            "provider": provider["provider"],
-                            "base_url": provider.get("base_url", ""),
-                            "api": provider.get("api", None),
-                            "model": [{model_dict[model_name_split]: request_model}],
-                            "preferences": provider.get("preferences", {}),
-                            "tools": provider.get("tools", False),
-                            "_model_dict_cache": provider["_model_dict_cache"],
-                            "project_id": provider.get("project_id", None),
-                            "private_key": provider.get("private_key", None),
-                            "client_email": provider.get("client_email", None),
-                            "cf_account_id": provider.get("cf_account_id", None),
-                            "aws_access_key": provider.get("aws_access_key", None),
-                            "aws_secret_key": provider.get("aws_secret_key", None),
-                            "engine": provider.get("engine", None),
-                            "groups": provider.get("groups", ["default"]),
-                        }
-                        provider_list.append(new_provider)
+        views = snapshot.provider_views.get((item, request_model)) if cacheable else None
+        if views is None:
+            views = _build_provider_views(item, config, request_model, app)
+            if cacheable:
+                remember_provider_views(snapshot, (item, request_model), views)
+        provider_list.extend(views)
     return provider_list
 
 
+def _build_provider_views(
+    item: str,
+    config: Dict[str, Any],
+    request_model: str,
+    app: "FastAPI"
+) -> List[Dict[str, Any]]:
+    """为单条 provider 规则生成 provider 视图列表"""
+    views = []
+    provider_name = item.split("/")[0]
+    # 与 config 同一代的 api_list：视图缓存在快照上，不能混入配置切换后的新一代
+    api_list = get_api_list(app, config)
+    if provider_name.startswith("sk-") and provider_name in api_list:
+        # 加载本地聚合器 Key 的分组
+        try:
+            local_settings = get_api_key_settings(app, config, api_list.index(provider_name))
+        except ValueError:
+            local_settings = None
+        local_groups = local_settings.groups if local_settings is not None else ["default"]
+
+        views.append({
+            "provider": provider_name,
+            "base_url": "http://127.0.0.1:8000/v1/chat/completions",
+            "model": [{request_model: request_model}],
+            "tools": True,
+            "_model_dict_cache": {request_model: request_model},
+            "groups": local_groups,
+        })
+    else:
+        for provider in config['providers']:
+            model_dict = provider["_model_dict_cache"]
+            if not model_dict:
+                continue
+            model_name_split = "/".join(item.split("/")[1:])
+            if "/" in item and provider['provider'] == provider_name and model_name_split in model_dict.keys():
+                if request_model in model_dict.keys() and model_name_split == request_model:
+                    new_provider = {
+                        "provider": provider["provider"],
+                        "base_url": provider.get("base_url", ""),
+                        "api": provider.get("api", None),
+                        "model": [{model_dict[model_name_split]: request_model}],
+                        "preferences": provider.get("preferences", {}),
+                        "tools": provider.get("tools", False),
+                        "_model_dict_cache": provider["_model_dict_cache"],
+                        "project_id": provider.get("project_id", None),
+                        "private_key": provider.get("private_key", None),
+                        "client_email": provider.get("client_email", None),
+                        "cf_account_id": provider.get("cf_account_id", None),
+                        "aws_access_key": provider.get("aws_access_key", None),
+                        "aws_secret_key": provider.get("aws_secret_key", None),
+                        "engine": provider.get("engine", None),
+                        "groups": provider.get("groups", ["default"]),
+                    }
+                    views.append(new_provider)
+
+                elif request_model.endswith("*") and model_name_split.startswith(request_model.rstrip("*")):
+                    new_provider = {
+                        "provider": provider["provider"],
+                        "base_url": provider.get("base_url", ""),
+                        "api": provider.get("api", None),
+                        "model": [{model_dict[model_name_split]: request_model}],
+                        "preferences": provider.get("preferences", {}),
+                        "tools": provider.get("tools", False),
+                        "_model_dict_cache": provider["_model_dict_cache"],
+                        "project_id": provider.get("project_id", None),
+                        "private_key": provider.get("private_key", None),
+                        "client_email": provider.get("client_email", None),
+                        "cf_account_id": provider.get("cf_account_id", None),
+                        "aws_access_key": provider.get("aws_access_key", None),
+                        "aws_secret_key": provider.get("aws_secret_key", None),
+                        "engine": provider.get("engine", None),
+                        "groups": provider.get("groups", ["default"]),
+                    }
+                    views.append(new_provider)
+    return views
+
+
 async def get_matching_providers(
     request_model: str,
     config: Dict[str, Any],
@@ -287,19 +306,15 @@ async def get_matching_providers(
         匹配的 provider 配置列表
     """
     provider_rules = []
+    key_settings = get_api_key_settings(app, config, api_index)
 
-    for model_rule in config['api_keys'][api_index]['model']:
+    for model_rule in key_settings.models:
         provider_rules.extend(await get_provider_rules(model_rule, config, request_model, app))
     
     provider_list = get_provider_list(provider_rules, config, request_model, app)
 
     # 分组过滤：仅保留与 API Key 分组有交集的渠道
-    api_key_groups = safe_get(config, 'api_keys', api_index, 'groups', default=['default'])
-    if isinstance(api_key_groups, str):
-        api_key_groups = [api_key_groups]
-    if not isinstance(api_key_groups, list) or not api_key_groups:
-        api_key_groups = ['default']
-    s_key = set(api_key_groups)
+    s_key = set(key_settings.groups)
 
     filtered = []
     for p in provider_list:
@@ -343,12 +358,13 @@ async def get_right_order_providers(
 
     # 筛查是否该请求token数量超过渠道tpr
     if request_total_tokens and matching_providers:
+        api_list = get_api_list(app, config)
         available_providers = []
         for provider in matching_providers:
             model_dict = get_model_dict(provider)
             original_model = model_dict[request_model]
             provider_name = provider['provider']
-            if provider_name.startswith("sk-") and provider_name in app.state.api_list:
+            if provider_name.startswith("sk-") and provider_name in api_list:
                 # Local API keys are added directly as their limits are handled elsewhere
                 available_providers.append(provider)
                 continue
@@ -0,0 +1,547 @@
+"""
+多 worker 共享运行时状态
+
+单进程模式下，限流窗口、冷却、轮询游标、余额状态都保存在进程内存中。
+多 worker 模式（WORKERS>1，或显式设置 SHARED_STATE_PATH）下，需要跨进程一致的状态
+改为保存在本机共享的 SQLite 文件（WAL 模式）中，语义与单进程一致：
+
+- 滑动窗口限流计数（全局限流、下游 API Key 限流、渠道 key 限流）
+- 冷却（渠道 key 冷却、provider/model 冷却）
+- 轮询游标（round_robin 在所有 worker 之间轮转）
+- 付费 key 余额是否耗尽
+- 配置代数（任一 worker 修改配置后，其余 worker 重新加载）
+
+每次操作都是一条短事务（一次选 key 的冷却检查、限流计数与轮询游标在同一事务内完成）。
+请求路径上通过 a 前缀的异步方法在线程池中执行，不阻塞事件循环，同一 worker 内并发的
+操作合并到一个事务中提交；未启用时 get_shared_state() 返回 None，调用方走原有的进程内逻辑。
+
+环境变量：
+- WORKERS：worker 进程数，默认 1；需通过 python main.py 启动。使用 uvicorn --workers N
+  （或 WEB_CONCURRENCY）启动时须同时设置 WORKERS=N，否则各 worker 的状态互不共享
+- SHARED_STATE_PATH：共享状态文件路径；WORKERS>1 时默认 ./data/shared_state.db
+- CONFIG_SYNC_INTERVAL：其余 worker 检查配置变更的间隔（秒），默认 2
+- SHARED_CURSOR_LEASE：不限流的 key 列表每个 worker 一次领取一整轮轮询游标，默认 false
+
+吞吐上限：记录限流的选 key 每次都要取得共享文件的写锁，增加 worker 不会提高这部分的吞吐。
+单核环境实测（3 个 key、每 worker 20 并发）：限流的选 key 单 worker 约 11000 次/秒，4 worker 合计
+约 6000~7000 次/秒；不限流的轮询只写游标，4 worker 合计约 20000 次/秒。不限流且不需要游标
+（fixed_priority）的选 key 只读；开启 SHARED_CURSOR_LEASE 后不限流的轮询只在每轮领取游标时写入一次。
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.log_config import logger
+
+DEFAULT_SHARED_STATE_PATH = "./data/shared_state.db"
+CONFIG_SYNC_INTERVAL = float(os.getenv("CONFIG_SYNC_INTERVAL", 2))
+# 不限流的 key 列表按整轮领取轮询游标，选 key 不再写共享文件（轮询只在每个 worker 内连续）
+SHARED_CURSOR_LEASE = os.getenv("SHARED_CURSOR_LEASE", "false").lower() in ("true", "1", "yes")
+# 非主 worker 尝试接管维护任务的间隔（秒）
+PRIMARY_RETRY_INTERVAL = 30
+# 限流次数达到该值的窗口视为不限流（与默认的 999999/min 一致），共享模式下不落盘记录
+UNLIMITED_COUNT = 999999
+
+CONFIG_GENERATION_KEY = "config_generation"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS rate_events (key TEXT NOT NULL, ts REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_rate_events_key_ts ON rate_events (key, ts)",
+    "CREATE TABLE IF NOT EXISTS marks (key TEXT PRIMARY KEY, value REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+)
+
+
+def worker_count() -> int:
+    try:
+        return max(1, int(os.getenv("WORKERS", 1)))
+    except ValueError:
+        return 1
+
+
+def launcher_worker_count() -> int:
+    """
+    启动器（uvicorn --workers N / WEB_CONCURRENCY）自行派生的 worker 数
+
+    直接用 uvicorn 命令行启动多个 worker 时不会经过 main.py 的 WORKERS 分支，
+    若未同时设置 WORKERS，各 worker 的限流、冷却、轮询仍是彼此独立的进程内状态。
+    """
+    argv = sys.argv[1:]
+    for index, arg in enumerate(argv):
+        value = None
+        if arg == "--workers" and index + 1 < len(argv):
+            value = argv[index + 1]
+        elif arg.startswith("--workers="):
+            value = arg.split("=", 1)[1]
+        if value is not None:
+            try:
+                return max(1, int(value))
+            except ValueError:
+                return 1
+    try:
+        return max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+    except ValueError:
+        return 1
+
+
+def shared_state_path() -> Optional[str]:
+    """共享状态文件路径，未启用多 worker 时返回 None"""
+    path = (os.getenv("SHARED_STATE_PATH") or "").strip()
+    if path:
+        return path
+    if worker_count() > 1:
+        return DEFAULT_SHARED_STATE_PATH
+    return None
+
+
+def rate_windows(limits: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """需要在共享状态中计数的限流窗口：周期 <=0 的条目（如 TPR）不参与窗口计数，不限流的条目不落盘"""
+    return [(count, period) for count, period in limits if period > 0 and count < UNLIMITED_COUNT]
+
+
+# 在连接上执行的操作及其是否需要写事务
+_Operation = Tuple[Callable[[sqlite3.Connection], Any], bool]
+
+
+class SharedState:
+    """
+    基于 SQLite 文件的跨进程共享状态
+
+    同步方法直接执行（启动、管理接口等非热路径）；a 前缀的异步方法在线程池中执行，
+    且同一事件循环中并发提交的操作合并到一个事务里（group commit），
+    减少多 worker 之间对写锁的争用。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        # 事件循环 -> 等待执行的 (操作, future)
+        self._pending: Dict[asyncio.AbstractEventLoop, List[Tuple[_Operation, asyncio.Future]]] = {}
+        self._drain_tasks: set = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        # fork 出的子进程不能复用父进程的连接
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _write(self, operation: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def _read(self, operation: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            return operation(self._connection())
+
+    def _execute(self, operation: _Operation):
+        function, write = operation
+        return self._write(function) if write else self._read(function)
+
+    def _execute_batch(self, operations: List[_Operation]) -> List[Tuple[bool, Any]]:
+        """在一个事务中依次执行多个操作，单个操作抛出的异常只影响该操作"""
+        def run(conn: sqlite3.Connection) -> List[Tuple[bool, Any]]:
+            outcomes = []
+            for function, _ in operations:
+                try:
+                    outcomes.append((True, function(conn)))
+                except Exception as e:
+                    outcomes.append((False, e))
+            return outcomes
+
+        return self._execute((run, any(write for _, write in operations)))
+
+    async def _submit(self, operation: _Operation):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = []
+            task = loop.create_task(self._drain(loop, pending))
+            self._drain_tasks.add(task)
+            task.add_done_callback(self._drain_tasks.discard)
+        pending.append((operation, future))
+        return await future
+
+    async def _drain(self, loop: asyncio.AbstractEventLoop, pending: list) -> None:
+        try:
+            while pending:
+                batch = pending[:]
+                del pending[:]
+                try:
+                    outcomes = await asyncio.to_thread(self._execute_batch, [operation for operation, _ in batch])
+                except Exception as e:
+                    outcomes = [(False, e)] * len(batch)
+                for (_, future), (ok, value) in zip(batch, outcomes):
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self._pending.pop(loop, None)
+
+    # ==================== 滑动窗口限流 ====================
+
+    @staticmethod
+    def _is_cooling(conn: sqlite3.Connection, cooling_key: Optional[str], now: float) -> bool:
+        if cooling_key is None:
+            return False
+        row = conn.execute("SELECT value FROM marks WHERE key = ?", (cooling_key,)).fetchone()
+        return row is not None and now < row[0]
+
+    @staticmethod
+    def _over_limit(conn: sqlite3.Connection, key: str, windows: List[Tuple[int, int]], now: float) -> bool:
+        for count, period in windows:
+            recent = conn.execute(
+                "SELECT COUNT(*) FROM rate_events WHERE key = ? AND ts > ?", (key, now - period)
+            ).fetchone()[0]
+            if recent >= count:
+                return True
+        return False
+
+    @staticmethod
+    def _record(conn: sqlite3.Connection, key: str, windows: List[Tuple[int, int]], now: float) -> None:
+        max_period = max(period for _, period in windows)
+        conn.execute("DELETE FROM rate_events WHERE key = ? AND ts <= ?", (key, now - max_period))
+        conn.execute("INSERT INTO rate_events (key, ts) VALUES (?, ?)", (key, now))
+
+    def _hit_operation(
+        self,
+        key: str,
+        limits: Iterable[Tuple[int, int]],
+        record: bool = True,
+        cooling_key: Optional[str] = None,
+    ) -> Optional[_Operation]:
+        windows = rate_windows(limits)
+        if not windows and cooling_key is None:
+            return None
+        now = time.time()
+
+        def operation(conn: sqlite3.Connection) -> bool:
+            if self._is_cooling(conn, cooling_key, now) or self._over_limit(conn, key, windows, now):
+                return True
+            if record and windows:
+                self._record(conn, key, windows, now)
+            return False
+
+        return operation, bool(record and windows)
+
+    def hit(
+        self,
+        key: str,
+        limits: Iterable[Tuple[int, int]],
+        record: bool = True,
+        cooling_key: Optional[str] = None,
+    ) -> bool:
+        """
+        检查 key 是否超过任一 (次数, 周期秒) 限制；未超过且 record=True 时记录本次请求
+
+        与进程内实现一致：超限时不记录。指定 cooling_key 时，该标记未过期视为受限（同一事务内检查）。
+        """
+        operation = self._hit_operation(key, limits, record, cooling_key)
+        return False if operation is None else self._execute(operation)
+
+    async def ahit(self, *args, **kwargs) -> bool:
+        operation = self._hit_operation(*args, **kwargs)
+        return False if operation is None else await self._submit(operation)
+
+    def _pick_operation(
+        self,
+        cursor_key: Optional[str],
+        count: int,
+        candidate: Callable[[int], Optional[Tuple[str, str]]],
+        limits: Iterable[Tuple[int, int]],
+        record: bool = True,
+        start: int = 0,
+    ) -> _Operation:
+        windows = rate_windows(limits)
+        now = time.time()
+
+        def operation(conn: sqlite3.Connection) -> Tuple[int, Optional[int]]:
+            nonlocal start
+            if count <= 0:
+                return 0, None
+            if cursor_key is not None and record:
+                cursor = conn.execute(
+                    "INSERT INTO counters (key, value) VALUES (?, 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value",
+                    (cursor_key,),
+                ).fetchone()[0]
+                start = (cursor - 1) % count
+            for offset in range(count):
+                position = (start + offset) % count
+                keys = candidate(position)
+                if keys is None:
+                    continue
+                cooling_key, rate_key = keys
+                if self._is_cooling(conn, cooling_key, now) or self._over_limit(conn, rate_key, windows, now):
+                    continue
+                if record and windows:
+                    self._record(conn, rate_key, windows, now)
+                return start, position
+            return start, None
+
+        # 不推进游标且不限流时只读，不占用共享文件的写锁
+        return operation, record and count > 0 and (cursor_key is not None or bool(windows))
+
+    def pick(
+        self,
+        cursor_key: Optional[str],
+        count: int,
+        candidate: Callable[[int], Optional[Tuple[str, str]]],
+        limits: Iterable[Tuple[int, int]],
+        record: bool = True,
+        start: int = 0,
+    ) -> Tuple[int, Optional[int]]:
+        """
+        在一个事务内完成一次选 key：推进轮询游标，依次跳过冷却中或超限的候选，并为选中的候选记录本次请求
+
+        Args:
+            cursor_key: 轮询游标；None 表示从 start 开始（fixed_priority，或调用方已领取游标）
+            count: 候选数量
+            candidate: 按下标返回候选的 (冷却标记 key, 限流窗口 key)，None 表示调用方已判定不可用；
+                只对实际检查到的候选调用
+            limits: 限流条件 [(次数, 周期秒)]
+            record: False 时只检查是否有可用候选（不推进游标、不记录请求）
+            start: 未指定 cursor_key 时的起始下标
+
+        Returns:
+            (起始下标, 选中的下标)；全部不可用时选中的下标为 None
+        """
+        return self._execute(self._pick_operation(cursor_key, count, candidate, limits, record, start))
+
+    async def apick(self, *args, **kwargs) -> Tuple[int, Optional[int]]:
+        return await self._submit(self._pick_operation(*args, **kwargs))
+
+    @staticmethod
+    def _unrecord_operation(key: str) -> _Operation:
+        return (lambda conn: conn.execute(
+            "DELETE FROM rate_events WHERE rowid = "
+            "(SELECT rowid FROM rate_events WHERE key = ? ORDER BY ts DESC LIMIT 1)",
+            (key,),
+        )), True
+
+    async def aunrecord(self, key: str) -> None:
+        """撤销 key 最近记录的一次请求（上游并未真正处理的失败请求不计入限流）"""
+        await self._submit(self._unrecord_operation(key))
+
+    # ==================== 标记（冷却、余额等） ====================
+
+    @staticmethod
+    def _get_mark_operation(key: str) -> _Operation:
+        def operation(conn: sqlite3.Connection) -> Optional[float]:
+            row = conn.execute("SELECT value FROM marks WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+        return operation, False
+
+    @staticmethod
+    def _set_mark_operation(key: str, value: float) -> _Operation:
+        return (lambda conn: conn.execute(
+            "INSERT INTO marks (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )), True
+
+    def get_mark(self, key: str) -> Optional[float]:
+        return self._execute(self._get_mark_operation(key))
+
+    async def aget_mark(self, key: str) -> Optional[float]:
+        return await self._submit(self._get_mark_operation(key))
+
+    def set_mark(self, key: str, value: float) -> None:
+        self._execute(self._set_mark_operation(key, value))
+
+    async def aset_mark(self, key: str, value: float) -> None:
+        await self._submit(self._set_mark_operation(key, value))
+
+    def delete_mark(self, key: str, value: Optional[float] = None) -> None:
+        """删除标记；指定 value 时只在标记未被其它 worker 更新的情况下删除"""
+        if value is None:
+            self._write(lambda conn: conn.execute("DELETE FROM marks WHERE key = ?", (key,)))
+        else:
+            self._write(lambda conn: conn.execute("DELETE FROM marks WHERE key = ? AND value = ?", (key, value)))
+
+    @staticmethod
+    def _marks_active_operation(entries: List[Tuple[str, float]]) -> _Operation:
+        now = time.time()
+
+        def operation(conn: sqlite3.Connection) -> Tuple[List[bool], Dict[str, float]]:
+            keys = sorted({key for key, _ in entries})
+            placeholders = ", ".join("?" for _ in keys)
+            marks = dict(conn.execute(f"SELECT key, value FROM marks WHERE key IN ({placeholders})", keys).fetchall())
+            result, expired = [], {}
+            for key, ttl in entries:
+                marked_at = marks.get(key)
+                active = marked_at is not None and now - marked_at <= ttl
+                if marked_at is not None and not active:
+                    expired[key] = marked_at
+                result.append(active)
+            return result, expired
+
+        return operation, False
+
+    @staticmethod
+    def _delete_expired_operation(expired: Dict[str, float]) -> _Operation:
+        # 只在期间没有其它 worker 重新标记时删除
+        return (lambda conn: conn.executemany(
+            "DELETE FROM marks WHERE key = ? AND value = ?", list(expired.items())
+        )), True
+
+    def marks_active(self, entries: Iterable[Tuple[str, float]]) -> List[bool]:
+        """
+        批量判断标记（值为设置时的时间戳）是否仍在各自的 ttl 秒内
+
+        所有标记在一次读取中完成；已过期的标记再用一个写事务清理。
+        """
+        entries = list(entries)
+        if not entries:
+            return []
+        result, expired = self._execute(self._marks_active_operation(entries))
+        if expired:
+            self._execute(self._delete_expired_operation(expired))
+        return result
+
+    async def amarks_active(self, entries: Iterable[Tuple[str, float]]) -> List[bool]:
+        entries = list(entries)
+        if not entries:
+            return []
+        result, expired = await self._submit(self._marks_active_operation(entries))
+        if expired:
+            await self._submit(self._delete_expired_operation(expired))
+        return result
+
+    # ==================== 计数器（轮询游标、配置代数） ====================
+
+    @staticmethod
+    def _next_counter_operation(key: str, amount: int) -> _Operation:
+        return (lambda conn: conn.execute(
+            "INSERT INTO counters (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (key, amount),
+        ).fetchone()[0]), True
+
+    def next_counter(self, key: str, amount: int = 1) -> int:
+        """原子地增加 amount 并返回新值（从 amount 开始）"""
+        return self._execute(self._next_counter_operation(key, amount))
+
+    async def anext_counter(self, key: str, amount: int = 1) -> int:
+        return await self._submit(self._next_counter_operation(key, amount))
+
+    @staticmethod
+    def _get_counter_operation(key: str) -> _Operation:
+        def operation(conn: sqlite3.Connection) -> int:
+            row = conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else 0
+
+        return operation, False
+
+    def get_counter(self, key: str) -> int:
+        return self._execute(self._get_counter_operation(key))
+
+    async def aget_counter(self, key: str) -> int:
+        return await self._submit(self._get_counter_operation(key))
+
+    def reset(self) -> None:
+        """清空全部状态（服务启动时调用，与进程内状态随重启清零保持一致）"""
+        def operation(conn: sqlite3.Connection) -> None:
+            for table in ("rate_events", "marks", "counters"):
+                conn.execute(f"DELETE FROM {table}")
+
+        self._write(operation)
+
+
+_shared_state: Optional[SharedState] = None
+_primary_lock_fd: Optional[int] = None
+
+
+def get_shared_state() -> Optional[SharedState]:
+    """获取共享状态；单进程模式返回 None"""
+    global _shared_state
+    if _shared_state is None:
+        path = shared_state_path()
+        if path:
+            _shared_state = SharedState(path)
+    return _shared_state
+
+
+def set_shared_state(state: Optional[SharedState]) -> None:
+    """替换共享状态实例（主要用于测试）"""
+    global _shared_state
+    _shared_state = state
+
+
+def try_acquire_primary() -> bool:
+    """
+    尝试成为主 worker
+
+    回填、过期清理等维护任务只应在一个 worker 中运行。通过对共享状态旁的锁文件加
+    非阻塞排他锁实现，持锁进程退出时锁由操作系统自动释放，其余 worker 可接管。
+    单进程模式或平台不支持 fcntl 时始终返回 True。
+    """
+    global _primary_lock_fd
+    state = get_shared_state()
+    if state is None or _primary_lock_fd is not None:
+        return True
+    try:
+        import fcntl
+    except ImportError:
+        return True
+
+    fd = os.open(state.path + ".primary.lock", os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _primary_lock_fd = fd
+    return True
+
+
+def notify_config_changed(app) -> None:
+    """本 worker 发布了新配置后调用：递增配置代数，通知其余 worker 重新加载"""
+    state = get_shared_state()
+    if state is None:
+        return
+    app.state.shared_config_generation = state.next_counter(CONFIG_GENERATION_KEY)
+
+
+async def run_config_sync(app, reload: Callable[[], Awaitable[None]]) -> None:
+    """后台任务：发现其它 worker 修改了配置时，调用 reload 重新加载"""
+    state = get_shared_state()
+    if state is None:
+        return
+    while True:
+        await asyncio.sleep(CONFIG_SYNC_INTERVAL)
+        try:
+            generation = await state.aget_counter(CONFIG_GENERATION_KEY)
+            if generation != getattr(app.state, "shared_config_generation", 0):
+                app.state.shared_config_generation = generation
+                await reload()
+                logger.info(f"Reloaded config changed by another worker (generation {generation})")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in shared config sync task: {e}")
@@ -22,6 +22,7 @@ from sqlalchemy.sql import sqltypes
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.log_config import logger
+from core.shared_state import get_shared_state
 from db import Base, RequestStat, ChannelStat, AppConfig, AdminUser, db_engine, async_session_scope, DISABLE_DATABASE, DB_TYPE
 from core.d1_client import format_d1_datetime
 
@@ -227,6 +228,7 @@ async def _create_tables_d1():
         "CREATE INDEX IF NOT EXISTS idx_request_stats_success ON request_stats(success)",
         "CREATE INDEX IF NOT EXISTS idx_request_stats_status_code ON request_stats(status_code)",
         "CREATE INDEX IF NOT EXISTS idx_request_stats_timestamp ON request_stats(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_request_stats_raw_data_expires_at ON request_stats(raw_data_expires_at)",
         "CREATE INDEX IF NOT EXISTS idx_channel_stats_provider ON channel_stats(provider)",
         "CREATE INDEX IF NOT EXISTS idx_channel_stats_model ON channel_stats(model)",
         "CREATE INDEX IF NOT EXISTS idx_channel_stats_provider_api_key ON channel_stats(provider_api_key)",
@@ -284,6 +286,19 @@ async def create_tables():
 
             await conn.run_sync(check_and_add_columns)
 
+            # create_all 不会为已存在的表补建索引（如 raw_data_expires_at），这里补齐缺失的索引
+            def check_and_add_indexes(connection):
+                inspector = inspect(connection)
+                for table in [RequestStat, ChannelStat]:
+                    table_name = table.__tablename__
+                    existing_indexes = {idx['name'] for idx in inspector.get_indexes(table_name)}
+                    for index in table.__table__.indexes:
+                        if index.name not in existing_indexes:
+                            index.create(connection)
+                            logger.info(f"Created index '{index.name}' on table '{table_name}'.")
+
+            await conn.run_sync(check_and_add_indexes)
+
 
 # ============== 成本计算 ==============
 
@@ -415,6 +430,42 @@ async def _query_token_usage_d1(
 
 # ============== 统计写入 ==============
 
+# request_info 中记录进程内转交经过的本地聚合器 Key 的键（不会写入数据库）
+LOCAL_KEY_USAGE_KEY = "_local_key_usage"
+# 内层 Key 的统计记录不重复保存原始数据与重试路径（只保留在外层记录中）
+_LOCAL_KEY_DROPPED_FIELDS = (
+    "request_headers", "request_body", "response_body",
+    "upstream_request_headers", "upstream_request_body", "upstream_response_body",
+    "retry_path", "raw_data_expires_at",
+)
+
+
+def record_local_key_usage(current_info: dict, api_key: str, api_key_name=None, api_key_group=None) -> None:
+    """
+    记录请求经由本地聚合器 Key（sk-）在进程内转交
+
+    写入统计时为每个内层 Key 额外生成一条记录（token 与外层记录一致），
+    与回环 HTTP 调度时内层 Key 单独记账的行为一致，付费 Key 的余额据此计算。
+    """
+    current_info.setdefault(LOCAL_KEY_USAGE_KEY, []).append({
+        "api_key": api_key,
+        "api_key_name": api_key_name,
+        "api_key_group": api_key_group,
+    })
+
+
+def _local_key_stats(current_info: dict) -> List[dict]:
+    from core.raw_capture import PENDING_CAPTURE_KEY
+
+    rows = []
+    for overrides in current_info.get(LOCAL_KEY_USAGE_KEY) or ():
+        row = {k: v for k, v in current_info.items() if k != LOCAL_KEY_USAGE_KEY and k not in _LOCAL_KEY_DROPPED_FIELDS}
+        row.pop(PENDING_CAPTURE_KEY, None)
+        row.update(overrides)
+        rows.append(row)
+    return rows
+
+
 async def update_stats(current_info: dict, app=None, get_model_prices_func=None):
     """
     更新请求统计到数据库
@@ -427,6 +478,10 @@ async def update_stats(current_info: dict, app=None, get_model_prices_func=None)
     if DISABLE_DATABASE:
         return
 
+    # 进程内转交经过的本地聚合器 Key 各记一条
+    for row in _local_key_stats(current_info):
+        await update_stats(row, app=app, get_model_prices_func=get_model_prices_func)
+
     # 在成功请求时，快照当前价格，写入数据库
     try:
         if current_info.get("success") and current_info.get("model"):
@@ -441,6 +496,17 @@ async def update_stats(current_info: dict, app=None, get_model_prices_func=None)
     except Exception:
         pass
 
+    # 失败采集模式：请求失败时才物化原始数据
+    from core.raw_capture import finalize_capture
+    await finalize_capture(current_info)
+
+    # 大字段写入压缩侧表：在获取数据库访问权限之前完成压缩
+    raw_rows = []
+    from core.raw_data import raw_side_table_enabled, pop_raw_fields, build_raw_rows, add_raw_rows
+    if raw_side_table_enabled():
+        current_info = dict(current_info)
+        raw_rows = await build_raw_rows(pop_raw_fields(current_info), current_info.get("raw_data_expires_at"))
+
     # 使用重试机制写入数据库
     for attempt in range(SQLITE_MAX_RETRIES):
         try:
@@ -488,6 +554,14 @@ async def update_stats(current_info: dict, app=None, get_model_prices_func=None)
 
                         new_request_stat = RequestStat(**filtered_info)
                         session.add(new_request_stat)
+                        if raw_rows:
+                            await session.flush()
+                            add_raw_rows(session, new_request_stat.id, raw_rows)
+
+                        # 同一事务内累加小时级 rollup
+                        from core.stats_rollup import rollups_enabled, add_request_rollups, request_rollup_row
+                        if rollups_enabled():
+                            await add_request_rollups(session, [request_rollup_row(filtered_info)])
                         await session.commit()
 
             # 检查付费 API 密钥状态更新
@@ -556,6 +630,12 @@ async def update_channel_stats(request_id, provider, model, api_key, success, pr
                             success=success,
                         )
                         session.add(channel_stat)
+
+                        from core.stats_rollup import rollups_enabled, add_channel_rollups, channel_rollup_row
+                        if rollups_enabled():
+                            await add_channel_rollups(
+                                session, [channel_rollup_row(provider, model, provider_api_key, success)]
+                            )
                         await session.commit()
             return  # 成功后直接返回
 
@@ -666,6 +746,26 @@ async def get_usage_data(filter_api_key: Optional[str] = None, filter_model: Opt
 
 # ============== 付费 API 密钥状态 ==============
 
+async def publish_paid_key_enabled(paid_key: str, enabled: bool) -> None:
+    """多 worker 模式下同步付费密钥的可用状态，使余额耗尽在所有 worker 上立即生效"""
+    shared = get_shared_state()
+    if shared is not None:
+        await shared.aset_mark(f"paid_enabled|{paid_key}", 1.0 if enabled else 0.0)
+
+
+async def is_paid_key_enabled(app, paid_key: str) -> Optional[bool]:
+    """付费密钥当前是否可用；非付费密钥返回 None"""
+    state = app.state.paid_api_keys_states.get(paid_key)
+    if state is None:
+        return None
+    shared = get_shared_state()
+    if shared is not None:
+        mark = await shared.aget_mark(f"paid_enabled|{paid_key}")
+        if mark is not None:
+            return bool(mark)
+    return state.get("enabled")
+
+
 async def update_paid_api_keys_states(app, paid_key: str):
     """
     更新付费API密钥的状态
@@ -697,6 +797,7 @@ async def update_paid_api_keys_states(app, paid_key: str):
             "total_cost": total_cost,
             "enabled": True if total_cost <= credits else False
         }
+        await publish_paid_key_enabled(paid_key, total_cost <= credits)
         return credits, total_cost
 
     return credits, 0
\ No newline at end of file
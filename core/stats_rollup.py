@@ -0,0 +1,542 @@
+"""
+统计预聚合模块
+
+负责：
+- 写入 request_stats / channel_stats 时增量维护小时级 rollup 表
+- 启动时从原始表回填 rollup（后台分批执行）
+- 仪表盘查询（/v1/stats、渠道 key 成功率）从 rollup 读取，
+  仅窗口起点所在的不完整小时回查原始表，查询成本与流量无关
+
+D1 后端不维护 rollup，相关查询继续走原始表。
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any, Iterable
+
+from sqlalchemy import select, delete, func, case, text
+
+from core.log_config import logger
+from db import (
+    RequestStat,
+    ChannelStat,
+    RequestStatRollup,
+    ChannelStatRollup,
+    StatsRollupState,
+    async_session_scope,
+    DISABLE_DATABASE,
+    DB_TYPE,
+)
+
+# rollup 保留天数（/v1/stats 最多查询 720 小时）
+ROLLUP_RETENTION_DAYS = int(os.getenv("STATS_ROLLUP_RETENTION_DAYS", 31))
+# 回填时每批读取的原始行数
+BACKFILL_BATCH_SIZE = int(os.getenv("STATS_ROLLUP_BACKFILL_BATCH", 5000))
+# 单条 upsert 语句最多包含的行数
+_UPSERT_CHUNK_SIZE = 200
+
+REQUEST_MEASURES = (
+    "request_count",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "process_time_sum",
+    "first_response_time_sum",
+    "latency_le_1s",
+    "latency_le_5s",
+    "latency_le_30s",
+    "latency_gt_30s",
+)
+CHANNEL_MEASURES = ("request_count",)
+
+_STATE_REQUEST_WATERMARK = "request_stats_backfilled_id"
+_STATE_CHANNEL_WATERMARK = "channel_stats_backfilled_id"
+
+# 未就绪时重新读取回填状态的间隔（秒）；多 worker 时回填只在主 worker 中执行
+ROLLUP_READY_RECHECK_INTERVAL = float(os.getenv("STATS_ROLLUP_READY_RECHECK_INTERVAL", 30))
+
+# 回填完成前仪表盘仍查询原始表
+_rollups_ready = False
+_rollups_checked_at = 0.0
+
+
+def rollups_enabled() -> bool:
+    """当前数据库后端是否维护 rollup"""
+    return not DISABLE_DATABASE and (DB_TYPE or "sqlite").lower() != "d1"
+
+
+async def _load_watermarks(session) -> Dict[str, int]:
+    states = await session.execute(select(StatsRollupState.name, StatsRollupState.value))
+    return {row.name: row.value for row in states}
+
+
+def _has_watermarks(state: Dict[str, int]) -> bool:
+    return _STATE_REQUEST_WATERMARK in state and _STATE_CHANNEL_WATERMARK in state
+
+
+async def rollups_ready() -> bool:
+    """
+    rollup 是否已回填完成、可用于查询
+
+    回填由主 worker 执行；其它 worker 未就绪时按 ROLLUP_READY_RECHECK_INTERVAL 只读检查回填状态。
+    """
+    global _rollups_ready, _rollups_checked_at
+    if not rollups_enabled():
+        return False
+    if _rollups_ready:
+        return True
+    now = time.monotonic()
+    if now - _rollups_checked_at < ROLLUP_READY_RECHECK_INTERVAL:
+        return False
+    _rollups_checked_at = now
+    try:
+        async with async_session_scope() as session:
+            _rollups_ready = _has_watermarks(await _load_watermarks(session))
+    except Exception as e:
+        logger.debug(f"Stats rollup state check failed: {e}")
+    return _rollups_ready
+
+
+def _as_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is None:
+        # SQLite 读回的时间不带时区，按 UTC 处理
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def floor_hour(dt: datetime) -> datetime:
+    return _as_utc(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(dt: datetime) -> datetime:
+    dt = _as_utc(dt)
+    floored = floor_hour(dt)
+    return floored if floored == dt else floored + timedelta(hours=1)
+
+
+def _dims_key(*values) -> str:
+    return hashlib.sha1("\x1f".join(str(v) for v in values).encode("utf-8")).hexdigest()
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value)
+
+
+def request_rollup_row(info: Dict[str, Any], timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    """将一条请求统计转换为 rollup 增量行"""
+    bucket = floor_hour(timestamp or info.get("timestamp") or datetime.now(timezone.utc))
+    provider = _text(info.get("provider"))
+    model = _text(info.get("model"))
+    api_key = _text(info.get("api_key"))
+    endpoint = _text(info.get("endpoint"))
+    client_ip = _text(info.get("client_ip"))
+    success = bool(info.get("success"))
+    try:
+        status_class = int(info.get("status_code") or 0) // 100
+    except (TypeError, ValueError):
+        status_class = 0
+
+    process_time = max(float(info.get("process_time") or 0), 0.0)
+    first_response_time = max(float(info.get("first_response_time") or 0), 0.0)
+
+    return {
+        "bucket": bucket,
+        "dims_key": _dims_key(provider, model, api_key, endpoint, client_ip, success, status_class),
+        "provider": provider,
+        "model": model,
+        "api_key": api_key,
+        "endpoint": endpoint,
+        "client_ip": client_ip,
+        "success": success,
+        "status_class": status_class,
+        "request_count": 1,
+        "prompt_tokens": int(info.get("prompt_tokens") or 0),
+        "completion_tokens": int(info.get("completion_tokens") or 0),
+        "total_tokens": int(info.get("total_tokens") or 0),
+        "process_time_sum": process_time,
+        "first_response_time_sum": first_response_time,
+        "latency_le_1s": 1 if process_time <= 1 else 0,
+        "latency_le_5s": 1 if 1 < process_time <= 5 else 0,
+        "latency_le_30s": 1 if 5 < process_time <= 30 else 0,
+        "latency_gt_30s": 1 if process_time > 30 else 0,
+    }
+
+
+def channel_rollup_row(
+    provider, model, provider_api_key, success, timestamp: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """将一条渠道统计转换为 rollup 增量行"""
+    provider = _text(provider)
+    model = _text(model)
+    provider_api_key = _text(provider_api_key)
+    success = bool(success)
+    return {
+        "bucket": floor_hour(timestamp or datetime.now(timezone.utc)),
+        "dims_key": _dims_key(provider, model, provider_api_key, success),
+        "provider": provider,
+        "model": model,
+        "provider_api_key": provider_api_key,
+        "success": success,
+        "request_count": 1,
+    }
+
+
+def merge_rollup_rows(rows: Iterable[Dict[str, Any]], measures: Iterable[str]) -> List[Dict[str, Any]]:
+    """合并同一 (bucket, dims_key) 的增量行"""
+    measures = tuple(measures)
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        key = (row["bucket"], row["dims_key"])
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = dict(row)
+        else:
+            for measure in measures:
+                existing[measure] += row[measure]
+    return list(merged.values())
+
+
+def _build_upsert(dialect_name: str, table, rows: List[Dict[str, Any]], measures: Iterable[str]):
+    """构建累加式 upsert（sqlite / postgres: ON CONFLICT；mysql: ON DUPLICATE KEY）"""
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        stmt = mysql_insert(table).values(rows)
+        return stmt.on_duplicate_key_update({m: table.c[m] + stmt.inserted[m] for m in measures})
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    stmt = dialect_insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.bucket, table.c.dims_key],
+        set_={m: table.c[m] + stmt.excluded[m] for m in measures},
+    )
+
+
+async def _apply_rollup_rows(session, table, rows: List[Dict[str, Any]], measures) -> None:
+    if not rows:
+        return
+    dialect_name = session.get_bind().dialect.name
+    for start in range(0, len(rows), _UPSERT_CHUNK_SIZE):
+        chunk = rows[start:start + _UPSERT_CHUNK_SIZE]
+        await session.execute(_build_upsert(dialect_name, table, chunk, measures))
+
+
+async def add_request_rollups(session, rows: List[Dict[str, Any]]) -> None:
+    """在调用方事务内累加 request rollup"""
+    await _apply_rollup_rows(session, RequestStatRollup.__table__, merge_rollup_rows(rows, REQUEST_MEASURES), REQUEST_MEASURES)
+
+
+async def add_channel_rollups(session, rows: List[Dict[str, Any]]) -> None:
+    """在调用方事务内累加 channel rollup"""
+    await _apply_rollup_rows(session, ChannelStatRollup.__table__, merge_rollup_rows(rows, CHANNEL_MEASURES), CHANNEL_MEASURES)
+
+
+# ============== 回填与维护 ==============
+
+async def prepare_rollups() -> Optional[tuple[int, int]]:
+    """
+    启动时（开始处理请求之前）检查 rollup 回填状态
+
+    已回填过直接标记可用；否则清空 rollup 并返回 (request_stats 水位, channel_stats 水位)，
+    水位之后的新行由写入路径增量维护，水位及之前的行交给 backfill_rollups 后台回填。
+
+    Returns:
+        需要回填时返回水位元组，否则返回 None
+    """
+    global _rollups_ready
+    if not rollups_enabled():
+        return None
+
+    async with async_session_scope() as session:
+        if _has_watermarks(await _load_watermarks(session)):
+            _rollups_ready = True
+            return None
+
+        # 清空与取水位在同一事务内完成：其它 worker 的原始行与 rollup 增量同一事务提交，
+        # 先取得写锁（sqlite 由 DELETE 取得；postgres 锁住原始表）再读水位，
+        # 保证水位及之前的增量都已被清空、之后的增量都保留
+        dialect_name = session.get_bind().dialect.name
+        if dialect_name == "postgresql":
+            await session.execute(text(
+                f"LOCK TABLE {RequestStat.__tablename__}, {ChannelStat.__tablename__} IN SHARE MODE"
+            ))
+
+        # 上次回填可能中途退出，清空后整体重建，避免重复累加
+        await session.execute(delete(RequestStatRollup))
+        await session.execute(delete(ChannelStatRollup))
+
+        request_query = select(func.max(RequestStat.id))
+        channel_query = select(func.max(ChannelStat.id))
+        if dialect_name == "mysql":
+            request_query = request_query.with_for_update()
+            channel_query = channel_query.with_for_update()
+        request_max = (await session.execute(request_query)).scalar() or 0
+        channel_max = (await session.execute(channel_query)).scalar() or 0
+        await session.commit()
+
+    return int(request_max), int(channel_max)
+
+
+async def _backfill_table(raw_model, columns, watermark: int, since: datetime, to_row, add_rows) -> int:
+    from core.stats import db_semaphore
+
+    last_id = 0
+    total = 0
+    while last_id < watermark:
+        async with async_session_scope() as session:
+            result = await session.execute(
+                select(raw_model.id, raw_model.timestamp, *columns)
+                .where(raw_model.id > last_id)
+                .where(raw_model.id <= watermark)
+                .where(raw_model.timestamp >= since)
+                .order_by(raw_model.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            )
+            batch = result.mappings().all()
+        if not batch:
+            break
+
+        rows = [to_row(item) for item in batch]
+        async with db_semaphore:
+            async with async_session_scope() as session:
+                await add_rows(session, rows)
+                await session.commit()
+
+        last_id = batch[-1]["id"]
+        total += len(batch)
+        # 让出写锁，避免阻塞实时统计写入
+        await asyncio.sleep(0.05)
+    return total
+
+
+async def backfill_rollups(watermarks: tuple[int, int]) -> None:
+    """从原始表分批回填 rollup（只回填保留期内的数据），完成后写入回填状态"""
+    global _rollups_ready
+    request_watermark, channel_watermark = watermarks
+    since = datetime.now(timezone.utc) - timedelta(days=ROLLUP_RETENTION_DAYS)
+
+    request_total = await _backfill_table(
+        RequestStat,
+        (
+            RequestStat.provider, RequestStat.model, RequestStat.api_key, RequestStat.endpoint,
+            RequestStat.client_ip, RequestStat.success, RequestStat.status_code,
+            RequestStat.prompt_tokens, RequestStat.completion_tokens, RequestStat.total_tokens,
+            RequestStat.process_time, RequestStat.first_response_time,
+        ),
+        request_watermark,
+        since,
+        lambda item: request_rollup_row(item, timestamp=item["timestamp"]),
+        add_request_rollups,
+    )
+    channel_total = await _backfill_table(
+        ChannelStat,
+        (ChannelStat.provider, ChannelStat.model, ChannelStat.provider_api_key, ChannelStat.success),
+        channel_watermark,
+        since,
+        lambda item: channel_rollup_row(
+            item["provider"], item["model"], item["provider_api_key"], item["success"], timestamp=item["timestamp"]
+        ),
+        add_channel_rollups,
+    )
+
+    async with async_session_scope() as session:
+        await session.merge(StatsRollupState(name=_STATE_REQUEST_WATERMARK, value=request_watermark))
+        await session.merge(StatsRollupState(name=_STATE_CHANNEL_WATERMARK, value=channel_watermark))
+        await session.commit()
+
+    _rollups_ready = True
+    logger.info(f"Stats rollups backfilled: request_stats={request_total}, channel_stats={channel_total}")
+
+
+async def prune_rollups() -> None:
+    """删除超出保留期的 rollup"""
+    cutoff = floor_hour(datetime.now(timezone.utc) - timedelta(days=ROLLUP_RETENTION_DAYS))
+    async with async_session_scope() as session:
+        await session.execute(delete(RequestStatRollup).where(RequestStatRollup.bucket < cutoff))
+        await session.execute(delete(ChannelStatRollup).where(ChannelStatRollup.bucket < cutoff))
+        await session.commit()
+
+
+async def run_rollup_maintenance(watermarks: Optional[tuple[int, int]]) -> None:
+    """后台任务：必要时回填，之后每小时清理过期 rollup"""
+    try:
+        if watermarks is not None:
+            await backfill_rollups(watermarks)
+        while True:
+            try:
+                await prune_rollups()
+            except Exception as e:
+                logger.error(f"Error pruning stats rollups: {e}")
+            await asyncio.sleep(3600)
+    except asyncio.CancelledError:
+        logger.info("Stats rollup maintenance task cancelled")
+    except Exception as e:
+        logger.error(f"Error in stats rollup maintenance task: {e}")
+
+
+# ============== 查询 ==============
+
+def _merge_counts(target: Dict[tuple, List[int]], rows, key_fields, value_fields) -> None:
+    """按维度累加计数；维度中的 NULL 与 rollup 一致归一为空字符串"""
+    for row in rows:
+        key = tuple(_text(getattr(row, f)) for f in key_fields)
+        values = target.setdefault(key, [0] * len(value_fields))
+        for i, f in enumerate(value_fields):
+            values[i] += int(getattr(row, f) or 0)
+
+
+def _none_if_empty(value):
+    return None if value == "" else value
+
+
+async def query_dashboard_stats(start_time: datetime) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    /v1/stats 所需的五组统计
+
+    完整小时从 rollup 读取；start_time 所在的不完整小时回查原始表。
+    """
+    rollup_start = ceil_hour(start_time)
+    channel_counts: Dict[tuple, List[int]] = {}
+    request_counts: Dict[str, Dict[tuple, List[int]]] = {"model": {}, "endpoint": {}, "client_ip": {}}
+
+    async with async_session_scope() as session:
+        rs = await session.execute(
+            select(
+                ChannelStatRollup.provider,
+                ChannelStatRollup.model,
+                func.sum(ChannelStatRollup.request_count).label("total"),
+                func.sum(case((ChannelStatRollup.success, ChannelStatRollup.request_count), else_=0)).label("success_count"),
+            )
+            .where(ChannelStatRollup.bucket >= rollup_start)
+            .group_by(ChannelStatRollup.provider, ChannelStatRollup.model)
+        )
+        _merge_counts(channel_counts, rs.fetchall(), ("provider", "model"), ("total", "success_count"))
+
+        if start_time < rollup_start:
+            rs = await session.execute(
+                select(
+                    ChannelStat.provider,
+                    ChannelStat.model,
+                    func.count().label("total"),
+                    func.sum(case((ChannelStat.success, 1), else_=0)).label("success_count"),
+                )
+                .where(ChannelStat.timestamp >= start_time)
+                .where(ChannelStat.timestamp < rollup_start)
+                .group_by(ChannelStat.provider, ChannelStat.model)
+            )
+            _merge_counts(channel_counts, rs.fetchall(), ("provider", "model"), ("total", "success_count"))
+
+        for field in request_counts:
+            rollup_col = getattr(RequestStatRollup, field)
+            rs = await session.execute(
+                select(rollup_col.label("value"), func.sum(RequestStatRollup.request_count).label("total"))
+                .where(RequestStatRollup.bucket >= rollup_start)
+                .group_by(rollup_col)
+            )
+            _merge_counts(request_counts[field], rs.fetchall(), ("value",), ("total",))
+
+            if start_time < rollup_start:
+                raw_col = getattr(RequestStat, field)
+                rs = await session.execute(
+                    select(raw_col.label("value"), func.count().label("total"))
+                    .where(RequestStat.timestamp >= start_time)
+                    .where(RequestStat.timestamp < rollup_start)
+                    .group_by(raw_col)
+                )
+                _merge_counts(request_counts[field], rs.fetchall(), ("value",), ("total",))
+
+    channel_model_stats = [
+        {"provider": _none_if_empty(provider), "model": _none_if_empty(model), "total": total, "success_count": success_count}
+        for (provider, model), (total, success_count) in channel_counts.items()
+    ]
+    provider_totals: Dict[str, List[int]] = {}
+    for stat in channel_model_stats:
+        values = provider_totals.setdefault(stat["provider"], [0, 0])
+        values[0] += stat["total"]
+        values[1] += stat["success_count"]
+    channel_stats = [
+        {"provider": provider, "total": total, "success_count": success_count}
+        for provider, (total, success_count) in provider_totals.items()
+    ]
+
+    def _sorted_counts(field: str) -> List[Dict[str, Any]]:
+        items = [
+            {field: _none_if_empty(key[0]), "count": values[0]}
+            for key, values in request_counts[field].items()
+        ]
+        return sorted(items, key=lambda x: x["count"], reverse=True)
+
+    return {
+        "channel_model_stats": channel_model_stats,
+        "channel_stats": channel_stats,
+        "model_stats": _sorted_counts("model"),
+        "endpoint_stats": _sorted_counts("endpoint"),
+        "ip_stats": _sorted_counts("client_ip"),
+    }
+
+
+async def query_channel_key_counts(
+    provider_name: str,
+    start_dt: datetime,
+    end_dt: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """
+    渠道下各上游 key 的请求数 / 成功数
+
+    完整小时从 rollup 读取，窗口两端的不完整小时回查原始表。
+    """
+    rollup_start = ceil_hour(start_dt)
+    rollup_end = floor_hour(end_dt) if end_dt else None
+    counts: Dict[tuple, List[int]] = {}
+
+    async with async_session_scope() as session:
+        query = (
+            select(
+                ChannelStatRollup.provider_api_key,
+                func.sum(ChannelStatRollup.request_count).label("total_requests"),
+                func.sum(case((ChannelStatRollup.success, ChannelStatRollup.request_count), else_=0)).label("success_count"),
+            )
+            .where(ChannelStatRollup.provider == provider_name)
+            .where(ChannelStatRollup.bucket >= rollup_start)
+            .where(ChannelStatRollup.provider_api_key != "")
+        )
+        if rollup_end is not None:
+            query = query.where(ChannelStatRollup.bucket < rollup_end)
+        rs = await session.execute(query.group_by(ChannelStatRollup.provider_api_key))
+        _merge_counts(counts, rs.fetchall(), ("provider_api_key",), ("total_requests", "success_count"))
+
+        raw_ranges = []
+        if rollup_end is not None and rollup_end <= rollup_start:
+            raw_ranges.append((start_dt, end_dt))
+        else:
+            if start_dt < rollup_start:
+                raw_ranges.append((start_dt, rollup_start))
+            if rollup_end is not None and rollup_end < end_dt:
+                raw_ranges.append((rollup_end, end_dt))
+
+        for range_start, range_end in raw_ranges:
+            rs = await session.execute(
+                select(
+                    ChannelStat.provider_api_key,
+                    func.count().label("total_requests"),
+                    func.sum(case((ChannelStat.success, 1), else_=0)).label("success_count"),
+                )
+                .where(ChannelStat.provider == provider_name)
+                .where(ChannelStat.timestamp >= range_start)
+                .where(ChannelStat.timestamp < range_end)
+                .where(ChannelStat.provider_api_key.isnot(None))
+                .group_by(ChannelStat.provider_api_key)
+            )
+            _merge_counts(counts, rs.fetchall(), ("provider_api_key",), ("total_requests", "success_count"))
+
+    return [
+        {"provider_api_key": key[0], "total_requests": total, "success_count": success_count}
+        for key, (total, success_count) in counts.items()
+    ]
@@ -0,0 +1,63 @@
+"""
+工具定义转换缓存
+
+Agent 类客户端每一轮都会带上同一批（往往几十个）工具定义，各渠道每次都要深拷贝并改写
+参数 schema（Gemini/Vertex 的字段裁剪、Claude 的 $ref 展开）。这里按
+(转换类型, 工具定义的稳定哈希) 缓存转换结果（有界 LRU），相同的工具列表直接复用。
+
+约定：
+- 每次返回新的外层列表，调用方可以自由追加/删除元素
+- 列表中的单个工具字典在多个请求间共享，视为只读，不要原地修改
+
+环境变量：
+- TOOL_SCHEMA_CACHE_SIZE：缓存条目上限，默认 256，<=0 表示关闭缓存
+"""
+
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+TOOL_SCHEMA_CACHE_SIZE = int(os.getenv("TOOL_SCHEMA_CACHE_SIZE", 256))
+
+_cache: "OrderedDict[Tuple[str, str], List[Any]]" = OrderedDict()
+
+
+def tools_fingerprint(tools: Any) -> Optional[str]:
+    """计算工具定义的稳定哈希（键排序后序列化），无法序列化时返回 None"""
+    try:
+        encoded = json.dumps(tools, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def convert_tools_cached(kind: str, tools: List[Any], convert: Callable[[List[Any]], List[Any]]) -> List[Any]:
+    """
+    获取工具列表的转换结果，未命中时调用 convert 并写入缓存
+
+    Args:
+        kind: 转换类型（如 "gemini"、"claude"），同一批工具在不同渠道下的结果互不干扰
+        tools: 原始工具定义（可 JSON 序列化的列表）
+        convert: 转换函数，不得修改传入的 tools
+    """
+    key = tools_fingerprint(tools) if TOOL_SCHEMA_CACHE_SIZE > 0 else None
+    if key is None:
+        return list(convert(tools))
+
+    cache_key = (kind, key)
+    cached = _cache.get(cache_key)
+    if cached is not None:
+        _cache.move_to_end(cache_key)
+        return list(cached)
+
+    converted = list(convert(tools))
+    _cache[cache_key] = converted
+    while len(_cache) > TOOL_SCHEMA_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return list(converted)
+
+
+def clear_tool_cache() -> None:
+    _cache.clear()
@@ -1,7 +1,9 @@
+import os
 import re
 import io
 import ast
 import json
+import hashlib
 import httpx
 import base64
 import random
@@ -11,11 +13,14 @@ import traceback
 from time import time
 from PIL import Image
 from fastapi import HTTPException
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
 from httpx_socks import AsyncProxyTransport
 from urllib.parse import urlparse, urlunparse
 
 from .log_config import logger
+from .shared_state import get_shared_state, rate_windows, SHARED_CURSOR_LEASE
 
 def get_model_dict(provider):
     """
@@ -269,6 +274,175 @@ def safe_get(data, *keys, default=None):
 
 
 
+_JSON_WS = re.compile(rb"[ \t\n\r]*")
+_JSON_STR_SPECIAL = re.compile(rb'["\\]')
+_JSON_SKIP_SPECIAL = re.compile(rb'[\[\]{}"]')
+_JSON_LITERAL = re.compile(rb"-?[0-9][0-9.eE+\-]*|true|false|null")
+_DEPTH_PLACEHOLDER = '"[已截断：已达到最大深度]"'
+
+
+class _TruncatedOutputFull(Exception):
+    """输出已超过 max_total_size，停止继续扫描"""
+
+
+class _JsonByteTruncator:
+    """
+    单遍扫描 JSON 字节流的截断器
+
+    不构建对象树：长字符串（如 base64 data URI）只拷贝前 max_str_length 字节，
+    其余部分通过正则在 C 层跳过；超出条目数/深度的值同样直接跳过。
+    内存与 CPU 开销与截断后的输出大小成正比，而非原始请求体大小。
+    """
+
+    def __init__(self, buf: bytes, max_total_size: int, max_str_length: int, max_items: int, max_depth: int):
+        self.buf = buf
+        self.max_total_size = max_total_size
+        self.max_str_length = max_str_length
+        self.max_items = max_items
+        self.max_depth = max_depth
+        self.out: List[str] = []
+        self.out_size = 0
+
+    def run(self) -> str:
+        try:
+            pos = self._value(self._ws(0), 0)
+            if self._ws(pos) != len(self.buf):
+                raise ValueError("Extra data after JSON value")
+        except _TruncatedOutputFull:
+            pass
+        return "".join(self.out)
+
+    def _emit(self, text: str) -> None:
+        self.out.append(text)
+        self.out_size += len(text)
+        if self.out_size > self.max_total_size:
+            raise _TruncatedOutputFull()
+
+    def _ws(self, pos: int) -> int:
+        return _JSON_WS.match(self.buf, pos).end()
+
+    def _expect(self, pos: int, char: bytes) -> int:
+        if self.buf[pos:pos + 1] != char:
+            raise ValueError(f"Expected {char!r} at {pos}")
+        return pos + 1
+
+    def _string_end(self, pos: int) -> int:
+        """pos 指向起始引号，返回结束引号之后的位置"""
+        cursor = pos + 1
+        while True:
+            match = _JSON_STR_SPECIAL.search(self.buf, cursor)
+            if match is None:
+                raise ValueError("Unterminated string")
+            if match.group() == b'"':
+                return match.end()
+            cursor = match.end() + 1  # 跳过转义字符
+
+    def _skip_value(self, pos: int) -> int:
+        """跳过一个完整的值，返回其后的位置"""
+        head = self.buf[pos:pos + 1]
+        if head == b'"':
+            return self._string_end(pos)
+        if head not in (b"{", b"["):
+            match = _JSON_LITERAL.match(self.buf, pos)
+            if match is None:
+                raise ValueError(f"Invalid value at {pos}")
+            return match.end()
+        depth = 0
+        cursor = pos
+        while True:
+            match = _JSON_SKIP_SPECIAL.search(self.buf, cursor)
+            if match is None:
+                raise ValueError("Unterminated container")
+            token = match.group()
+            if token == b'"':
+                cursor = self._string_end(match.start())
+                continue
+            cursor = match.end()
+            if token in (b"{", b"["):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return cursor
+
+    def _emit_string(self, start: int, end: int, truncate: bool) -> None:
+        raw = self.buf[start + 1:end - 1]
+        if not truncate or len(raw) <= self.max_str_length:
+            self._emit('"' + raw.decode("utf-8", errors="replace") + '"')
+            return
+        cut = raw[:self.max_str_length]
+        # 不能把转义序列截断一半
+        escape_at = cut.rfind(b"\\", max(0, len(cut) - 6))
+        if escape_at != -1:
+            backslashes = len(cut[:escape_at + 1]) - len(cut[:escape_at + 1].rstrip(b"\\"))
+            if backslashes % 2 == 1:
+                needed = 6 if cut[escape_at + 1:escape_at + 2] == b"u" else 2
+                if len(cut) - escape_at < needed:
+                    cut = cut[:escape_at]
+        text = cut.decode("utf-8", errors="ignore")
+        self._emit('"' + text + f"... [截断 {len(raw) - len(cut)} 字节]" + '"')
+
+    def _value(self, pos: int, depth: int) -> int:
+        if depth >= self.max_depth:
+            end = self._skip_value(pos)
+            self._emit(_DEPTH_PLACEHOLDER)
+            return end
+
+        head = self.buf[pos:pos + 1]
+        if head == b'"':
+            end = self._string_end(pos)
+            self._emit_string(pos, end, truncate=True)
+            return end
+        if head == b"{":
+            return self._container(pos, depth, is_object=True)
+        if head == b"[":
+            return self._container(pos, depth, is_object=False)
+
+        match = _JSON_LITERAL.match(self.buf, pos)
+        if match is None:
+            raise ValueError(f"Invalid value at {pos}")
+        self._emit(match.group().decode("ascii"))
+        return match.end()
+
+    def _container(self, pos: int, depth: int, is_object: bool) -> int:
+        close = b"}" if is_object else b"]"
+        self._emit("{" if is_object else "[")
+        pos = self._ws(pos + 1)
+        count = 0
+        if self.buf[pos:pos + 1] != close:
+            while True:
+                if count < self.max_items:
+                    if count:
+                        self._emit(", ")
+                    if is_object:
+                        key_end = self._string_end(self._expect(pos, b'"') - 1)
+                        self._emit_string(pos, key_end, truncate=False)
+                        pos = self._expect(self._ws(key_end), b":")
+                        self._emit(": ")
+                        pos = self._ws(pos)
+                    pos = self._value(pos, depth + 1)
+                else:
+                    if is_object:
+                        pos = self._expect(self._ws(self._string_end(self._expect(pos, b'"') - 1)), b":")
+                        pos = self._ws(pos)
+                    pos = self._skip_value(pos)
+                count += 1
+                pos = self._ws(pos)
+                if self.buf[pos:pos + 1] == b",":
+                    pos = self._ws(pos + 1)
+                    continue
+                break
+
+        if count > self.max_items:
+            remaining = count - self.max_items
+            if is_object:
+                self._emit(f', "__truncated_keys__": "[{remaining} 更多项]"')
+            else:
+                self._emit(f', "[... {remaining} 更多项]"')
+        self._emit("}" if is_object else "]")
+        return self._expect(pos, close)
+
+
 def truncate_for_logging(
     data,
     max_total_size: int = 100 * 1024,
@@ -283,6 +457,8 @@ def truncate_for_logging(
     - list/dict 超过 max_items 仅保留前 max_items 项并标注剩余
     - 深度超过 max_depth 返回占位说明
     - 最终序列化后若总长度超过 max_total_size 进行总长度截断
+
+    bytes / str 形式的 JSON（及 SSE）按字节流单遍扫描截断，不解析为对象树。
     """
 
     def _truncate(obj, depth):
@@ -318,48 +494,47 @@ def truncate_for_logging(
 
         return str(obj)
 
-    def _truncate_sse(text):
+    def _truncate_json_bytes(buf: bytes) -> str:
+        """按字节流截断 JSON；不是合法 JSON 时退化为整体字符串截断"""
+        try:
+            return _JsonByteTruncator(buf, max_total_size, max_str_length, max_items, max_depth).run()
+        except (ValueError, IndexError):
+            # 只解码需要保留的前缀
+            head = buf[:max_str_length * 4].decode("utf-8", errors="ignore")
+            if len(head) > max_str_length or len(buf) > max_str_length * 4:
+                return json.dumps(head[:max_str_length] + f"... [截断 {len(buf) - len(head[:max_str_length].encode('utf-8'))} 字节]", ensure_ascii=False)
+            return json.dumps(head, ensure_ascii=False)
+
+    def _truncate_sse(buf: bytes) -> str:
         """处理 SSE 格式的流式响应，对每个事件的 JSON 内部进行截断"""
-        lines = text.replace('\r\n', '\n').split('\n')
         result_lines = []
-        
-        for line in lines:
-            if line.startswith('data: '):
-                data_str = line[6:]  # 去掉 "data: " 前缀
-                if data_str == '[DONE]':
-                    result_lines.append(line)
-                else:
-                    try:
-                        parsed = json.loads(data_str)
-                        truncated = _truncate(parsed, 0)
-                        result_lines.append('data: ' + json.dumps(truncated, ensure_ascii=False))
-                    except Exception:
-                        # 解析失败，保留原始行
-                        result_lines.append(line)
+        result_size = 0
+        for line in buf.replace(b"\r\n", b"\n").split(b"\n"):
+            if line.startswith(b"data: ") and line[6:] != b"[DONE]":
+                try:
+                    text = "data: " + _JsonByteTruncator(
+                        line[6:], max_total_size, max_str_length, max_items, max_depth
+                    ).run()
+                except (ValueError, IndexError):
+                    # 解析失败，保留原始行
+                    text = line.decode("utf-8", errors="replace")
             else:
                 # 非 data: 行（空行、注释、event: 等）保留原样
-                result_lines.append(line)
-        
-        return '\n'.join(result_lines)
+                text = line.decode("utf-8", errors="replace")
+            result_lines.append(text)
+            result_size += len(text) + 1
+            if result_size > max_total_size:
+                break
+        return "\n".join(result_lines)
 
     try:
-        if isinstance(data, (bytes, bytearray)):
-            data = data.decode("utf-8", errors="replace")
-
-        if isinstance(data, str):
-            # 检测是否是 SSE 格式（以 "data: " 开头）
-            stripped = data.strip()
-            if stripped.startswith('data: '):
+        if isinstance(data, (str, bytes, bytearray)):
+            buf = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+            if buf.lstrip().startswith(b"data: "):
                 # SSE 流式响应格式，对每个事件块内部进行截断
-                serialized = _truncate_sse(data)
+                serialized = _truncate_sse(buf)
             else:
-                try:
-                    parsed = json.loads(data)
-                    truncated_obj = _truncate(parsed, 0)
-                    serialized = json.dumps(truncated_obj, ensure_ascii=False)
-                except Exception:
-                    truncated_obj = _truncate(data, 0)
-                    serialized = json.dumps(truncated_obj, ensure_ascii=False)
+                serialized = _truncate_json_bytes(buf)
         else:
             truncated_obj = _truncate(data, 0)
             serialized = json.dumps(truncated_obj, ensure_ascii=False)
@@ -406,8 +581,10 @@ def parse_rate_limit(limit_string):
     return limits
 
 class ThreadSafeCircularList:
-    def __init__(self, items = [], rate_limit={"default": "999999/min"}, schedule_algorithm="round_robin", provider_name=None, disabled_keys=None):
+    def __init__(self, items = [], rate_limit={"default": "999999/min"}, schedule_algorithm="round_robin", provider_name=None, disabled_keys=None, shared_scope=None):
         self.provider_name = provider_name
+        # 多 worker 模式下，限流窗口、冷却和轮询游标以 shared_scope 为前缀保存在共享状态中
+        self.shared_scope = shared_scope
         self.original_items = list(items)
         self.schedule_algorithm = schedule_algorithm
         # 存储禁用的 key 集合
@@ -427,6 +604,9 @@ class ThreadSafeCircularList:
             self.schedule_algorithm = "round_robin"
 
         self.index = 0
+        self._item_positions = None
+        # 共享模式下不限流时，本 worker 领取的轮询游标（一次领取一整轮）
+        self._cursor_lease = deque()
         self.lock = asyncio.Lock()
         self.requests = defaultdict(lambda: defaultdict(list))
         self.cooling_until = defaultdict(float)
@@ -453,6 +633,24 @@ class ThreadSafeCircularList:
                 self.index = 0
                 logger.info(f"Provider '{self.provider_name}' API key list has been reset and reordered.")
 
+    def _shared_state(self):
+        return get_shared_state() if self.shared_scope else None
+
+    def _shared_key(self, *parts) -> str:
+        return "|".join((self.shared_scope,) + parts)
+
+    def get_item_index(self, item) -> Optional[int]:
+        """O(1) 获取 key 在当前 items 中的位置，items 被整体替换后自动重建索引"""
+        items = self.items
+        cached = self._item_positions
+        if cached is None or cached[0] is not items:
+            positions = {}
+            for position, key in enumerate(items):
+                positions.setdefault(key, position)
+            cached = (items, positions)
+            self._item_positions = cached
+        return cached[1].get(item)
+
     def _trigger_reorder(self):
         """Asynchronously triggers the reordering task if not already running."""
         if self.provider_name and (self.reordering_task is None or self.reordering_task.done()):
@@ -483,8 +681,11 @@ class ThreadSafeCircularList:
         if item is None:
             return
         now = time()
+        shared = self._shared_state()
         async with self.lock:
             self.cooling_until[item] = now + cooling_time
+            if shared is not None:
+                await shared.aset_mark(self._shared_key("cooling", item), now + cooling_time)
             # 清空该 item 的请求记录
             # self.requests[item] = []
             logger.warning(f"API key {item} 已进入冷却状态，冷却时间 {cooling_time} 秒")
@@ -520,36 +721,45 @@ class ThreadSafeCircularList:
         """
         self.disabled_keys = set(disabled_keys) if disabled_keys else set()
 
+    def _get_rate_limit(self, model: str = None):
+        """获取适用于 model 的速率限制"""
+        # 先尝试精确匹配
+        if model and model in self.rate_limits:
+            return self.rate_limits[model]
+        # 如果没有精确匹配，尝试模糊匹配
+        for limit_model in self.rate_limits:
+            if limit_model != "default" and model and limit_model in model:
+                return self.rate_limits[limit_model]
+        # 如果都没匹配到，使用默认值
+        return self.rate_limits.get("default", [(999999, 60)])  # 默认限制
+
+    def _is_locally_blocked(self, item, now: float) -> bool:
+        """进程内可判定的不可用：被禁用或在本 worker 记录的冷却中"""
+        return self.is_key_disabled(item) or now < self.cooling_until.get(item, 0)
+
     async def is_rate_limited(self, item, model: str = None, is_check: bool = False) -> bool:
         now = time()
-        # 检查是否被禁用
-        if self.is_key_disabled(item):
-            return True
-        # 检查是否在冷却中
-        if now < self.cooling_until[item]:
+        # 检查是否被禁用、是否在冷却中
+        if self._is_locally_blocked(item, now):
             return True
 
         # 获取适用的速率限制
-
         if model:
             model_key = model
         else:
             model_key = "default"
-
-        rate_limit = None
-        # 先尝试精确匹配
-        if model and model in self.rate_limits:
-            rate_limit = self.rate_limits[model]
-        else:
-            # 如果没有精确匹配，尝试模糊匹配
-            for limit_model in self.rate_limits:
-                if limit_model != "default" and model and limit_model in model:
-                    rate_limit = self.rate_limits[limit_model]
-                    break
-
-        # 如果都没匹配到，使用默认值
-        if rate_limit is None:
-            rate_limit = self.rate_limits.get("default", [(999999, 60)])  # 默认限制
+        rate_limit = self._get_rate_limit(model)
+
+        shared = self._shared_state()
+        if shared is not None:
+            # 其它 worker 设置的冷却与限流窗口在同一事务内检查
+            limited = await shared.ahit(
+                self._shared_key("rate", item, model_key), rate_limit,
+                record=not is_check, cooling_key=self._shared_key("cooling", item),
+            )
+            if limited and not is_check:
+                logger.warning(f"API key {item}: model: {model_key} has been rate limited")
+            return limited
 
         # 检查所有速率限制条件
         for limit_count, limit_period in rate_limit:
@@ -570,7 +780,75 @@ class ThreadSafeCircularList:
 
         return False
 
+    def _shared_candidates(self, items: list, model: str = None):
+        """共享状态中每个候选 key 的 (冷却标记, 限流窗口)；进程内已判定不可用的返回 None"""
+        model_key = model or "default"
+        now = time()
+
+        def candidate(position: int):
+            item = items[position]
+            if self._is_locally_blocked(item, now):
+                return None
+            return self._shared_key("cooling", item), self._shared_key("rate", item, model_key)
+
+        return candidate
+
+    async def _next_shared(self, shared, model: str = None):
+        """
+        多 worker 模式下选 key：游标推进、冷却检查、限流计数在共享状态的同一事务内完成，
+        使轮询在所有 worker 之间连续
+        """
+        items = self.items
+        rate_limit = self._get_rate_limit(model)
+        cursor_key = None if self.schedule_algorithm == "fixed_priority" else self._shared_key("cursor")
+        start = 0
+        if SHARED_CURSOR_LEASE and cursor_key is not None and not rate_windows(rate_limit):
+            # 不限流时只有游标需要写入：每次领取一整轮游标，本轮内的选 key 只读共享状态
+            start = await self._lease_cursor(shared, cursor_key, len(items))
+            cursor_key = None
+        start, position = await shared.apick(
+            cursor_key, len(items), self._shared_candidates(items, model), rate_limit, start=start
+        )
+
+        # 检查是否即将完成一个循环，并据此触发重排序
+        if self.schedule_algorithm == "smart_round_robin" and start == len(items) - 1:
+            self._trigger_reorder()
+
+        if position is None:
+            logger.warning("All API keys are rate limited!")
+            raise HTTPException(status_code=429, detail="Too many requests")
+        self.index = (position + 1) % len(items)
+        return items[position]
+
+    async def _lease_cursor(self, shared, cursor_key: str, count: int) -> int:
+        """从本 worker 领取的游标中取下一个起始下标，用完时向共享状态再领取 count 个"""
+        while True:
+            if self._cursor_lease:
+                leased_count, position = self._cursor_lease.popleft()
+                # key 列表长度变化后，之前领取的游标作废
+                if leased_count == count:
+                    return position
+                continue
+            end = await shared.anext_counter(cursor_key, count)
+            self._cursor_lease.extend((count, cursor % count) for cursor in range(end - count, end))
+
+    async def discard_last_request(self, item, model: str = None) -> None:
+        """撤销 item 最近记录的一次请求（上游并未真正处理的失败请求不计入限流）"""
+        model_key = model or "default"
+        shared = self._shared_state()
+        if shared is not None:
+            if rate_windows(self._get_rate_limit(model)):
+                await shared.aunrecord(self._shared_key("rate", item, model_key))
+            return
+        if self.requests[item][model_key]:
+            self.requests[item][model_key].pop()
+
     async def next(self, model: str = None):
+        # 共享模式下游标在共享状态中原子推进，不需要进程内锁，并发的选 key 可以合并到一个事务
+        shared = self._shared_state()
+        if shared is not None and self.items:
+            return await self._next_shared(shared, model)
+
         async with self.lock:
             if self.schedule_algorithm == "fixed_priority":
                 self.index = 0
@@ -633,6 +911,14 @@ class ThreadSafeCircularList:
         if len(self.items) == 0:
             return False
 
+        shared = self._shared_state()
+        if shared is not None:
+            _, position = await shared.apick(
+                None, len(self.items), self._shared_candidates(self.items, model),
+                self._get_rate_limit(model), record=False,
+            )
+            return position is None
+
         async with self.lock:
             for item in self.items:
                 # 跳过禁用的 key
@@ -677,6 +963,107 @@ def circular_list_encoder(obj):
 provider_api_circular_list = defaultdict(ThreadSafeCircularList)
 
 
+@dataclass
+class ApiKeySettings:
+    """
+    单个下游 API Key 的预编译配置（在 update_config 时随 ApiKeyList 一起重建）
+    """
+    index: int
+    api: str
+    name: Optional[str] = None
+    # 统计用的分组名（配置中的 group 字段，与渠道分组 groups 不同）
+    group: Optional[str] = None
+    role: str = ""
+    groups: List[str] = field(default_factory=lambda: ["default"])
+    models: List[Any] = field(default_factory=list)
+    preferences: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, index: int, item: dict) -> "ApiKeySettings":
+        api = str(item.get("api", ""))
+        preferences = item.get("preferences") or {}
+        groups = item.get("groups") or ["default"]
+        if isinstance(groups, str):
+            groups = [groups]
+        if not isinstance(groups, list):
+            groups = ["default"]
+        return cls(
+            index=index,
+            api=api,
+            name=item.get("name") or None,
+            group=item.get("group") or None,
+            role=item.get("role") or api[:8],
+            groups=groups,
+            models=item.get("model") or [],
+            preferences=preferences if isinstance(preferences, dict) else {},
+        )
+
+    def preference(self, name: str, default: Any = None) -> Any:
+        """读取 API Key 级 preferences，未配置（None）时返回 default"""
+        value = self.preferences.get(name)
+        return default if value is None else value
+
+    @property
+    def is_admin(self) -> bool:
+        return "admin" in (self.role or "")
+
+    @property
+    def enable_moderation(self) -> bool:
+        return bool(self.preferences.get("ENABLE_MODERATION", False))
+
+    @property
+    def rate_limit(self):
+        return self.preferences.get("rate_limit") or {"default": "999999/min"}
+
+
+class ApiKeyList(list):
+    """
+    带哈希索引的下游 API Key 列表
+
+    保持 list 接口（下标访问、遍历、len、index、in）以兼容现有调用方，
+    其中 index / in 通过 key -> api_index 的哈希表实现 O(1) 查找。
+    同时预编译每个 key 的 ApiKeySettings。
+
+    该列表由 update_config 整体重建，视为只读，不要原地修改。
+    """
+
+    def __init__(self, api_keys_db=()):
+        api_keys_db = list(api_keys_db or [])
+        super().__init__(item["api"] for item in api_keys_db)
+        self._positions: Dict[str, int] = {}
+        for api_index, api_key in enumerate(self):
+            # 与 list.index 一致：重复 key 取第一次出现的位置
+            self._positions.setdefault(api_key, api_index)
+        self._settings = [ApiKeySettings.from_config(i, item) for i, item in enumerate(api_keys_db)]
+
+    def index(self, value, *args):
+        if args:
+            return super().index(value, *args)
+        try:
+            return self._positions[value]
+        except (KeyError, TypeError):
+            raise ValueError(f"{value!r} is not in list")
+
+    def __contains__(self, value) -> bool:
+        try:
+            return value in self._positions
+        except TypeError:
+            return False
+
+    def get_index(self, api_key: str) -> Optional[int]:
+        """返回 key 对应的 api_index，不存在返回 None"""
+        try:
+            return self._positions.get(api_key)
+        except TypeError:
+            return None
+
+    def get_settings(self, api_index: Optional[int]) -> Optional[ApiKeySettings]:
+        """按 api_index 获取预编译配置"""
+        if api_index is None or not 0 <= api_index < len(self._settings):
+            return None
+        return self._settings[api_index]
+
+
 class ApiKeyRateLimitRegistry(dict):
     """
     API Key 限流器注册表
@@ -694,6 +1081,21 @@ class ApiKeyRateLimitRegistry(dict):
         super().__init__()
         self._config_getter = config_getter
         self._api_list_getter = api_list_getter
+        # api_key -> 创建限流器时使用的 rate_limit 配置
+        self._rate_limit_configs: Dict[str, Any] = {}
+
+    def _current_rate_limit(self, api_key: str, config, api_list):
+        try:
+            api_index = api_list.index(api_key)
+        except (ValueError, IndexError):
+            return None
+        settings = api_list.get_settings(api_index) if hasattr(api_list, "get_settings") else None
+        if settings is not None:
+            return settings.rate_limit
+        return safe_get(
+            config, 'api_keys', api_index, "preferences", "rate_limit",
+            default={"default": "999999/min"}
+        )
     
     def __missing__(self, api_key: str):
         """
@@ -702,26 +1104,33 @@ class ApiKeyRateLimitRegistry(dict):
         config = self._config_getter()
         api_list = self._api_list_getter()
         
-        # 查找 API key 的配置
-        try:
-            api_index = api_list.index(api_key)
-            rate_limit = safe_get(
-                config, 'api_keys', api_index, "preferences", "rate_limit",
-                default={"default": "999999/min"}
-            )
-        except (ValueError, IndexError):
-            # 找不到配置，使用默认限流
-            rate_limit = {"default": "999999/min"}
+        # 查找 API key 的配置（ApiKeyList 为 O(1) 查找），找不到配置时使用默认限流
+        rate_limit = self._current_rate_limit(api_key, config, api_list) or {"default": "999999/min"}
         
         # 创建限流器并缓存
         limiter = ThreadSafeCircularList(
             [api_key],
             rate_limit,
-            "round_robin"
+            "round_robin",
+            shared_scope="api_key",
         )
         self[api_key] = limiter
+        self._rate_limit_configs[api_key] = rate_limit
         return limiter
 
+    def prune(self) -> None:
+        """
+        配置更新后调用：只移除已删除或 rate_limit 发生变化的 API key 的限流器，
+        其余 key 的限流窗口保持不变
+        """
+        config = self._config_getter()
+        api_list = self._api_list_getter()
+        for api_key in list(self.keys()):
+            current = self._current_rate_limit(api_key, config, api_list)
+            if current is None or current != self._rate_limit_configs.get(api_key):
+                self.pop(api_key, None)
+                self._rate_limit_configs.pop(api_key, None)
+
 
 # end_of_line = "\n\r\n"
 # end_of_line = "\r\n"
@@ -956,12 +1365,15 @@ def encode_image(file_content: bytes):
         raise ValueError(f"不支持的图片格式: {img_format}")
 
 async def get_image_from_url(url):
-    transport = httpx.AsyncHTTPTransport(
-        http2=True,
-        verify=False,
-        retries=1
-    )
-    async with httpx.AsyncClient(transport=transport) as client:
+    """
+    下载图片内容
+
+    优先复用全局 ClientManager 的连接池（按 host 维度复用，关闭证书校验保持与旧实现一致），
+    未注册 ClientManager 时（如脚本/测试环境）回退为临时客户端。
+    """
+    from .client_manager import get_default_client_manager
+
+    async def _fetch(client):
         try:
             response = await client.get(
                 url,
@@ -977,6 +1389,19 @@ async def get_image_from_url(url):
             logger.error(f"获取 URL 时发生 HTTP 错误 {e.request.url!r}: {e.response.status_code}")
             raise HTTPException(status_code=e.response.status_code, detail=f"获取 URL 时出错: {url}")
 
+    client_manager = get_default_client_manager()
+    if client_manager is not None:
+        async with client_manager.get_client(url, overrides={"verify": False}) as client:
+            return await _fetch(client)
+
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        verify=False,
+        retries=1
+    )
+    async with httpx.AsyncClient(transport=transport) as client:
+        return await _fetch(client)
+
 async def get_encode_image(image_url):
     file_content = await get_image_from_url(image_url)
     base64_image = encode_image(file_content)
@@ -1002,27 +1427,16 @@ async def get_encode_image(image_url):
 #         print(f"Image validation failed: {str(e)}")
 #         return False
 
-async def get_base64_image(image_url: str) -> tuple[str, str]:
+def _convert_base64_image(base64_image: str) -> tuple[str, str]:
     """
-    获取 base64 编码的图片数据和 MIME 类型
-    
-    Args:
-        image_url: 图片 URL 或已编码的 base64 字符串
-        
-    Returns:
-        tuple: (base64_image_with_prefix, mime_type)
-               例如: ("data:image/png;base64,xxx", "image/png")
+    解析 data URI 的 MIME 类型，并将 webp 转换为 png（某些 API 不支持 webp）
+
+    纯 CPU 操作，调用方应通过 asyncio.to_thread 在线程池中执行。
     """
-    if image_url.startswith("http"):
-        base64_image = await get_encode_image(image_url)
-    else:
-        base64_image = image_url
-        
     colon_index = base64_image.index(":")
     semicolon_index = base64_image.index(";")
     image_type = base64_image[colon_index + 1:semicolon_index]
 
-    # 将 webp 转换为 png（某些 API 不支持 webp）
     if image_type == "image/webp":
         image_data = base64.b64decode(base64_image.split(",")[1])
         image = Image.open(io.BytesIO(image_data))
@@ -1034,6 +1448,156 @@ async def get_base64_image(image_url: str) -> tuple[str, str]:
 
     return base64_image, image_type
 
+
+def _consume_task_exception(task: asyncio.Future) -> None:
+    # 所有等待者都已取消时避免 "Task exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+class ImageCache:
+    """
+    处理后图片的内容寻址缓存
+
+    - key：http 图片使用 URL，data URI 使用内容的 sha256
+    - value：(base64_image_with_prefix, mime_type)
+    - 按缓存内容的总字节数做 LRU 淘汰
+    - 同一 key 的并发请求共享同一个下载/转换任务，避免重复拉取
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_item_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._items: "OrderedDict[str, tuple[str, str]]" = OrderedDict()
+        self._size = 0
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_url: str) -> str:
+        if image_url.startswith("http"):
+            return "url:" + image_url
+        return "sha256:" + hashlib.sha256(image_url.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key: str, value: tuple[str, str]) -> None:
+        size = len(value[0])
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._size -= len(old[0])
+        self._items[key] = value
+        self._size += size
+        while self._size > self.max_bytes and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted[0])
+
+    async def get_or_load(self, image_url: str, loader):
+        """命中缓存直接返回，否则调用 loader() 处理并写入缓存（并发请求合并为一次）"""
+        key = self.make_key(image_url)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            # 加载在独立任务中执行：发起请求的调用方被取消时，其他等待者不受影响
+            task = asyncio.ensure_future(self._load(key, loader))
+            task.add_done_callback(_consume_task_exception)
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key: str, loader):
+        try:
+            result = await loader()
+            self.put(key, result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._size = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "items": len(self._items),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+image_cache = ImageCache(max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", 64)) * 1024 * 1024)
+
+
+async def get_base64_image(image_url: str) -> tuple[str, str]:
+    """
+    获取 base64 编码的图片数据和 MIME 类型
+    
+    Args:
+        image_url: 图片 URL 或已编码的 base64 字符串
+        
+    Returns:
+        tuple: (base64_image_with_prefix, mime_type)
+               例如: ("data:image/png;base64,xxx", "image/png")
+    """
+    if image_url.startswith("http"):
+        async def _load_remote():
+            file_content = await get_image_from_url(image_url)
+            base64_image = await asyncio.to_thread(encode_image, file_content)
+            return await asyncio.to_thread(_convert_base64_image, base64_image)
+
+        return await image_cache.get_or_load(image_url, _load_remote)
+
+    # data URI：只有需要格式转换（webp）时才值得缓存，否则直接解析 MIME 类型返回
+    colon_index = image_url.index(":")
+    semicolon_index = image_url.index(";")
+    if image_url[colon_index + 1:semicolon_index] != "image/webp":
+        return image_url, image_url[colon_index + 1:semicolon_index]
+
+    return await image_cache.get_or_load(
+        image_url, lambda: asyncio.to_thread(_convert_base64_image, image_url)
+    )
+
+
+async def prefetch_images(image_urls) -> None:
+    """
+    并发预取并处理一组图片，结果写入 image_cache
+
+    渠道适配器按消息顺序逐个调用 get_base64_image，预取后即可直接命中缓存。
+    预取失败会被忽略，由后续正式调用抛出原有的错误。
+    """
+    unique_urls = list(dict.fromkeys(url for url in image_urls if url))
+    if len(unique_urls) == 0:
+        return
+    await asyncio.gather(*(get_base64_image(url) for url in unique_urls), return_exceptions=True)
+
+
+def collect_image_urls(messages) -> list[str]:
+    """从 OpenAI 风格的消息列表中提取所有 image_url"""
+    urls = []
+    for msg in messages or []:
+        content = getattr(msg, "content", None)
+        if not isinstance(content, list):
+            continue
+        for item in content:
+            if getattr(item, "type", None) == "image_url" and getattr(item, "image_url", None):
+                url = getattr(item.image_url, "url", None)
+                if url:
+                    urls.append(url)
+    return urls
+
 def parse_json_safely(json_str):
     """
     尝试解析JSON字符串，先使用ast.literal_eval，失败则使用json.loads
@@ -320,7 +320,7 @@ from contextlib import asynccontextmanager
 
 
 _legacy_async_session = None
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, LargeBinary, UniqueConstraint
 
 # PostgreSQL 下使用 JSONB（更高效/可索引）；其它数据库回退到 JSON
 try:
@@ -348,6 +348,8 @@ _SERVER_NOW = text("CURRENT_TIMESTAMP") if _IS_MYSQL else func.now()
 # 对带索引的列使用更保守的 191。
 _VARCHAR = String(255) if _IS_MYSQL else String
 _VARCHAR_INDEX = String(191) if _IS_MYSQL else String
+# MySQL 的 BLOB 上限为 64KB，原始请求/响应体使用 LONGBLOB
+_BLOB = LargeBinary(length=2**32 - 1) if _IS_MYSQL else LargeBinary
 
 class RequestStat(Base):
     __tablename__ = 'request_stats'
@@ -385,7 +387,7 @@ class RequestStat(Base):
     upstream_request_body = Column(Text, nullable=True)  # 发送到上游的请求体
     upstream_response_body = Column(Text, nullable=True)  # 上游返回的原始响应体
     response_body = Column(Text, nullable=True)  # 返回给用户的响应体
-    raw_data_expires_at = Column(DateTime(timezone=True), nullable=True)  # 原始数据过期时间
+    raw_data_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)  # 原始数据过期时间
 
 class ChannelStat(Base):
     __tablename__ = 'channel_stats'
@@ -399,6 +401,73 @@ class ChannelStat(Base):
     timestamp = Column(DateTime(timezone=True), server_default=_SERVER_NOW, index=True)
 
 
+class RequestRawData(Base):
+    """日志原始数据（请求头、请求体、响应体等）的压缩侧表
+
+    - 每个字段一行，按 log_id（request_stats.id）关联，日志详情接口按需加载
+    - data 为压缩后的 UTF-8 文本，压缩算法记录在 encoding
+    - 按 expires_at 独立过期，不影响 request_stats 主表
+    """
+    __tablename__ = 'request_raw_data'
+    id = Column(Integer, primary_key=True)
+    log_id = Column(Integer, nullable=False, index=True)
+    field = Column(String(32), nullable=False)
+    encoding = Column(String(16), nullable=False, default="gzip")
+    data = Column(_BLOB, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class RequestStatRollup(Base):
+    """request_stats 的小时级预聚合（仪表盘 / /v1/stats 使用）
+
+    维度组合的哈希写入 dims_key，(bucket, dims_key) 唯一，用于跨数据库的增量 upsert。
+    字符串维度中的 NULL 统一存为空字符串。
+    """
+    __tablename__ = 'request_stats_rollup'
+    __table_args__ = (UniqueConstraint('bucket', 'dims_key', name='uq_request_stats_rollup_bucket_dims'),)
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime(timezone=True), nullable=False, index=True)  # 小时起点（UTC）
+    dims_key = Column(String(64), nullable=False)
+    provider = Column(_VARCHAR, default="")
+    model = Column(_VARCHAR, default="")
+    api_key = Column(_VARCHAR, default="")
+    endpoint = Column(_VARCHAR, default="")
+    client_ip = Column(_VARCHAR, default="")
+    success = Column(Boolean, default=False)
+    status_class = Column(Integer, default=0)  # 状态码首位（2/4/5），0 表示未知
+    request_count = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    process_time_sum = Column(Float, default=0.0)
+    first_response_time_sum = Column(Float, default=0.0)
+    latency_le_1s = Column(Integer, default=0)
+    latency_le_5s = Column(Integer, default=0)
+    latency_le_30s = Column(Integer, default=0)
+    latency_gt_30s = Column(Integer, default=0)
+
+
+class ChannelStatRollup(Base):
+    """channel_stats 的小时级预聚合（渠道成功率、渠道 key 排序使用）"""
+    __tablename__ = 'channel_stats_rollup'
+    __table_args__ = (UniqueConstraint('bucket', 'dims_key', name='uq_channel_stats_rollup_bucket_dims'),)
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime(timezone=True), nullable=False, index=True)
+    dims_key = Column(String(64), nullable=False)
+    provider = Column(_VARCHAR, default="")
+    model = Column(_VARCHAR, default="")
+    provider_api_key = Column(_VARCHAR, default="")
+    success = Column(Boolean, default=False)
+    request_count = Column(Integer, default=0)
+
+
+class StatsRollupState(Base):
+    """预聚合表的回填状态（name -> 已回填到的原始表最大 id）"""
+    __tablename__ = 'stats_rollup_state'
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=True)
+
+
 class AdminUser(Base):
     """管理员账号（用于首次初始化向导 /setup）。
 
@@ -58,6 +58,31 @@ export default function Logs() {
 
   // Accordion State - 展开的日志ID集合
   const [expandedIds, setExpandedIds] = useState<Set<number>>(new Set());
+  // 日志详情（原始请求/响应数据），展开时按需加载
+  const [details, setDetails] = useState<Record<number, LogEntry>>({});
+  const [loadingDetailIds, setLoadingDetailIds] = useState<Set<number>>(new Set());
+
+  const fetchLogDetail = async (id: number) => {
+    if (!token || details[id] || loadingDetailIds.has(id)) return;
+    setLoadingDetailIds(prev => new Set(prev).add(id));
+    try {
+      const res = await fetch(`/v1/logs/${id}`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      if (res.ok) {
+        const data: LogEntry = await res.json();
+        setDetails(prev => ({ ...prev, [id]: data }));
+      }
+    } catch (err) {
+      console.error('Failed to fetch log detail:', err);
+    } finally {
+      setLoadingDetailIds(prev => {
+        const next = new Set(prev);
+        next.delete(id);
+        return next;
+      });
+    }
+  };
 
   const fetchLogs = async (resetPage = false) => {
     if (!token) return;
@@ -120,6 +145,9 @@ export default function Logs() {
       }
       return next;
     });
+    if (!expandedIds.has(id)) {
+      fetchLogDetail(id);
+    }
   };
 
   // ========== Helpers ==========
@@ -279,6 +307,8 @@ export default function Logs() {
   const LogAccordionItem = ({ log }: { log: LogEntry }) => {
     const isExpanded = expandedIds.has(log.id);
     const speedInfo = calculateSpeed(log);
+    const detail = details[log.id];
+    const detailLoading = loadingDetailIds.has(log.id);
 
     return (
       <div className="bg-card border border-border rounded-xl overflow-hidden">
@@ -420,39 +450,44 @@ export default function Logs() {
             )}
 
             {/* 请求/响应数据 - 手风琴形式并列 */}
+            {detailLoading && !detail && (
+              <div className="text-xs text-muted-foreground flex items-center gap-1">
+                <RefreshCw className="w-3.5 h-3.5 animate-spin" /> 加载原始数据...
+              </div>
+            )}
             <div className="space-y-2">
               {/* 1. 请求头 */}
               <JsonAccordion
                 title="请求头"
-                data={log.request_headers}
+                data={detail?.request_headers}
                 icon={<FileText className="w-4 h-4" />}
               />
 
               {/* 2. 用户请求体 */}
               <JsonAccordion
                 title="用户请求体"
-                data={log.request_body}
+                data={detail?.request_body}
                 icon={<Eye className="w-4 h-4" />}
               />
 
               {/* 3. 上游请求体 */}
               <JsonAccordion
                 title="上游请求体"
-                data={log.upstream_request_body}
+                data={detail?.upstream_request_body}
                 icon={<Server className="w-4 h-4" />}
               />
 
               {/* 4. 上游响应体 */}
               <JsonAccordion
                 title="上游响应体"
-                data={log.upstream_response_body}
+                data={detail?.upstream_response_body}
                 icon={<Server className="w-4 h-4" />}
               />
 
               {/* 5. 用户响应体 */}
               <JsonAccordion
                 title="用户响应体"
-                data={log.response_body}
+                data={detail?.response_body}
                 icon={<EyeOff className="w-4 h-4" />}
               />
             </div>
@@ -411,6 +411,27 @@ export default function Settings() {
               <p className="text-xs text-muted-foreground mt-2">设为 0 表示不保存请求/响应原始数据，减少存储占用</p>
             </div>
 
+            <div>
+              <label className="text-sm font-medium text-foreground mb-1.5 block">成功请求原始数据采样率 (%)</label>
+              <input
+                type="number" min="0" max="100"
+                value={typeof preferences.log_raw_data_sample_rate === 'number' ? Math.round(preferences.log_raw_data_sample_rate * 100) : 100}
+                onChange={e => updatePreference('log_raw_data_sample_rate', Math.min(Math.max(parseFloat(e.target.value) || 0, 0), 100) / 100)}
+                className="w-full bg-background border border-border px-3 py-2 rounded-lg text-sm text-foreground"
+              />
+              <p className="text-xs text-muted-foreground mt-2">未被采样的成功请求不复制、不截断请求/响应体；API Key 可单独配置</p>
+            </div>
+
+            <label className="flex items-center gap-2 text-sm text-foreground">
+              <input
+                type="checkbox"
+                checked={preferences.log_raw_data_capture_failures ?? true}
+                onChange={e => updatePreference('log_raw_data_capture_failures', e.target.checked)}
+                className="rounded border-border"
+              />
+              失败请求始终保存原始数据
+            </label>
+
             <div>
               <label className="text-sm font-medium text-foreground mb-1.5 block">日志保留策略</label>
               <select
@@ -17,18 +17,21 @@ from fastapi import FastAPI, HTTPException, Request
 from core.log_config import logger
 from routes import api_router
 from core.env import env_bool
-from core.utils import parse_rate_limit, ThreadSafeCircularList, ApiKeyRateLimitRegistry
-from core.client_manager import ClientManager
+from core.utils import parse_rate_limit, ApiKeyRateLimitRegistry
+from core.client_manager import ClientManager, set_default_client_manager
+from core.prewarm import prewarm_enabled, run_keep_warm
 from core.channel_manager import ChannelManager
 from core.routing import set_debug_mode as set_routing_debug_mode
 from core.handler import (
     ModelRequestHandler,
+    init_preference,
+    refresh_preference_tables,
     set_debug_mode as set_handler_debug_mode,
 )
 from core.middleware import StatsMiddleware, request_info, get_api_key
 from core.error_response import openai_error_response
 
-from utils import safe_get, load_config
+from utils import safe_get, load_config, get_local_models_list
 
 from db import DISABLE_DATABASE, RequestStat, AdminUser, DB_TYPE, async_session_scope
 from core.stats import (
@@ -37,8 +40,20 @@ from core.stats import (
     update_channel_stats,
 )
 from core.plugins import get_plugin_manager
+from core.config_snapshot import publish_config
+from core.shared_state import (
+    CONFIG_GENERATION_KEY,
+    PRIMARY_RETRY_INTERVAL,
+    get_shared_state,
+    launcher_worker_count,
+    run_config_sync,
+    try_acquire_primary,
+    worker_count,
+)
 
 DEFAULT_TIMEOUT = int(os.getenv("TIMEOUT", 600))
+# 多 worker 模式下父进程建表完成后设置，worker 启动时据此跳过建表
+TABLES_CREATED_ENV = "ZOAHOLIC_TABLES_CREATED"
 # DEBUG 环境变量支持 true/false/1/0/yes/no
 is_debug = env_bool("DEBUG", False)
 logger.info("DISABLE_DATABASE: %s", DISABLE_DATABASE)
@@ -52,41 +67,15 @@ except Exception:
     VERSION = 'unknown'
 logger.info("VERSION: %s", VERSION)
 
-def init_preference(all_config, preference_key, default_timeout=DEFAULT_TIMEOUT):
-    # 存储超时配置
-    preference_dict = {}
-    preferences = safe_get(all_config, "preferences", default={})
-    providers = safe_get(all_config, "providers", default=[])
-    if preferences:
-        if isinstance(preferences.get(preference_key), int):
-            preference_dict["default"] = preferences.get(preference_key)
-        else:
-            for model_name, timeout_value in preferences.get(preference_key, {"default": default_timeout}).items():
-                preference_dict[model_name] = timeout_value
-            if "default" not in preferences.get(preference_key, {}):
-                preference_dict["default"] = default_timeout
-
-    result = defaultdict(lambda: defaultdict(lambda: default_timeout))
-    for provider in providers:
-        provider_preference_settings = safe_get(provider, "preferences", preference_key, default={})
-        if provider_preference_settings:
-            for model_name, timeout_value in provider_preference_settings.items():
-                result[provider['provider']][model_name] = timeout_value
-
-    result["global"] = preference_dict
-    # print("result", json.dumps(result, indent=4))
-
-    return result
-
 async def cleanup_expired_raw_data():
     """
     定时清理过期的原始数据（请求头、请求体、返回体）
     启动时立即执行一次，之后每小时执行一次
-    清理已过期的数据字段（保留日志记录本身）
+    清理已过期的数据字段（保留日志记录本身），按主键区间分批执行，不阻塞实时统计写入
 
     """
-    from sqlalchemy import update
-    
+    from core.retention import purge_expired_raw_data
+
     first_run = True
     while True:
         try:
@@ -99,54 +88,15 @@ async def cleanup_expired_raw_data():
                 # 数据库禁用时避免空转；该任务通常不会在 DISABLE_DATABASE=True 时启动，但这里做防御。
                 await asyncio.sleep(3600)
                 continue
-                
-            async with async_session_scope() as db:
-                now = datetime.now(timezone.utc)
-
-                if (DB_TYPE or "sqlite").lower() == "d1":
-                    result = await db.execute(
-                        "UPDATE request_stats "
-                        "SET request_headers = NULL, request_body = NULL, upstream_request_headers = NULL, upstream_request_body = NULL, upstream_response_body = NULL, response_body = NULL, retry_path = NULL "
-                        "WHERE raw_data_expires_at IS NOT NULL "
-                        "AND raw_data_expires_at < ? "
-                        "AND (request_headers IS NOT NULL OR request_body IS NOT NULL OR upstream_request_headers IS NOT NULL OR upstream_request_body IS NOT NULL OR upstream_response_body IS NOT NULL OR response_body IS NOT NULL OR retry_path IS NOT NULL)",
-                        [now],
-                    )
-                    rowcount = int((result.get("meta") or {}).get("changes") or 0)
-                    if rowcount > 0:
-                        logger.info(f"Cleaned up expired raw data from {rowcount} log entries")
-                    continue
 
-                # 清理过期的原始数据字段
-                # 只清理有过期时间且已过期的记录
-                stmt = (
-                    update(RequestStat)
-                    .where(RequestStat.raw_data_expires_at.isnot(None))
-                    .where(RequestStat.raw_data_expires_at < now)
-                    .where(
-                        (RequestStat.request_headers.isnot(None)) |
-                        (RequestStat.request_body.isnot(None)) |
-                        (RequestStat.upstream_request_headers.isnot(None)) |
-                        (RequestStat.upstream_request_body.isnot(None)) |
-                        (RequestStat.upstream_response_body.isnot(None)) |
-                        (RequestStat.response_body.isnot(None)) |
-                        (RequestStat.retry_path.isnot(None))
-                    )
-                    .values(
-                        request_headers=None,
-                        request_body=None,
-                        upstream_request_headers=None,
-                        upstream_request_body=None,
-                        upstream_response_body=None,
-                        response_body=None,
-                        retry_path=None,
-                    )
-                )
-                result = await db.execute(stmt)
-                await db.commit()
+            if (DB_TYPE or "sqlite").lower() == "d1":
+                from db import d1_client
+                if d1_client is None:
+                    continue
 
-                if result.rowcount > 0:
-                    logger.info(f"Cleaned up expired raw data from {result.rowcount} log entries")
+            rowcount = await purge_expired_raw_data(datetime.now(timezone.utc))
+            if rowcount > 0:
+                logger.info(f"Cleaned up expired raw data: {rowcount} rows")
                     
         except asyncio.CancelledError:
             logger.info("Raw data cleanup task cancelled")
@@ -168,8 +118,7 @@ async def cleanup_expired_logs(app):
     - 支持固定在每天某个时间点执行（默认 03:00，按服务器时区/可配置时区）。
     """
 
-    from sqlalchemy import delete
-    from db import RequestStat, ChannelStat
+    from core.retention import delete_expired_logs
 
     def _parse_run_at(value: Optional[str]) -> tuple[int, int]:
         text = str(value or "").strip()
@@ -272,7 +221,6 @@ async def cleanup_expired_logs(app):
             now_utc = datetime.now(timezone.utc)
             cutoff = now_utc - timedelta(days=retention_days)
 
-            # ========== D1 ==========
             if (DB_TYPE or "sqlite").lower() == "d1":
                 try:
                     from db import d1_client
@@ -284,42 +232,13 @@ async def cleanup_expired_logs(app):
                     next_sleep_seconds = 60
                     continue
 
-                # 先删 request_stats，再删 channel_stats
-                res1 = await d1_client.execute(
-                    "DELETE FROM request_stats WHERE timestamp < ?",
-                    [cutoff],
-                )
-                changes1 = int((res1.get("meta") or {}).get("changes") or 0)
-
-                res2 = await d1_client.execute(
-                    "DELETE FROM channel_stats WHERE timestamp < ?",
-                    [cutoff],
+            # 按主键区间分批删除（先 request_stats，再 channel_stats）
+            affected1, affected2 = await delete_expired_logs(cutoff)
+            if affected1 or affected2:
+                logger.info(
+                    f"Auto-deleted expired logs (retention_days={retention_days}): "
+                    f"request_stats={affected1}, channel_stats={affected2}"
                 )
-                changes2 = int((res2.get("meta") or {}).get("changes") or 0)
-
-                if changes1 or changes2:
-                    logger.info(
-                        f"Auto-deleted expired logs (retention_days={retention_days}): "
-                        f"request_stats={changes1}, channel_stats={changes2}"
-                    )
-                next_sleep_seconds = _seconds_until_next_run(now_local, run_hour, run_minute)
-                continue
-
-            # ========== SQLAlchemy (sqlite/postgres/mysql) ==========
-            async with async_session_scope() as session:
-                # delete request_stats
-                r1 = await session.execute(delete(RequestStat).where(RequestStat.timestamp < cutoff))
-                # delete channel_stats
-                r2 = await session.execute(delete(ChannelStat).where(ChannelStat.timestamp < cutoff))
-                await session.commit()
-
-                affected1 = int(r1.rowcount or 0) if hasattr(r1, "rowcount") else 0
-                affected2 = int(r2.rowcount or 0) if hasattr(r2, "rowcount") else 0
-                if affected1 or affected2:
-                    logger.info(
-                        f"Auto-deleted expired logs (retention_days={retention_days}): "
-                        f"request_stats={affected1}, channel_stats={affected2}"
-                    )
 
             # 安排下一次执行时间
             next_sleep_seconds = _seconds_until_next_run(datetime.now(tz), run_hour, run_minute)
@@ -332,6 +251,64 @@ async def cleanup_expired_logs(app):
             next_sleep_seconds = 60
 
 
+def collect_admin_api_keys(api_keys_db) -> list:
+    """从 api_keys 配置中找出管理员 key"""
+    admin_api_key = [item.get("api") for item in api_keys_db if "admin" in item.get("role", "")]
+    if admin_api_key == [] and len(api_keys_db) >= 1:
+        # 兼容旧配置：如果没显式标记 admin，就默认第一把 key 为 admin
+        admin_api_key = [api_keys_db[0].get("api")]
+    return admin_api_key
+
+
+async def reload_shared_config(app):
+    """其它 worker 修改配置后重新加载，刷新步骤与管理接口保存配置后一致"""
+    publish_config(app, *await load_config(app))
+    refresh_preference_tables(app)
+    if app.state.api_list and not hasattr(app.state, "user_api_keys_rate_limit"):
+        app.state.user_api_keys_rate_limit = ApiKeyRateLimitRegistry(
+            config_getter=lambda: app.state.config,
+            api_list_getter=lambda: app.state.api_list
+        )
+    if app.state.api_keys_db and app.state.api_list:
+        app.state.needs_setup = False
+        app.state.admin_api_key = collect_admin_api_keys(app.state.api_keys_db)
+
+
+async def start_maintenance_tasks(app) -> list:
+    """启动后台维护任务（原始数据清理、统计 rollup、日志行清理）"""
+    tasks = []
+    if not DISABLE_DATABASE:
+        tasks.append(asyncio.create_task(cleanup_expired_raw_data()))
+        logger.info("Started raw data cleanup background task")
+
+        # 统计 rollup：需要回填时在后台分批执行，完成前仪表盘仍查询原始表
+        try:
+            from core.stats_rollup import rollups_enabled, prepare_rollups, run_rollup_maintenance
+
+            if rollups_enabled():
+                rollup_watermarks = await prepare_rollups()
+                tasks.append(asyncio.create_task(run_rollup_maintenance(rollup_watermarks)))
+                logger.info("Started stats rollup maintenance background task")
+        except Exception as e:
+            logger.error(f"Stats rollup init failed: {e}")
+
+    # 启动日志行自动清理任务（依赖 config.preferences）
+    try:
+        tasks.append(asyncio.create_task(cleanup_expired_logs(app)))
+        logger.info("Started logs retention cleanup background task")
+    except Exception as e:
+        logger.error(f"Failed to start logs retention cleanup task: {e}")
+    return tasks
+
+
+async def wait_for_primary(app, tasks: list) -> None:
+    """多 worker 下的非主 worker：主 worker 退出后接管维护任务"""
+    while not try_acquire_primary():
+        await asyncio.sleep(PRIMARY_RETRY_INTERVAL)
+    logger.info("This worker became primary, starting maintenance tasks")
+    tasks.extend(await start_maintenance_tasks(app))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时的代码
@@ -339,12 +316,25 @@ async def lifespan(app: FastAPI):
     set_routing_debug_mode(is_debug)
     set_handler_debug_mode(is_debug)
     
-    # 启动定时清理任务
-    cleanup_task = None
-    logs_cleanup_task = None
+    # 后台任务，关闭时统一取消
+    background_tasks = []
+
+    # 多 worker 模式：先记下当前配置代数，避免错过加载配置期间其它 worker 的修改
+    shared_state = get_shared_state()
+    if shared_state is not None:
+        app.state.shared_config_generation = shared_state.get_counter(CONFIG_GENERATION_KEY)
+    elif launcher_worker_count() > 1:
+        logger.warning(
+            "Started with %d uvicorn workers but WORKERS is not set: rate limits, cooldowns and "
+            "round robin are per worker. Set WORKERS=%d (or SHARED_STATE_PATH) to share them.",
+            launcher_worker_count(), launcher_worker_count(),
+        )
+
     if not DISABLE_DATABASE:
         try:
-            await create_tables()
+            # 多 worker 模式下父进程已在启动 worker 前建表
+            if not (worker_count() > 1 and os.getenv(TABLES_CREATED_ENV)):
+                await create_tables()
         except Exception as e:
             # 让 Render 等平台的日志里更直观地看到启动失败原因
             logger.exception("Database init failed during startup: %s", e)
@@ -369,12 +359,9 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.debug("JWT secret init skipped/failed: %s", e)
 
-        cleanup_task = asyncio.create_task(cleanup_expired_raw_data())
-        logger.info("Started raw data cleanup background task")
-
     if app and not hasattr(app.state, 'config'):
         # logger.warning("Config not found, attempting to reload")
-        app.state.config, app.state.api_keys_db, app.state.api_list = await load_config(app)
+        publish_config(app, *await load_config(app))
         # 用于前端判断是否需要进入初始化向导
         app.state.needs_setup = not bool(app.state.api_list)
         # from ruamel.yaml.timestamp import TimeStamp
@@ -390,13 +377,9 @@ async def lifespan(app: FastAPI):
                 config_getter=lambda: app.state.config,
                 api_list_getter=lambda: app.state.api_list
             )
-            # 预初始化现有 key 的限流器
-            for api_index, api_key in enumerate(app.state.api_list):
-                app.state.user_api_keys_rate_limit[api_key] = ThreadSafeCircularList(
-                    [api_key],
-                    safe_get(app.state.config, 'api_keys', api_index, "preferences", "rate_limit", default={"default": "999999/min"}),
-                    "round_robin"
-                )
+            # 预初始化现有 key 的限流器（通过 __missing__ 创建，同时记录其 rate_limit 配置）
+            for api_key in app.state.api_list:
+                app.state.user_api_keys_rate_limit[api_key]
         app.state.global_rate_limit = parse_rate_limit(safe_get(app.state.config, "preferences", "rate_limit", default="999999/min"))
 
         # 如果没有任何 API key，则标记需要初始化并允许服务启动（用于 /setup 初始化向导）
@@ -404,19 +387,12 @@ async def lifespan(app: FastAPI):
             app.state.needs_setup = True
             app.state.admin_api_key = []
         else:
-            app.state.admin_api_key = []
-            for item in app.state.api_keys_db:
-                if "admin" in item.get("role", ""):
-                    app.state.admin_api_key.append(item.get("api"))
-            if app.state.admin_api_key == []:
-                # 兼容旧配置：如果没显式标记 admin，就默认第一把 key 为 admin
-                if len(app.state.api_keys_db) >= 1:
-                    app.state.admin_api_key = [app.state.api_keys_db[0].get("api")]
+            app.state.admin_api_key = collect_admin_api_keys(app.state.api_keys_db)
 
         app.state.provider_timeouts = init_preference(app.state.config, "model_timeout", DEFAULT_TIMEOUT)
         app.state.keepalive_interval = init_preference(app.state.config, "keepalive_interval", 99999)
-        # 初始化 models_list（用于存储从其他 API Key 引用的模型列表）
-        app.state.models_list = {}
+        # 初始化 models_list（被当作渠道引用的本地 API Key 的模型列表，进程内计算）
+        get_local_models_list(app)
         # pprint(dict(app.state.provider_timeouts))
         # pprint(dict(app.state.keepalive_interval))
         # print("app.state.provider_timeouts", app.state.provider_timeouts)
@@ -426,12 +402,15 @@ async def lifespan(app: FastAPI):
             for paid_key in app.state.api_list:
                 await update_paid_api_keys_states(app, paid_key)
 
-        # 启动日志行自动清理任务（依赖 config.preferences）
-        try:
-            logs_cleanup_task = asyncio.create_task(cleanup_expired_logs(app))
-            logger.info("Started logs retention cleanup background task")
-        except Exception as e:
-            logger.error(f"Failed to start logs retention cleanup task: {e}")
+    # 启动定时维护任务；多 worker 时只在主 worker 中运行，避免重复回填与清理
+    if try_acquire_primary():
+        background_tasks.extend(await start_maintenance_tasks(app))
+    else:
+        background_tasks.append(asyncio.create_task(wait_for_primary(app, background_tasks)))
+
+    # 多 worker 模式：跟随其它 worker 的配置修改
+    if shared_state is not None:
+        background_tasks.append(asyncio.create_task(run_config_sync(app, lambda: reload_shared_config(app))))
 
     if app and not hasattr(app.state, 'client_manager'):
 
@@ -449,6 +428,13 @@ async def lifespan(app: FastAPI):
         # 初始化客户端管理器（增加连接池以支持长时间请求）
         app.state.client_manager = ClientManager(pool_size=300, max_keepalive_connections=100)
         await app.state.client_manager.init(default_config)
+        # 供图片下载等非请求上下文的辅助函数复用连接池
+        set_default_client_manager(app.state.client_manager)
+
+    # 可选：预热到各渠道上游的连接，并周期性保温
+    if app and prewarm_enabled():
+        background_tasks.append(asyncio.create_task(run_keep_warm(app)))
+        logger.info("Started connection prewarm background task")
 
 
     if app and not hasattr(app.state, "channel_manager"):
@@ -491,23 +477,17 @@ async def lifespan(app: FastAPI):
 
     yield
     # 关闭时的代码
-    # 取消清理任务
-    if cleanup_task:
-        cleanup_task.cancel()
-        try:
-            await cleanup_task
-        except asyncio.CancelledError:
-            pass
-
-    if logs_cleanup_task:
-        logs_cleanup_task.cancel()
+    # 取消后台任务
+    for task in list(background_tasks):
+        task.cancel()
         try:
-            await logs_cleanup_task
+            await task
         except asyncio.CancelledError:
             pass
     
     # await app.state.client.aclose()
     if hasattr(app.state, 'client_manager'):
+        set_default_client_manager(None)
         await app.state.client_manager.close()
 
 app = FastAPI(lifespan=lifespan, debug=is_debug)
@@ -568,41 +548,6 @@ app.add_middleware(
 
 app.add_middleware(StatsMiddleware, debug=is_debug)
 
-@app.middleware("http")
-async def ensure_config(request: Request, call_next):
-    # 避免在 /v1 请求内进行自调用，防止递归卡死
-    if request.url.path.startswith("/v1"):
-        return await call_next(request)
-
-    if app and app.state.api_keys_db and not hasattr(app.state, "models_list"):
-        app.state.models_list = {}
-        for item in app.state.api_keys_db:
-            api_key_model_list = item.get("model", [])
-            for provider_rule in api_key_model_list:
-                provider_name = provider_rule.split("/")[0]
-                if provider_name.startswith("sk-") and provider_name in app.state.api_list:
-                    models_list = []
-                    try:
-                        # 构建请求头
-                        headers = {
-                            "Authorization": f"Bearer {provider_name}"
-                        }
-                        # 发送GET请求获取模型列表
-                        base_url = "http://127.0.0.1:8000/v1/models"
-                        async with app.state.client_manager.get_client(base_url) as client:
-                            response = await client.get(base_url, headers=headers)
-                            if response.status_code == 200:
-                                models_data = response.json()
-                                # 将获取到的模型添加到models_list
-                                for model in models_data.get("data", []):
-                                    models_list.append(model["id"])
-                    except Exception as e:
-                        if str(e):
-                            logger.error(f"获取模型列表失败: {str(e)}")
-                    app.state.models_list[provider_name] = models_list
-    return await call_next(request)
-
-
 # ModelRequestHandler 实例，将在应用生命周期中初始化
 model_handler: Optional[ModelRequestHandler] = None
 
@@ -672,6 +617,11 @@ if __name__ == '__main__':
         # "log_level": "warning"
     }
     
+    WORKERS = worker_count()
+    if WORKERS > 1 and RELOAD:
+        logger.warning("RELOAD is enabled, ignoring WORKERS=%d", WORKERS)
+        WORKERS = 1
+
     if RELOAD:
         uvicorn_config.update({
             "reload": True,
@@ -680,5 +630,16 @@ if __name__ == '__main__':
             "reload_excludes": ["./data"],
         })
         uvicorn.run("main:app", **uvicorn_config)
+    elif WORKERS > 1:
+        # 子进程继承环境变量，保证所有 worker 使用同一个共享状态文件
+        shared_state = get_shared_state()
+        os.environ["SHARED_STATE_PATH"] = shared_state.path
+        shared_state.reset()
+        if not DISABLE_DATABASE:
+            # 建表/迁移在启动 worker 前完成一次，避免多个 worker 并发执行 DDL
+            asyncio.run(create_tables())
+            os.environ[TABLES_CREATED_ENV] = "1"
+        logger.info("Starting %d workers, shared state: %s", WORKERS, shared_state.path)
+        uvicorn.run("main:app", workers=WORKERS, **uvicorn_config)
     else:
         uvicorn.run(app, **uvicorn_config)
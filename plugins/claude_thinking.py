@@ -14,7 +14,7 @@ Claude Thinking 模式插件
 关键设计：
 - 使用 request_info 在请求和响应拦截器之间共享状态（避免 contextvars 跨异步边界丢失）
 - 预填充 <thinking> 后，上游响应不会再返回 <thinking> 标签
-- 转换器初始状态为 inside_thinking=True，等待 </thinking> 标签
+- 转换器初始处于 thinking 模式，等待 </thinking> 标签（跨 chunk 的标签由 ThinkingTagSplitter 增量识别）
 """
 
 import re
@@ -30,6 +30,7 @@ from core.plugins import (
     register_response_interceptor,
     unregister_response_interceptor,
 )
+from core.plugins.stream_utils import ThinkingTagSplitter, REASONING
 
 
 # 插件元信息
@@ -144,11 +145,19 @@ class ThinkingStreamTransformer:
     """
     
     def __init__(self):
-        self.close_tag = THINK_CLOSE
-        self.close_tag_lower = self.close_tag.lower()
-        self.keep_tail = len(self.close_tag_lower) - 1
-        self.pending = ""
-        self.inside_thinking = True  # 预填充后，初始就在 thinking 模式中
+        # 预填充后，初始就在 thinking 模式中；上游不会再返回开始标签，只识别一次结束标签
+        self.splitter = ThinkingTagSplitter(open_tag=None, close_tag=THINK_CLOSE, start_inside=True)
+
+    def _emit_segments(self, parsed: Dict[str, Any], segments: list) -> list:
+        outputs = []
+        for kind, text in segments:
+            if kind == REASONING:
+                out = self.emit_reasoning(parsed, text)
+            else:
+                out = self.emit_content(parsed, text)
+            if out:
+                outputs.append(out)
+        return outputs
     
     def build_patched_data(self, parsed: Dict[str, Any], patch_delta: Dict[str, Any]) -> Dict[str, Any]:
         """构建修补后的数据"""
@@ -185,54 +194,12 @@ class ThinkingStreamTransformer:
     
     def handle_text_chunk(self, parsed: Dict[str, Any], text: str) -> list:
         """
-        处理文本块
+        处理文本块（增量拆分，标签跨 chunk 时只保留可能的标签前缀）
         
         Returns:
             输出行列表
         """
-        outputs = []
-        combined = self.pending + text
-        self.pending = ""
-        
-        if self.inside_thinking:
-            # 查找 </thinking> 标签
-            idx = combined.lower().find(self.close_tag_lower)
-            if idx != -1:
-                # 找到结束标签
-                before = combined[:idx]
-                after = combined[idx + len(self.close_tag_lower):]
-                
-                if before:
-                    out = self.emit_reasoning(parsed, before)
-                    if out:
-                        outputs.append(out)
-                
-                self.inside_thinking = False
-                
-                if after:
-                    out = self.emit_content(parsed, after)
-                    if out:
-                        outputs.append(out)
-            else:
-                # 未找到结束标签，保留尾部以防标签被截断
-                if len(combined) > self.keep_tail:
-                    emit = combined[:-self.keep_tail]
-                    tail = combined[-self.keep_tail:]
-                    if emit:
-                        out = self.emit_reasoning(parsed, emit)
-                        if out:
-                            outputs.append(out)
-                    self.pending = tail
-                else:
-                    self.pending = combined
-        else:
-            # 已经在 thinking 之外
-            if combined:
-                out = self.emit_content(parsed, combined)
-                if out:
-                    outputs.append(out)
-        
-        return outputs
+        return self._emit_segments(parsed, self.splitter.feed(text))
 
     def _sanitize_and_forward_tool_calls(self, parsed: Dict[str, Any]) -> Optional[list]:
         """将 function_call 统一转为 tool_calls，如存在工具调用则单独透传，后续仍继续处理文本。"""
@@ -287,16 +254,7 @@ class ThinkingStreamTransformer:
         
         # 处理 [DONE] 标记
         if trimmed == "data: [DONE]":
-            outputs = []
-            if self.pending:
-                dummy_parsed = {"choices": [{"delta": {}}]}
-                if self.inside_thinking:
-                    out = self.emit_reasoning(dummy_parsed, self.pending)
-                else:
-                    out = self.emit_content(dummy_parsed, self.pending)
-                if out:
-                    outputs.append(out)
-                self.pending = ""
+            outputs = self.flush()
             outputs.append(line + "\n")
             return outputs
         
@@ -358,17 +316,8 @@ class ThinkingStreamTransformer:
     
     def flush(self) -> list:
         """刷新剩余的 pending 内容"""
-        outputs = []
-        if self.pending:
-            dummy_parsed = {"choices": [{"delta": {}}]}
-            if self.inside_thinking:
-                out = self.emit_reasoning(dummy_parsed, self.pending)
-            else:
-                out = self.emit_content(dummy_parsed, self.pending)
-            if out:
-                outputs.append(out)
-            self.pending = ""
-        return outputs
+        dummy_parsed = {"choices": [{"delta": {}}]}
+        return self._emit_segments(dummy_parsed, self.splitter.flush())
 
 
 # ==================== 请求拦截器 ====================
@@ -22,9 +22,13 @@ Gemini 空内容自动重试插件
 4. 对于普通模型：有文本或思维链就算成功
 5. 如果被截断（MAX_TOKENS）也会触发重试
 6. 重试次数用完后，返回原始响应
+7. 流式请求只缓冲到第一段有效内容（文本/思维链、工具调用；图像模型为图片）出现，
+   随即放出已缓冲的内容并转为直通；只有流结束时仍没有有效内容才重试
 
 注意：
-- 对于流式请求，启用此插件会增加首字节时间（TTFB），因为需要先收集完整响应
+- 对于流式请求，正常响应的首字节时间（TTFB）只增加到第一段有效内容为止；
+  图像模型要等到图片出现，思维链/文字阶段仍会被缓冲
+- 已转为直通后不再重试（例如图片之后才出现的截断）
 - 图像生成模型必须返回图片才算成功（有思维链没图片 = 需要重试）
 - 建议用于图像生成场景，避免图片被截断或生成失败
 
@@ -61,7 +65,7 @@ from core.channels import get_channel, register_channel
 # 插件元信息
 PLUGIN_INFO = {
     "name": "gemini_empty_retry",
-    "version": "1.1.0",
+    "version": "1.2.0",
     "description": "Gemini 空内容自动重试插件 - 检测空响应并触发重试",
     "author": "Zoaholic Team",
     "dependencies": [],
@@ -343,12 +347,43 @@ async def wrapped_fetch_gemini_response(client, url, headers, payload, model, ti
         yield chunk
 
 
+def _scan_stream_chunk(chunk: Any, seen: Dict[str, Any]) -> None:
+    """解析一个 SSE chunk，累计用于空内容检测的信息"""
+    if not isinstance(chunk, str):
+        return
+
+    # 检查是否有图片 URL（Gemini 流式返回的图片会被转换成 markdown）
+    if "![image](" in chunk:
+        seen["has_image"] = True
+
+    for line in chunk.split("\n"):
+        line = line.strip()
+        if line.startswith("data: ") and not line.endswith("[DONE]"):
+            try:
+                data = json.loads(line[6:])
+                choices = data.get("choices", [])
+                if choices:
+                    delta = choices[0].get("delta", {})
+                    if "content" in delta and delta["content"]:
+                        seen["content"] += delta["content"]
+                    if "reasoning_content" in delta and delta["reasoning_content"]:
+                        seen["reasoning"] += delta["reasoning_content"]
+                    if "tool_calls" in delta or "function_call" in delta:
+                        seen["has_function_call"] = True
+                    # 获取 finish_reason
+                    fr = choices[0].get("finish_reason")
+                    if fr:
+                        seen["finish_reason"] = fr
+            except json.JSONDecodeError:
+                pass
+
+
 async def wrapped_fetch_gemini_response_stream(client, url, headers, payload, model, timeout):
     """
     包装后的流式响应处理
-    
-    先收集完整响应，检查是否为空，然后决定是重试还是重放
-    注意：这会增加首字节时间（TTFB）
+
+    先缓冲，直到出现第一段有效内容，放出已缓冲的 chunk 后转为直通；
+    若流结束时仍没有有效内容，则决定是重试还是重放
     """
     # 检查插件是否生效
     active, max_retries, is_image_model = is_plugin_active_for_request()
@@ -363,78 +398,61 @@ async def wrapped_fetch_gemini_response_stream(client, url, headers, payload, mo
     state = get_retry_state()
     current_retry = state.get("retry_count", 0)
     
-    # 收集所有响应 chunks
+    # 出现有效内容之前缓冲的 chunks
     collected_chunks: List[str] = []
-    has_error = False
-    error_chunk = None
-    
+    passthrough = False
+
     # 用于检测内容的变量
-    total_content = ""
-    total_reasoning = ""
-    has_function_call = False
-    has_image = False
-    finish_reason = None
-    
+    seen = {
+        "content": "",
+        "reasoning": "",
+        "has_function_call": False,
+        "has_image": False,
+        "finish_reason": None,
+    }
+
     try:
         async for chunk in _original_stream_adapter(client, url, headers, payload, model, timeout):
-            # 检查是否是错误响应
+            if passthrough:
+                yield chunk
+                continue
+
+            # 检查是否是错误响应：缓冲的内容丢弃，直接透传错误
             if isinstance(chunk, dict) and "error" in chunk:
-                has_error = True
-                error_chunk = chunk
-                break
-            
+                yield chunk
+                return
+
             collected_chunks.append(chunk)
-            
-            # 解析 SSE 数据，提取内容用于空检测
-            if isinstance(chunk, str):
-                # 检查是否有图片 URL（Gemini 流式返回的图片会被转换成 markdown）
-                if "![image](" in chunk:
-                    has_image = True
-                
-                for line in chunk.split("\n"):
-                    line = line.strip()
-                    if line.startswith("data: ") and not line.endswith("[DONE]"):
-                        try:
-                            data = json.loads(line[6:])
-                            choices = data.get("choices", [])
-                            if choices:
-                                delta = choices[0].get("delta", {})
-                                if "content" in delta and delta["content"]:
-                                    total_content += delta["content"]
-                                if "reasoning_content" in delta and delta["reasoning_content"]:
-                                    total_reasoning += delta["reasoning_content"]
-                                if "tool_calls" in delta or "function_call" in delta:
-                                    has_function_call = True
-                                # 获取 finish_reason
-                                fr = choices[0].get("finish_reason")
-                                if fr:
-                                    finish_reason = fr
-                        except json.JSONDecodeError:
-                            pass
-            
+            _scan_stream_chunk(chunk, seen)
+
+            # 已有有效内容：放出缓冲内容，之后直通
+            if not is_content_empty(
+                seen["content"],
+                seen["reasoning"],
+                "function" if seen["has_function_call"] else None,
+                seen["has_image"],
+                is_image_model,
+                seen["finish_reason"],
+            ):
+                passthrough = True
+                for buffered in collected_chunks:
+                    yield buffered
+                collected_chunks = []
     except Exception as e:
+        if passthrough:
+            raise
         logger.error(f"[gemini_empty_retry] Error collecting stream: {e}")
         # 出错时直接透传已收集的内容
         for chunk in collected_chunks:
             yield chunk
         raise
-    
-    # 如果原始适配器返回了错误，直接透传
-    if has_error and error_chunk:
-        yield error_chunk
+
+    if passthrough:
         return
-    
-    # 检查收集到的内容是否为空
-    is_empty = is_content_empty(
-        total_content,
-        total_reasoning,
-        "function" if has_function_call else None,
-        has_image,
-        is_image_model,
-        finish_reason
-    )
-    
-    if is_empty and current_retry < max_retries:
+
+    # 流已结束且始终没有有效内容
+    total_content = seen["content"]
+    if current_retry < max_retries:
         # 增加重试计数
         new_count = increment_retry_count()
         
@@ -456,7 +474,7 @@ async def wrapped_fetch_gemini_response_stream(client, url, headers, payload, mo
         }
         return
     
-    # 内容不为空或重试次数已用完，重放收集的响应
+    # 重试次数已用完，重放收集的响应
     for chunk in collected_chunks:
         yield chunk
 
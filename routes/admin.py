@@ -11,6 +11,9 @@ from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 
 from core.env import env_bool
+from core.handler import refresh_preference_tables
+from core.config_snapshot import publish_config, copy_config_for_update
+from core.shared_state import notify_config_changed
 from utils import update_config, API_YAML_PATH, yaml, dump_config_to_json_obj
 from routes.deps import rate_limit_dependency, verify_admin_api_key, get_app
 
@@ -51,20 +54,23 @@ async def api_config_update(
     app = get_app()
     updated = False
 
+    # 在当前配置的副本上修改，构建完成后整体发布，避免正在处理的请求读到半更新的配置
+    new_config = copy_config_for_update(app.state.config)
+
     # 支持同时更新 providers、api_keys 和 preferences 段，保持与 /v1/api_config 返回结构一致
     if "providers" in config:
-        app.state.config["providers"] = config["providers"]
+        new_config["providers"] = config["providers"]
         updated = True
 
     if "api_keys" in config:
-        app.state.config["api_keys"] = config["api_keys"]
+        new_config["api_keys"] = config["api_keys"]
         updated = True
 
     # 更新全局 preferences（包括 SCHEDULING_ALGORITHM 等设置）
     if "preferences" in config:
-        if "preferences" not in app.state.config:
-            app.state.config["preferences"] = {}
-        app.state.config["preferences"].update(config["preferences"])
+        if "preferences" not in new_config:
+            new_config["preferences"] = {}
+        new_config["preferences"].update(config["preferences"])
         updated = True
 
     if not updated:
@@ -83,17 +89,21 @@ async def api_config_update(
     save_to_file = (config_storage in ("file", "auto")) or env_bool("SYNC_CONFIG_TO_FILE", False)
 
     try:
-        app.state.config, app.state.api_keys_db, app.state.api_list = await update_config(
-            app.state.config,
+        publish_config(app, *await update_config(
+            new_config,
             use_config_url=False,
             skip_model_fetch=True,
             save_to_file=save_to_file,
             save_to_db=save_to_db,
-        )
+        ))
     except Exception as e:
         # 不允许“假成功”：只要持久化过程有异常，直接返回非 200
         raise HTTPException(status_code=500, detail=f"Failed to update/persist config: {e}") from e
 
+    # 重建超时/keepalive 偏好表（同时使解析缓存失效）
+    refresh_preference_tables(app)
+    notify_config_changed(app)
+
     # 进一步防止“假成功”：当本次要求写 yaml 时，回读文件校验关键段一致。
     if save_to_file:
         try:
@@ -143,4 +153,16 @@ async def api_config_update(
             "save_to_db": save_to_db,
             "api_yaml_path": API_YAML_PATH if save_to_file else None,
         },
-    })
\ No newline at end of file
+    })
+
+
+@router.get("/v1/client_pool_stats", dependencies=[Depends(rate_limit_dependency)])
+async def client_pool_stats(api_index: int = Depends(verify_admin_api_key)):
+    """
+    获取上游 HTTP 客户端连接池统计（活跃、空闲、排队连接数及获取连接超时次数）
+    """
+    app = get_app()
+    client_manager = getattr(app.state, "client_manager", None)
+    if client_manager is None:
+        return JSONResponse(content={"clients": [], "total_clients": 0})
+    return JSONResponse(content=client_manager.get_stats())
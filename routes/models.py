@@ -2,33 +2,32 @@
 Models 路由
 """
 
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Request
 
-from utils import post_all_models
+from utils import get_cached_models_response, cached_models_response
 from routes.deps import rate_limit_dependency, verify_api_key, get_app
 
 router = APIRouter()
 
 
+def _render_openai_models(models):
+    return {
+        "object": "list",
+        "data": models,
+    }
+
+
 @router.get("/v1/models", dependencies=[Depends(rate_limit_dependency)])
-async def list_models(api_index: int = Depends(verify_api_key)):
+async def list_models(request: Request, api_index: int = Depends(verify_api_key)):
     """列出可用模型。
 
     返回当前 API Key 可访问的所有模型列表。
+    模型列表按 API Key 预先序列化并缓存（配置更新后失效），携带 If-None-Match 且命中 ETag 时返回 304。
 
     兼容：
     - 管理控制台使用 admin JWT 访问时（Authorization: Bearer <jwt>），
       verify_api_key 会将其映射为配置中的 admin api_key index，从而也能正常拿到模型列表。
     """
     app = get_app()
-
-    # ensure_config 中间件只在非 /v1 路径触发，这里兜底初始化 models_list
-    if not hasattr(app.state, "models_list") or app.state.models_list is None:
-        app.state.models_list = {}
-
-    models = post_all_models(api_index, app.state.config, app.state.api_list, app.state.models_list)
-    return JSONResponse(content={
-        "object": "list",
-        "data": models,
-    })
\ No newline at end of file
+    body, etag = get_cached_models_response(app, api_index, "openai", _render_openai_models)
+    return cached_models_response(request.headers.get("if-none-match"), body, etag)
@@ -131,6 +131,28 @@ async def list_interceptor_plugins(_: int = Depends(verify_admin_api_key)):
     })
 
 
+@router.get("/metrics", dependencies=[Depends(rate_limit_dependency)])
+async def interceptor_metrics(_: int = Depends(verify_admin_api_key)):
+    """
+    获取插件拦截器的调用统计
+
+    包括每个拦截器的调用次数、异常次数、累计/平均/最大耗时与耗时直方图，
+    并按拦截点和插件汇总。
+    """
+    return JSONResponse(content=get_interceptor_registry().get_metrics())
+
+
+@router.post("/metrics/reset", dependencies=[Depends(rate_limit_dependency)])
+async def reset_interceptor_metrics(_: int = Depends(verify_admin_api_key)):
+    """
+    清零插件拦截器的调用统计，返回清零前的统计
+    """
+    interceptor_registry = get_interceptor_registry()
+    metrics = interceptor_registry.get_metrics()
+    interceptor_registry.reset_metrics()
+    return JSONResponse(content=metrics)
+
+
 @router.get("/extension-points", dependencies=[Depends(rate_limit_dependency)])
 async def list_extension_points(_: int = Depends(verify_admin_api_key)):
     """
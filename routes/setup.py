@@ -15,6 +15,9 @@ from pydantic import BaseModel, Field
 
 from core.log_config import logger
 from core.security import hash_password, verify_password
+from core.handler import refresh_preference_tables
+from core.config_snapshot import publish_config, copy_config_for_update
+from core.shared_state import notify_config_changed
 from routes.deps import get_app
 from utils import update_config, load_config_from_db
 from db import DISABLE_DATABASE, async_session_scope
@@ -222,9 +225,9 @@ async def setup_init(payload: SetupInitRequest = Body(...)):
         config_storage = _get_config_storage()
         # 配置权威：file/auto 优先内存态（来自 api.yaml），db 模式才优先 DB
         if config_storage == "db":
-            conf_existing = await load_config_from_db() or getattr(app.state, "config", None) or {}
+            conf_existing = await load_config_from_db() or copy_config_for_update(getattr(app.state, "config", None))
         else:
-            conf_existing = getattr(app.state, "config", None) or {}
+            conf_existing = copy_config_for_update(getattr(app.state, "config", None))
             # auto 模式下 DB 仅作为备份兜底
             if config_storage == "auto" and (not conf_existing):
                 conf_existing = await load_config_from_db() or {}
@@ -251,13 +254,15 @@ async def setup_init(payload: SetupInitRequest = Body(...)):
             # - auto/db：写回数据库（兼容云平台）
             save_to_db = config_storage in ("auto", "db")
             save_to_file = config_storage in ("file", "auto")
-            app.state.config, app.state.api_keys_db, app.state.api_list = await update_config(
+            publish_config(app, *await update_config(
                 conf_existing,
                 use_config_url=False,
                 skip_model_fetch=True,
                 save_to_file=save_to_file,
                 save_to_db=save_to_db,
-            )
+            ))
+            refresh_preference_tables(app)
+            notify_config_changed(app)
 
         # 更新内存标记
         app.state.needs_setup = False
@@ -285,13 +290,15 @@ async def setup_init(payload: SetupInitRequest = Body(...)):
     config_storage = _get_config_storage()
     save_to_db = config_storage in ("auto", "db")
     save_to_file = config_storage in ("file", "auto")
-    app.state.config, app.state.api_keys_db, app.state.api_list = await update_config(
+    publish_config(app, *await update_config(
         conf_seed,
         use_config_url=False,
         skip_model_fetch=True,
         save_to_file=save_to_file,
         save_to_db=save_to_db,
-    )
+    ))
+    refresh_preference_tables(app)
+    notify_config_changed(app)
 
     app.state.needs_setup = False
     app.state.admin_api_key = [admin_api_key]
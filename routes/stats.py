@@ -9,10 +9,13 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, field_serializer, Field
 
-from sqlalchemy import select, case, func, desc, update, delete, or_
+from sqlalchemy import select, case, func, desc, update, delete, or_, exists
+from sqlalchemy.orm import defer
 
-from db import RequestStat, ChannelStat, async_session_scope, DISABLE_DATABASE, DB_TYPE
-from core.stats import get_usage_data
+from db import RequestStat, ChannelStat, RequestRawData, async_session_scope, DISABLE_DATABASE, DB_TYPE
+from core.stats import get_usage_data, publish_paid_key_enabled
+from core.stats_rollup import rollups_ready, query_dashboard_stats
+from core.raw_data import RAW_BODY_FIELDS, load_raw_fields, merge_inline_fields
 from utils import safe_get, query_channel_key_stats
 from routes.deps import rate_limit_dependency, verify_api_key, verify_admin_api_key, get_app
 from core.d1_client import parse_d1_datetime
@@ -167,6 +170,14 @@ LOG_CLEARABLE_FIELDS: Dict[str, str] = {
     "text": "文本摘要(text)",
 }
 
+# D1 日志列表查询的摘要字段（不含原始数据大字段）
+_D1_LOG_SUMMARY_COLUMNS: List[str] = [
+    "id", "timestamp", "endpoint", "client_ip", "provider", "model", "api_key",
+    "process_time", "first_response_time", "prompt_tokens", "completion_tokens", "total_tokens",
+    "success", "status_code", "is_flagged", "provider_id", "provider_key_index",
+    "api_key_name", "api_key_group", "retry_count", "retry_path", "raw_data_expires_at",
+]
+
 DEFAULT_LOG_CLEANUP_FIELDS: List[str] = [
     "request_headers",
     "request_body",
@@ -411,6 +422,14 @@ async def get_stats(
             {"client_ip": row.get("client_ip"), "count": int(row.get("count") or 0)}
             for row in ip_rows
         ]
+    elif await rollups_ready():
+        # 完整小时走预聚合表，仅窗口起点所在小时回查原始表
+        rollup_stats = await query_dashboard_stats(start_time)
+        channel_model_stats = rollup_stats["channel_model_stats"]
+        channel_stats = rollup_stats["channel_stats"]
+        model_stats = rollup_stats["model_stats"]
+        endpoint_stats = rollup_stats["endpoint_stats"]
+        ip_stats = rollup_stats["ip_stats"]
     else:
         async with async_session_scope() as session:
             # 1. 每个渠道下面每个模型的成功率
@@ -752,6 +771,7 @@ async def add_credits_to_api_key(
     current_credits = app.state.paid_api_keys_states[paid_key]["credits"]
     total_cost = app.state.paid_api_keys_states[paid_key]["total_cost"]
     app.state.paid_api_keys_states[paid_key]["enabled"] = current_credits >= total_cost
+    await publish_paid_key_enabled(paid_key, current_credits >= total_cost)
 
     logger.info(
         f"Credits for API key '{paid_key}' updated. "
@@ -934,11 +954,27 @@ async def cleanup_logs(
     if payload.flagged_only:
         conditions.append(RequestStat.is_flagged.is_(True))
 
+    def _field_present(field: str):
+        # 原始数据大字段可能存于侧表，也可能是旧版本写入的内联数据
+        present = getattr(RequestStat, field).isnot(None)
+        if field in RAW_BODY_FIELDS:
+            present = or_(
+                present,
+                exists()
+                .where(RequestRawData.log_id == RequestStat.id)
+                .where(RequestRawData.field == field),
+            )
+        return present
+
+    selected_raw_fields = [field for field in selected_fields if field in RAW_BODY_FIELDS]
+
     async with async_session_scope() as session:
         aggregate_cols = [func.count(RequestStat.id).label("matched_rows")]
         for field in selected_fields:
-            column = getattr(RequestStat, field)
-            aggregate_cols.append(func.sum(case((column.isnot(None), 1), else_=0)).label(field))
+            aggregate_cols.append(func.sum(case((_field_present(field), 1), else_=0)).label(field))
+        if action == "clear_fields" and selected_fields:
+            any_present = or_(*[_field_present(field) for field in selected_fields])
+            aggregate_cols.append(func.sum(case((any_present, 1), else_=0)).label("clearable_rows"))
 
         count_query = select(*aggregate_cols).where(*conditions)
         count_result = await session.execute(count_query)
@@ -959,18 +995,34 @@ async def cleanup_logs(
                 message="Dry run completed. No changes have been applied.",
             )
 
+        matched_ids = select(RequestStat.id).where(*conditions)
         if action == "clear_fields":
             values_dict = {field: None for field in selected_fields}
             non_null_clause = or_(*[getattr(RequestStat, field).isnot(None) for field in selected_fields])
             stmt = update(RequestStat).where(*conditions).where(non_null_clause).values(**values_dict)
+            if selected_raw_fields:
+                await session.execute(
+                    delete(RequestRawData)
+                    .where(RequestRawData.log_id.in_(matched_ids))
+                    .where(RequestRawData.field.in_(selected_raw_fields))
+                    .execution_options(synchronize_session=False)
+                )
         else:
+            await session.execute(
+                delete(RequestRawData)
+                .where(RequestRawData.log_id.in_(matched_ids))
+                .execution_options(synchronize_session=False)
+            )
             stmt = delete(RequestStat).where(*conditions)
 
         exec_result = await session.execute(stmt)
         await session.commit()
 
-        raw_rowcount = exec_result.rowcount
-        affected_rows = int(raw_rowcount if isinstance(raw_rowcount, int) and raw_rowcount >= 0 else matched_rows)
+        if action == "clear_fields":
+            affected_rows = int(count_row.get("clearable_rows") or 0)
+        else:
+            raw_rowcount = exec_result.rowcount
+            affected_rows = int(raw_rowcount if isinstance(raw_rowcount, int) and raw_rowcount >= 0 else matched_rows)
 
         return LogsCleanupResponse(
             dry_run=False,
@@ -1009,7 +1061,7 @@ async def get_logs(
         if d1_client is None:
             return LogsPage(items=[], total=0, page=page, page_size=page_size, total_pages=0)
 
-        sql = "SELECT * FROM request_stats WHERE 1=1"
+        sql = f"SELECT {', '.join(_D1_LOG_SUMMARY_COLUMNS)} FROM request_stats WHERE 1=1"
         count_sql = "SELECT COUNT(*) AS total FROM request_stats WHERE 1=1"
         params: list[Any] = []
 
@@ -1103,11 +1155,6 @@ async def get_logs(
                     api_key_group=row.get("api_key_group"),
                     retry_count=int(row.get("retry_count")) if row.get("retry_count") is not None else None,
                     retry_path=row.get("retry_path") if not raw_data_expired else None,
-                    request_headers=row.get("request_headers") if not raw_data_expired else None,
-                    request_body=row.get("request_body") if not raw_data_expired else None,
-                    upstream_request_body=row.get("upstream_request_body") if not raw_data_expired else None,
-                    upstream_response_body=row.get("upstream_response_body") if not raw_data_expired else None,
-                    response_body=row.get("response_body") if not raw_data_expired else None,
                     raw_data_expires_at=raw_expires_at,
                 )
             )
@@ -1186,8 +1233,10 @@ async def get_logs(
 
         offset = (page - 1) * page_size
 
+        # 列表只返回摘要，原始数据大字段由 /v1/logs/{log_id} 按需加载
         query = (
             select(RequestStat)
+            .options(*(defer(getattr(RequestStat, field)) for field in RAW_BODY_FIELDS))
             .where(*conditions)
             .order_by(RequestStat.timestamp.desc())
             .offset(offset)
@@ -1241,11 +1290,6 @@ async def get_logs(
                 api_key_group=row.api_key_group,
                 retry_count=row.retry_count,
                 retry_path=row.retry_path if not raw_data_expired else None,
-                request_headers=row.request_headers if not raw_data_expired else None,
-                request_body=row.request_body if not raw_data_expired else None,
-                upstream_request_body=getattr(row, 'upstream_request_body', None) if not raw_data_expired else None,
-                upstream_response_body=getattr(row, 'upstream_response_body', None) if not raw_data_expired else None,
-                response_body=row.response_body if not raw_data_expired else None,
                 raw_data_expires_at=row.raw_data_expires_at,
             )
         )
@@ -1256,4 +1300,81 @@ async def get_logs(
         page=page,
         page_size=page_size,
         total_pages=total_pages,
-    )
\ No newline at end of file
+    )
+
+@router.get("/v1/logs/{log_id}", response_model=LogEntry, dependencies=[Depends(rate_limit_dependency)])
+async def get_log_detail(
+    log_id: int,
+    token: str = Depends(verify_admin_api_key),
+):
+    """
+    获取单条日志详情（含原始请求/响应数据），仅管理员可访问。
+    原始数据过期后不再返回。
+    """
+    if DISABLE_DATABASE:
+        raise HTTPException(status_code=503, detail="Database is disabled.")
+
+    now = datetime.now(timezone.utc)
+
+    if (DB_TYPE or "sqlite").lower() == "d1":
+        from db import d1_client
+        if d1_client is None:
+            raise HTTPException(status_code=503, detail="D1 client is not initialized.")
+
+        row = await d1_client.query_one("SELECT * FROM request_stats WHERE id = ?", [log_id])
+        if not row:
+            raise HTTPException(status_code=404, detail="Log not found.")
+
+        row_values = dict(row)
+        row_values["success"] = _bool_from_db(row.get("success"))
+        row_values["is_flagged"] = _bool_from_db(row.get("is_flagged"))
+        row_values["timestamp"] = parse_d1_datetime(row.get("timestamp")) or now
+        row_values["raw_data_expires_at"] = parse_d1_datetime(row.get("raw_data_expires_at"))
+        raw_fields = merge_inline_fields({}, row_values)
+    else:
+        async with async_session_scope() as session:
+            row = await session.get(RequestStat, log_id)
+            if row is None:
+                raise HTTPException(status_code=404, detail="Log not found.")
+            raw_fields = merge_inline_fields(await load_raw_fields(session, log_id), row)
+        row_values = {column.key: getattr(row, column.key) for column in RequestStat.__table__.columns}
+
+    expires_at = row_values.get("raw_data_expires_at")
+    raw_data_expired = False
+    if expires_at:
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        raw_data_expired = expires_at < now
+
+    api_key = row_values.get("api_key") or ""
+    api_key_prefix = f"{api_key[:7]}...{api_key[-4:]}" if len(api_key) > 11 else api_key
+
+    return LogEntry(
+        id=row_values["id"],
+        timestamp=row_values.get("timestamp") or now,
+        endpoint=row_values.get("endpoint"),
+        client_ip=row_values.get("client_ip"),
+        provider=row_values.get("provider"),
+        model=row_values.get("model"),
+        api_key_prefix=api_key_prefix,
+        process_time=row_values.get("process_time"),
+        first_response_time=row_values.get("first_response_time"),
+        prompt_tokens=row_values.get("prompt_tokens"),
+        completion_tokens=row_values.get("completion_tokens"),
+        total_tokens=row_values.get("total_tokens"),
+        success=bool(row_values.get("success")),
+        status_code=row_values.get("status_code"),
+        is_flagged=bool(row_values.get("is_flagged")),
+        provider_id=row_values.get("provider_id"),
+        provider_key_index=row_values.get("provider_key_index"),
+        api_key_name=row_values.get("api_key_name"),
+        api_key_group=row_values.get("api_key_group"),
+        retry_count=row_values.get("retry_count"),
+        retry_path=row_values.get("retry_path") if not raw_data_expired else None,
+        request_headers=raw_fields.get("request_headers") if not raw_data_expired else None,
+        request_body=raw_fields.get("request_body") if not raw_data_expired else None,
+        upstream_request_body=raw_fields.get("upstream_request_body") if not raw_data_expired else None,
+        upstream_response_body=raw_fields.get("upstream_response_body") if not raw_data_expired else None,
+        response_body=raw_fields.get("response_body") if not raw_data_expired else None,
+        raw_data_expires_at=row_values.get("raw_data_expires_at"),
+    )
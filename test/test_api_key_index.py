@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.utils import ApiKeyList, ThreadSafeCircularList
+
+
+def test_api_key_list_index_matches_list_semantics():
+    api_keys_db = [
+        {"api": "sk-admin", "role": "admin", "model": ["all"], "groups": ["default"]},
+        {"api": "sk-user", "name": "user", "model": ["gpt-4o"], "preferences": {"ENABLE_MODERATION": True}},
+        {"api": "sk-admin", "role": "user"},
+    ]
+    api_list = ApiKeyList(api_keys_db)
+
+    assert list(api_list) == ["sk-admin", "sk-user", "sk-admin"]
+    assert api_list.index("sk-user") == 1
+    # 重复 key 与 list.index 一致，返回第一次出现的位置
+    assert api_list.index("sk-admin") == 0
+    assert "sk-user" in api_list
+    assert "sk-missing" not in api_list
+    with pytest.raises(ValueError):
+        api_list.index("sk-missing")
+
+    settings = api_list.get_settings(1)
+    assert settings.name == "user"
+    assert settings.models == ["gpt-4o"]
+    assert settings.enable_moderation is True
+    assert settings.role == "sk-user"[:8]
+    assert api_list.get_settings(0).is_admin
+    assert api_list.get_settings(10) is None
+
+
+def test_circular_list_item_index_follows_reset():
+    circular = ThreadSafeCircularList(["k1", "k2", "k3"])
+    assert circular.get_item_index("k2") == 1
+    circular.items = ["k3", "k2", "k1"]
+    assert circular.get_item_index("k3") == 0
+    assert circular.get_item_index("missing") is None
+
+
+def test_api_key_settings_follow_config_generation():
+    from types import SimpleNamespace
+    from core.config_snapshot import publish_config, get_api_key_settings
+
+    api_keys_db = [
+        {"api": "sk-a", "group": "team", "groups": "vip", "model": ["gpt-4o"],
+         "preferences": {"AUTO_RETRY": False, "MODERATION_MODE": "speculative"}},
+    ]
+    config = {"api_keys": api_keys_db}
+    app = SimpleNamespace(state=SimpleNamespace())
+    api_list = ApiKeyList(api_keys_db)
+    publish_config(app, config, api_keys_db, api_list)
+
+    settings = get_api_key_settings(app, config, 0)
+    assert settings is api_list.get_settings(0)
+    assert (settings.group, settings.groups) == ("team", ["vip"])
+    assert settings.preference("AUTO_RETRY", True) is False
+    assert settings.preference("SCHEDULING_ALGORITHM", "fixed_priority") == "fixed_priority"
+
+    # 请求固定的旧一代配置不读取新一代的预编译结果
+    old_config = {"api_keys": [{"api": "sk-a", "model": ["claude"]}]}
+    assert get_api_key_settings(app, old_config, 0).models == ["claude"]
+    assert get_api_key_settings(app, old_config, 5) is None
+    assert get_api_key_settings(app, config, None) is None
@@ -0,0 +1,173 @@
+import os
+import sys
+import asyncio
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.client_manager import ClientManager, _ObservedTransport, get_connection_options
+
+
+@pytest.mark.asyncio
+async def test_lru_limit_closes_least_recently_used_client():
+    manager = ClientManager(max_clients=2)
+    clients = {}
+    for host in ("a.example", "b.example", "a.example", "c.example"):
+        async with manager.get_client(f"https://{host}/v1") as client:
+            clients.setdefault(host, client)
+
+    await asyncio.sleep(0)  # 关闭在后台任务中执行
+    assert list(manager.clients) == ["a.example", "c.example"]
+    assert clients["b.example"].is_closed
+    assert manager.get_stats()["evicted_total"] == 1
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_clients_are_evicted_unless_busy():
+    manager = ClientManager(idle_timeout=10)
+    async with manager.get_client("https://idle.example/v1"):
+        pass
+    async with manager.get_client("https://busy.example/v1"):
+        pass
+    manager.clients["busy.example"].transports[0].in_flight = 1
+
+    for entry in manager.clients.values():
+        entry.last_used -= 60
+    assert manager.evict_idle() == 1
+    assert list(manager.clients) == ["busy.example"]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_options_use_separate_client():
+    manager = ClientManager()
+    async with manager.get_client("https://up.example/v1") as default_client:
+        pass
+    async with manager.get_client("https://up.example/v1", pool_options={"max_connections": 5, "http2": True}) as tuned:
+        pass
+    assert tuned is not default_client
+    assert len(manager.get_stats()["clients"]) == 2
+    # reset_client 仍按 host 匹配
+    assert await manager.reset_client("up.example")
+    assert manager.clients == {}
+
+
+@pytest.mark.asyncio
+async def test_pool_timeouts_are_counted():
+    class _Timeout(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            raise httpx.PoolTimeout("pool exhausted")
+
+    transport = _ObservedTransport(_Timeout())
+    async with httpx.AsyncClient(transport=transport) as client:
+        with pytest.raises(httpx.PoolTimeout):
+            await client.get("https://up.example/v1")
+    assert (transport.requests, transport.in_flight, transport.pool_timeouts) == (1, 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_prewarm_opens_idle_connections():
+    async def handle(reader, writer):
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+
+    async def serve(reader, writer):
+        try:
+            await handle(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    manager = ClientManager()
+    pool_options = {"keepalive_expiry": 60}
+    try:
+        assert await manager.prewarm(f"http://127.0.0.1:{port}/v1", pool_options=pool_options, connections=2) == 2
+        assert await manager.prewarm(f"http://127.0.0.1:{port}/v1", pool_options=pool_options, connections=2) == 0
+        stats = manager.get_stats()
+        assert stats["idle"] == 2 and stats["active"] == 0
+    finally:
+        await manager.close()
+        server.close()
+
+
+def test_collect_prewarm_targets():
+    from core.prewarm import collect_prewarm_targets
+
+    config = {
+        "preferences": {"proxy": "http://proxy:8080"},
+        "providers": [
+            {"provider": "a", "base_url": "https://api.example/v1/chat/completions"},
+            {"provider": "b", "base_url": "https://api.example/v1/other"},
+            {"provider": "c", "base_url": "https://api.example/v1", "preferences": {"proxy": "socks5://p:1080"}},
+            {"provider": "d", "base_url": "https://off.example/v1", "enabled": False},
+        ],
+    }
+    targets = collect_prewarm_targets(config)
+    assert [(url.split("/")[2], proxy) for url, proxy, _ in targets] == [
+        ("api.example", "http://proxy:8080"),
+        ("api.example", "socks5://p:1080"),
+    ]
+
+
+def test_connection_options_prefer_channel_over_pinned_config():
+    config = {"preferences": {"proxy": "http://global:8080", "http_pool": {"max_connections": 10}}}
+    assert get_connection_options({"provider": "a"}, config) == ("http://global:8080", {"max_connections": 10})
+    channel = {"provider": "b", "preferences": {"proxy": "socks5://p:1080", "http_pool": {"http2": True}}}
+    assert get_connection_options(channel, config) == ("socks5://p:1080", {"http2": True})
+    assert get_connection_options({"provider": "c"}, None) == (None, None)
+
+
+def test_prewarm_extends_default_keepalive(monkeypatch, caplog):
+    import core.prewarm as prewarm
+    from types import SimpleNamespace
+
+    monkeypatch.setattr(prewarm, "PREWARM_INTERVAL", 60)
+    manager = ClientManager()
+    config = {"providers": [
+        {"provider": "a", "base_url": "https://a.example/v1"},
+        {"provider": "b", "base_url": "https://b.example/v1", "preferences": {"http_pool": {"keepalive_expiry": 5}}},
+    ]}
+    prewarm.extend_keepalive_for_prewarm(SimpleNamespace(state=SimpleNamespace(client_manager=manager, config=config)))
+    assert manager.keepalive_expiry > 60
+    _, transports = manager._build_client(None, None, {})
+    assert transports[0].keepalive_expiry > 60
+    assert "b.example" in caplog.text and "a.example" not in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_in_flight_lasts_until_stream_is_closed():
+    class _Streaming(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            return httpx.Response(200, stream=httpx.ByteStream(b"data"), extensions={"network_stream": "conn-1"})
+
+    transport = _ObservedTransport(_Streaming(), keepalive_expiry=60)
+    async with httpx.AsyncClient(transport=transport) as client:
+        async with client.stream("GET", "https://up.example/v1") as response:
+            assert transport.in_flight == 1
+            assert transport.pool_state() == {"active": 1, "idle": 0, "waiting": 0}
+            await response.aread()
+        assert transport.in_flight == 0
+        assert transport.pool_state() == {"active": 0, "idle": 1, "waiting": 0}
+
+
+def test_proxy_transports_are_built_through_public_arguments(monkeypatch):
+    from httpx_socks import AsyncProxyTransport
+
+    manager = ClientManager()
+    entry = manager._get_entry("https://up.example/v1", "socks5h://127.0.0.1:1080", None, None)
+    assert [type(t.inner) for t in entry.transports] == [AsyncProxyTransport]
+    assert entry.client._transport is entry.transports[0]
+
+    # 环境变量代理：与 httpx 默认行为一致，NO_PROXY 中的地址不走代理
+    monkeypatch.setenv("HTTPS_PROXY", "http://proxy.example:8080")
+    monkeypatch.setenv("NO_PROXY", "internal.example")
+    entry = manager._get_entry("https://env.example/v1", None, None, None)
+    assert len(entry.transports) == 2
+    mounts = {pattern.pattern: mounted for pattern, mounted in entry.client._mounts.items()}
+    assert mounts["https://"] is entry.transports[1]
+    assert mounts["all://*internal.example"] is None
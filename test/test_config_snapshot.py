@@ -0,0 +1,75 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.config_snapshot import publish_config, get_config_snapshot, copy_config_for_update
+from core.routing import get_provider_list
+from core.utils import ApiKeyList
+
+
+def _config(model="gpt-4o"):
+    api_keys = [{"api": "sk-a", "model": ["up/*"]}]
+    return {
+        "providers": [{"provider": "up", "base_url": "https://up.example/v1", "_model_dict_cache": {model: model}}],
+        "api_keys": api_keys,
+    }, api_keys
+
+
+def _app():
+    config, api_keys = _config()
+    app = SimpleNamespace(state=SimpleNamespace())
+    publish_config(app, config, api_keys, ApiKeyList(api_keys))
+    return app
+
+
+def test_provider_views_are_reused_within_a_generation():
+    app = _app()
+    snapshot = get_config_snapshot(app)
+    first = get_provider_list(["up/gpt-4o"], snapshot.config, "gpt-4o", app)
+    second = get_provider_list(["up/gpt-4o"], snapshot.config, "gpt-4o", app)
+    assert first == second and first[0] is second[0]
+    assert first[0]["model"] == [{"gpt-4o": "gpt-4o"}]
+
+    # 发布新一代配置后，旧快照保持不变，新请求使用新配置
+    config, api_keys = _config("gpt-4o-mini")
+    publish_config(app, config, api_keys, ApiKeyList(api_keys))
+    assert get_config_snapshot(app).generation > snapshot.generation
+    assert get_provider_list(["up/gpt-4o"], app.state.config, "gpt-4o", app) == []
+    assert get_provider_list(["up/gpt-4o"], snapshot.config, "gpt-4o", app)[0]["provider"] == "up"
+
+
+def test_legacy_assignment_is_picked_up():
+    app = _app()
+    old = get_config_snapshot(app)
+    config, api_keys = _config()
+    app.state.config, app.state.api_keys_db, app.state.api_list = config, api_keys, ApiKeyList(api_keys)
+    snapshot = get_config_snapshot(app)
+    assert snapshot is not old
+    assert snapshot.config is config
+
+
+def test_copy_for_update_does_not_touch_published_config():
+    app = _app()
+    live = app.state.config
+    new_config = copy_config_for_update(live)
+    new_config["providers"][0]["base_url"] = "https://changed.example/v1"
+    assert live["providers"][0]["base_url"] == "https://up.example/v1"
+    assert copy_config_for_update(None) == {}
+
+
+def test_local_key_views_use_the_pinned_generation():
+    app = _app()
+    config, _ = _config()
+    api_keys = [{"api": "sk-outer", "model": ["sk-inner/*"]}, {"api": "sk-inner", "model": ["up/*"]}]
+    config["api_keys"] = api_keys
+    publish_config(app, config, api_keys, ApiKeyList(api_keys))
+    pinned = get_config_snapshot(app).config
+
+    # 请求期间发布了不含 sk-inner 的新一代配置
+    new_config, new_api_keys = _config()
+    publish_config(app, new_config, new_api_keys, ApiKeyList(new_api_keys))
+    views = get_provider_list(["sk-inner/gpt-4o"], pinned, "gpt-4o", app)
+    assert [view["provider"] for view in views] == ["sk-inner"]
+    assert get_provider_list(["sk-inner/gpt-4o"], app.state.config, "gpt-4o", app) == []
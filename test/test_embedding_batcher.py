@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.embedding_batcher import EmbeddingBatcher, normalize_embedding_input, split_embedding_result
+from core.models import EmbeddingRequest
+
+
+def _upstream(inputs, prompt_tokens):
+    data = [{"object": "embedding", "index": i, "embedding": [float(i)]} for i in range(len(inputs))]
+    return {"object": "list", "data": data[::-1], "model": "m", "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_upstream_call():
+    batcher = EmbeddingBatcher(window_ms=20, max_inputs=16)
+    calls = []
+
+    async def send(inputs):
+        calls.append(list(inputs))
+        return _upstream(inputs, 10), "key-1"
+
+    results = await asyncio.gather(
+        batcher.submit(("p", "m"), ["a"], 1, send),
+        batcher.submit(("p", "m"), ["b", "c"], 2, send),
+        batcher.submit(("p", "m"), ["d"], 2, send),
+        batcher.submit(("p", "other"), ["e"], 1, send),
+    )
+    assert calls == [["a", "b", "c", "d"], ["e"]]
+    first, second, third, other = results
+    assert first[1] == "key-1"
+    assert [item["embedding"] for item in second[0]["data"]] == [[1.0], [2.0]]
+    assert [item["index"] for item in second[0]["data"]] == [0, 1]
+    assert [r[0]["usage"]["prompt_tokens"] for r in (first, second, third)] == [2, 4, 4]
+    assert other[0]["usage"]["prompt_tokens"] == 10
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_sent_without_waiting_and_errors_reach_every_member():
+    batcher = EmbeddingBatcher(window_ms=10_000, max_inputs=2)
+
+    async def send(inputs):
+        return _upstream(inputs, 2), None
+
+    results = await asyncio.wait_for(asyncio.gather(
+        batcher.submit(("k",), ["a"], 1, send),
+        batcher.submit(("k",), ["b"], 1, send),
+    ), timeout=1)
+    assert [r[0]["data"][0]["embedding"] for r in results] == [[0.0], [1.0]]
+
+    async def broken(inputs):
+        raise RuntimeError("upstream down")
+
+    errors = await asyncio.wait_for(asyncio.gather(
+        batcher.submit(("k",), ["a"], 1, broken),
+        batcher.submit(("k",), ["b"], 1, broken),
+        return_exceptions=True,
+    ), timeout=1)
+    assert [str(e) for e in errors] == ["upstream down", "upstream down"]
+
+
+def test_input_normalization_and_count_mismatch():
+    assert normalize_embedding_input("hi") == ("text", ["hi"], 2)
+    assert normalize_embedding_input([1, 2, 3]) == ("tokens", [[1, 2, 3]], 3)
+    assert normalize_embedding_input([[1], [2, 3]]) == ("tokens", [[1], [2, 3]], 3)
+    assert normalize_embedding_input(["a", [1]]) is None
+    with pytest.raises(ValueError):
+        split_embedding_result(_upstream(["a"], 1), [(0, 1, 1), (1, 1, 1)])
+
+
+@pytest.mark.asyncio
+async def test_handler_batches_embeddings_and_selects_one_key(monkeypatch):
+    import core.handler as handler
+    from core.utils import ThreadSafeCircularList
+
+    batcher = EmbeddingBatcher(window_ms=20, max_inputs=16)
+    monkeypatch.setattr(handler, "embedding_batcher", batcher)
+    keys = ThreadSafeCircularList(["k1", "k2"])
+    monkeypatch.setitem(handler.provider_api_circular_list, "p", keys)
+    upstream_payloads = []
+
+    async def fake_fetch_response(client, url, headers, payload, engine, model, timeout):
+        upstream_payloads.append((url, headers["Authorization"], payload))
+        yield _upstream(payload["input"], 6)
+
+    monkeypatch.setattr(handler, "fetch_response", fake_fetch_response)
+    monkeypatch.setattr(handler, "_fire_and_forget_channel_stats", lambda *args, **kwargs: None)
+
+    @asynccontextmanager
+    async def get_client(url, proxy, pool_options=None):
+        yield None
+
+    app = SimpleNamespace(state=SimpleNamespace(
+        config={}, error_triggers=[], client_manager=SimpleNamespace(get_client=get_client),
+    ))
+    provider = {
+        "provider": "p", "engine": "openai", "base_url": "https://api.openai.com/v1", "api": ["k1", "k2"],
+        "model": ["text-embedding-3-small"], "_model_dict_cache": {"text-embedding-3-small": "text-embedding-3-small"},
+    }
+
+    async def call(text, info):
+        request = EmbeddingRequest(model="text-embedding-3-small", input=text)
+        return await handler.process_request(request, provider, None, app, lambda: info, None, endpoint="/v1/embeddings")
+
+    infos = [{"request_id": str(i), "api_key": "user"} for i in range(3)]
+    responses = await asyncio.gather(*(call(text, info) for text, info in zip(["aa", "bb", "cc"], infos)))
+
+    assert upstream_payloads == [(
+        "https://api.openai.com/v1/embeddings", "Bearer k1",
+        {"model": "text-embedding-3-small", "input": ["aa", "bb", "cc"]},
+    )]
+    bodies = []
+    for response in responses:
+        body = "".join([chunk async for chunk in response.body_iterator])
+        bodies.append(json.loads(body))
+    assert [b["data"][0]["embedding"] for b in bodies] == [[0.0], [1.0], [2.0]]
+    assert [b["usage"]["prompt_tokens"] for b in bodies] == [2, 2, 2]
+    assert all(info["success"] and info["provider_key_index"] == 0 for info in infos)
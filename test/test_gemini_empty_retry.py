@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import plugins.gemini_empty_retry as plugin
+from core.middleware import request_info
+
+
+def _sse(**delta):
+    finish_reason = delta.pop("finish_reason", None)
+    return "data: " + json.dumps({"choices": [{"delta": delta, "finish_reason": finish_reason}]}) + "\n\n"
+
+
+def _run(monkeypatch, chunks, is_image_model=False, retry_count=0):
+    events = []
+
+    async def upstream(*args):
+        for chunk in chunks:
+            events.append(("upstream", chunk))
+            yield chunk
+
+    monkeypatch.setattr(plugin, "_original_stream_adapter", upstream)
+    request_info.set({
+        "_gemini_empty_retry_enabled": True,
+        "_gemini_empty_retry_max": 2,
+        "_gemini_empty_retry_is_image_model": is_image_model,
+        "_gemini_empty_retry_state": {"retry_count": retry_count},
+    })
+
+    async def consume():
+        async for chunk in plugin.wrapped_fetch_gemini_response_stream(None, "", {}, {}, "m", 10):
+            events.append(("client", chunk))
+
+    return events, consume
+
+
+@pytest.mark.asyncio
+async def test_stream_switches_to_passthrough_after_first_content(monkeypatch):
+    chunks = [_sse(role="assistant"), _sse(content="Hel"), _sse(content="lo"), _sse(finish_reason="stop")]
+    events, consume = _run(monkeypatch, chunks)
+    await consume()
+    # 第一段文本到达后立即放出，之后每个 chunk 逐个直通
+    assert [kind for kind, _ in events] == [
+        "upstream", "upstream", "client", "client", "upstream", "client", "upstream", "client",
+    ]
+    assert [chunk for kind, chunk in events if kind == "client"] == chunks
+
+
+@pytest.mark.asyncio
+async def test_empty_stream_triggers_retry(monkeypatch):
+    events, consume = _run(monkeypatch, [_sse(role="assistant"), _sse(finish_reason="stop")])
+    await consume()
+    client = [chunk for kind, chunk in events if kind == "client"]
+    assert len(client) == 1 and client[0]["details"]["reason"] == "empty_content"
+    assert plugin.get_retry_state()["retry_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_image_model_waits_for_image(monkeypatch):
+    chunks = [_sse(reasoning_content="drawing"), _sse(content="![image](https://x/y.png)"), _sse(finish_reason="stop")]
+    events, consume = _run(monkeypatch, chunks, is_image_model=True)
+    await consume()
+    assert [kind for kind, _ in events][:4] == ["upstream", "upstream", "client", "client"]
+
+    # 重试次数用完后重放原始响应
+    chunks = [_sse(reasoning_content="drawing"), _sse(finish_reason="stop")]
+    events, consume = _run(monkeypatch, chunks, is_image_model=True, retry_count=2)
+    await consume()
+    assert [chunk for kind, chunk in events if kind == "client"] == chunks
@@ -0,0 +1,80 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.utils import ImageCache
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_share_single_fetch():
+    """同一图片的并发请求只应触发一次下载/转换。"""
+    cache = ImageCache(max_bytes=1024)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ("data:image/png;base64,AAAA", "image/png")
+
+    results = await asyncio.gather(*(cache.get_or_load("http://x/a.png", loader) for _ in range(5)))
+    assert calls == 1
+    assert all(r == ("data:image/png;base64,AAAA", "image/png") for r in results)
+
+    await cache.get_or_load("http://x/a.png", loader)
+    assert calls == 1
+    assert cache.hits == 1
+
+
+def test_lru_eviction_by_bytes():
+    """超过字节上限时按最近最少使用淘汰。"""
+    cache = ImageCache(max_bytes=10)
+    cache.put("a", ("aaaa", "image/png"))
+    cache.put("b", ("bbbb", "image/png"))
+    assert cache.get("a") is not None
+    cache.put("c", ("cccc", "image/png"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get_stats()["bytes"] == 8
+
+
+@pytest.mark.asyncio
+async def test_failed_load_is_not_cached():
+    """加载失败不写入缓存，下次调用会重新加载。"""
+    cache = ImageCache(max_bytes=1024)
+
+    async def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await cache.get_or_load("http://x/b.png", failing)
+    assert cache.get(ImageCache.make_key("http://x/b.png")) is None
+
+
+@pytest.mark.asyncio
+async def test_cancelling_first_caller_does_not_abort_other_waiters():
+    """发起下载的请求被取消时，合并等待同一图片的其他请求仍应拿到结果。"""
+    cache = ImageCache(max_bytes=1024)
+    started = asyncio.Event()
+
+    async def loader():
+        started.set()
+        await asyncio.sleep(0.05)
+        return ("data:image/png;base64,AAAA", "image/png")
+
+    first = asyncio.create_task(cache.get_or_load("http://x/c.png", loader))
+    await started.wait()
+    second = asyncio.create_task(cache.get_or_load("http://x/c.png", loader))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == ("data:image/png;base64,AAAA", "image/png")
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert cache.get(ImageCache.make_key("http://x/c.png")) is not None
@@ -0,0 +1,65 @@
+import os
+import sys
+import copy
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.utils import provider_api_circular_list, ApiKeyRateLimitRegistry
+from utils import update_config
+
+
+def _config():
+    return {
+        "providers": [
+            {"provider": "inc-a", "base_url": "https://a.example/v1", "api": ["k1", "k2"], "model": ["m1"]},
+            {"provider": "inc-b", "base_url": "https://b.example/v1", "api": "k3", "model": ["m2"]},
+            {"provider": "inc-c", "base_url": "https://c.example/v1", "api": "k4", "model": ["m3"]},
+        ],
+        "api_keys": [{"api": "sk-x", "model": ["all"]}],
+    }
+
+
+async def _apply(config):
+    return await update_config(copy.deepcopy(config), skip_model_fetch=True, save_to_file=False)
+
+
+@pytest.mark.asyncio
+async def test_unchanged_providers_keep_runtime_state():
+    config = _config()
+    first, _, _ = await _apply(config)
+    list_a = provider_api_circular_list["inc-a"]
+    list_b = provider_api_circular_list["inc-b"]
+    list_a.cooling_until["k1"] = 123.0
+    model_dict_a = first["providers"][0]["_model_dict_cache"]
+
+    config["providers"][0]["api"] = ["k1", "!k2"]  # 只改禁用状态
+    config["providers"][1]["preferences"] = {"api_key_rate_limit": "10/min"}
+    del config["providers"][2]
+    second, _, _ = await _apply(config)
+
+    assert provider_api_circular_list["inc-a"] is list_a
+    assert list_a.cooling_until["k1"] == 123.0
+    assert list_a.is_key_disabled("k2")
+    assert second["providers"][0]["_model_dict_cache"] is model_dict_a
+    assert provider_api_circular_list["inc-b"] is not list_b
+    assert "inc-c" not in provider_api_circular_list
+
+
+def test_rate_limit_registry_prune():
+    state = SimpleNamespace(
+        config={"api_keys": [{"api": "sk-1"}, {"api": "sk-2"}, {"api": "sk-3"}]},
+        api_list=["sk-1", "sk-2", "sk-3"],
+    )
+    registry = ApiKeyRateLimitRegistry(lambda: state.config, lambda: state.api_list)
+    limiters = {key: registry[key] for key in state.api_list}
+
+    state.config = {"api_keys": [{"api": "sk-1"}, {"api": "sk-2", "preferences": {"rate_limit": "5/min"}}]}
+    state.api_list = ["sk-1", "sk-2"]
+    registry.prune()
+
+    assert registry["sk-1"] is limiters["sk-1"]
+    assert "sk-3" not in registry
+    assert registry["sk-2"] is not limiters["sk-2"]
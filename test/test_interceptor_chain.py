@@ -0,0 +1,90 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.plugins.interceptors import InterceptorRegistry
+
+
+def _registry():
+    registry = InterceptorRegistry()
+    calls = []
+
+    def make(name):
+        async def interceptor(chunk, engine, model, is_stream):
+            calls.append(name)
+            return chunk
+        return interceptor
+
+    registry.register_response_interceptor("late", make("late"), priority=200, plugin_name="b")
+    registry.register_response_interceptor("early", make("early"), priority=10, plugin_name="a")
+    registry.register_response_interceptor("global", make("global"), priority=100)
+    return registry, calls
+
+
+@pytest.mark.asyncio
+async def test_chain_is_filtered_sorted_and_cached():
+    registry, calls = _registry()
+    chain = registry.get_response_chain(["a:opt", "b"])
+    assert [i.id for i in chain] == ["early", "global", "late"]
+    assert registry.get_response_chain(["a:opt", "b"]) is chain
+    assert [i.id for i in registry.get_response_chain(None)] == ["global"]
+    assert [i.id for i in registry.get_response_chain([])] == ["global"]
+
+    await registry.apply_response_interceptors("x", "openai", "m", True, ["b"])
+    assert calls == ["global", "late"]
+
+
+def test_chain_is_invalidated_on_changes():
+    registry, _ = _registry()
+    chain = registry.get_response_chain(["a"])
+    registry.disable_response_interceptor("early")
+    assert [i.id for i in registry.get_response_chain(["a"])] == ["global"]
+    registry.enable_response_interceptor("early")
+    assert registry.get_response_chain(["a"]) == chain
+
+    registry.unregister_plugin_interceptors("a")
+    assert [i.id for i in registry.get_response_chain(["a"])] == ["global"]
+    registry.unregister_response_interceptor("global")
+    assert registry.get_response_chain(["a"]) == ()
+
+
+def test_request_and_response_chains_are_separate():
+    registry, _ = _registry()
+
+    async def request_interceptor(*args):
+        return None
+
+    registry.register_request_interceptor("req", request_interceptor, plugin_name="a")
+    assert [i.id for i in registry.get_request_chain(["a"])] == ["req"]
+    assert [i.id for i in registry.get_response_chain(["a"])] == ["early", "global"]
+
+
+@pytest.mark.asyncio
+async def test_calls_latency_and_errors_are_recorded(monkeypatch):
+    import core.plugins.interceptors as interceptors
+
+    registry, _ = _registry()
+
+    async def broken(chunk, engine, model, is_stream):
+        raise RuntimeError("boom")
+
+    registry.register_response_interceptor("broken", broken, priority=50, plugin_name="a")
+    monkeypatch.setattr(interceptors, "SLOW_INTERCEPTOR_MS", 1e-9)
+    for _ in range(3):
+        assert await registry.apply_response_interceptors("x", "openai", "m", True, ["a"]) == "x"
+
+    metrics = registry.get_metrics()
+    by_id = {i["id"]: i for i in metrics["response_interceptors"]["interceptors"]}
+    assert by_id["broken"]["calls"] == 3 and by_id["broken"]["errors"] == 3
+    assert by_id["broken"]["last_error"] == "RuntimeError: boom"
+    assert by_id["early"]["calls"] == 3 and by_id["late"]["calls"] == 0
+    assert sum(by_id["early"]["histogram"].values()) == 3
+    assert by_id["global"]["slow_calls"] == 3
+    assert metrics["response_interceptors"]["calls"] == 9
+    assert metrics["plugins"]["a"]["calls"] == 6 and metrics["plugins"]["a"]["errors"] == 3
+
+    registry.reset_metrics()
+    assert registry.get_metrics()["response_interceptors"]["calls"] == 0
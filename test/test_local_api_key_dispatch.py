@@ -0,0 +1,200 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from fastapi import BackgroundTasks
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import core.handler as handler_module
+from core.handler import ModelRequestHandler
+from core.models import RequestModel, ModerationRequest
+from core.moderation import moderation_verdict_cache
+from core.utils import ApiKeyList, ApiKeyRateLimitRegistry
+from core.stats import LOCAL_KEY_USAGE_KEY, _local_key_stats
+from utils import build_local_models_list, get_local_models_list
+
+
+def _config(api_keys):
+    return {
+        "providers": [
+            {"provider": "up", "model": ["gpt-4o", "claude"], "_model_dict_cache": {"gpt-4o": "gpt-4o", "claude": "claude"}},
+        ],
+        "api_keys": api_keys,
+        "preferences": {},
+    }
+
+
+def test_local_models_list_is_resolved_in_process():
+    config = _config([
+        {"api": "sk-top", "model": ["sk-mid/*"]},
+        {"api": "sk-mid", "model": ["sk-leaf/*", "up/claude"]},
+        {"api": "sk-leaf", "model": ["up/gpt-4o"]},
+    ])
+    api_list = ApiKeyList(config["api_keys"])
+    assert build_local_models_list(config, api_list) == {
+        "sk-leaf": ["gpt-4o"],
+        "sk-mid": ["claude", "gpt-4o"],
+    }
+
+    app = SimpleNamespace(state=SimpleNamespace(config=config, api_list=api_list))
+    first = get_local_models_list(app)
+    assert get_local_models_list(app) is first
+    app.state.api_list = ApiKeyList(config["api_keys"])  # 配置更新后重新计算
+    assert get_local_models_list(app) is not first
+
+
+def test_local_models_list_cycle_terminates():
+    config = _config([
+        {"api": "sk-a", "model": ["sk-b/*", "up/gpt-4o"]},
+        {"api": "sk-b", "model": ["sk-a/*"]},
+    ])
+    models_list = build_local_models_list(config, ApiKeyList(config["api_keys"]))
+    assert models_list["sk-a"] == ["gpt-4o"]
+
+
+def _handler(config):
+    state = SimpleNamespace(
+        config=config,
+        api_list=ApiKeyList(config["api_keys"]),
+        provider_timeouts={"global": {}},
+        keepalive_interval={"global": {}},
+        channel_manager=SimpleNamespace(cooldown_period=0),
+        paid_api_keys_states={},
+    )
+    state.user_api_keys_rate_limit = ApiKeyRateLimitRegistry(lambda: state.config, lambda: state.api_list)
+    info = {}
+    return ModelRequestHandler(SimpleNamespace(state=state), lambda: info, None), info
+
+
+def _local_provider(name, model):
+    return {"provider": name, "_model_dict_cache": {model: model}}
+
+
+@pytest.mark.asyncio
+async def test_local_api_key_is_dispatched_in_process(monkeypatch):
+    config = _config([
+        {"api": "sk-outer", "model": ["sk-inner/*"]},
+        {"api": "sk-inner", "model": ["up/gpt-4o"]},
+    ])
+    handler, info = _handler(config)
+
+    async def fake_order(request_model, config, api_index, *args, **kwargs):
+        if api_index == 0:
+            return [_local_provider("sk-inner", request_model)]
+        return [_local_provider("up", request_model)]
+
+    async def fake_process_request(request, provider, *args, **kwargs):
+        assert provider["provider"] == "up"
+        return JSONResponse({"ok": True})
+
+    monkeypatch.setattr(handler_module, "get_right_order_providers", fake_order)
+    monkeypatch.setattr(handler_module, "process_request", fake_process_request)
+
+    request = RequestModel(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+    response = await handler.request_model(request, 0, BackgroundTasks())
+    assert response.status_code == 200
+    assert handler_module._local_dispatch_chain.get() == ()
+    # 内层 Key 单独记一条统计
+    info.update({"api_key": "sk-outer", "total_tokens": 12, "request_body": "raw"})
+    rows = _local_key_stats(info)
+    assert [(row["api_key"], row["total_tokens"]) for row in rows] == [("sk-inner", 12)]
+    assert "request_body" not in rows[0] and LOCAL_KEY_USAGE_KEY not in rows[0]
+    info.update({"upstream_request_body": "raw", "upstream_response_body": "raw", "retry_path": "[]"})
+    assert not {"upstream_request_body", "upstream_response_body", "retry_path"} & set(_local_key_stats(info)[0])
+
+
+@pytest.mark.asyncio
+async def test_local_api_key_enforces_inner_key_limits(monkeypatch):
+    config = _config([
+        {"api": "sk-outer", "model": ["sk-inner/*"]},
+        {"api": "sk-inner", "model": ["up/gpt-4o"], "preferences": {"rate_limit": "1/min"}},
+    ])
+    handler, info = _handler(config)
+
+    async def fake_order(request_model, config, api_index, *args, **kwargs):
+        if api_index == 0:
+            return [_local_provider("sk-inner", request_model)]
+        return [_local_provider("up", request_model)]
+
+    async def fake_process_request(request, provider, *args, **kwargs):
+        return JSONResponse({"ok": True})
+
+    monkeypatch.setattr(handler_module, "get_right_order_providers", fake_order)
+    monkeypatch.setattr(handler_module, "process_request", fake_process_request)
+
+    def request():
+        return RequestModel(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+
+    assert (await handler.request_model(request(), 0, BackgroundTasks())).status_code == 200
+    # 第二次超过内层 Key 的限流
+    assert (await handler.request_model(request(), 0, BackgroundTasks())).status_code == 429
+    assert [usage["api_key"] for usage in info[LOCAL_KEY_USAGE_KEY]] == ["sk-inner"]
+
+    # 内层 Key 余额耗尽
+    handler.app.state.user_api_keys_rate_limit.clear()
+    handler.app.state.paid_api_keys_states["sk-inner"] = {"enabled": False}
+    response = await handler.request_model(request(), 0, BackgroundTasks())
+    assert response.status_code == 429
+    assert b"Balance is insufficient" in response.body
+
+
+@pytest.mark.asyncio
+async def test_local_api_key_cycle_is_detected(monkeypatch):
+    config = _config([
+        {"api": "sk-a", "model": ["sk-b/*"]},
+        {"api": "sk-b", "model": ["sk-a/*"]},
+    ])
+    handler, info = _handler(config)
+
+    async def fake_order(request_model, config, api_index, *args, **kwargs):
+        return [_local_provider("sk-b" if api_index == 0 else "sk-a", request_model)]
+
+    monkeypatch.setattr(handler_module, "get_right_order_providers", fake_order)
+
+    request = RequestModel(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+    background_tasks = BackgroundTasks()
+    response = await handler.request_model(request, 0, background_tasks)
+    assert response.status_code == 508
+    # 只有最外层请求写入一次失败统计
+    assert len(background_tasks.tasks) == 1
+    assert info["success"] is False
+
+
+@pytest.mark.asyncio
+async def test_local_api_key_applies_inner_key_moderation(monkeypatch):
+    config = _config([
+        {"api": "sk-outer", "model": ["sk-inner/*"]},
+        {"api": "sk-inner", "model": ["up/gpt-4o"], "preferences": {"ENABLE_MODERATION": True}},
+    ])
+    handler, info = _handler(config)
+    moderated = []
+
+    async def fake_order(request_model, config, api_index, *args, **kwargs):
+        if api_index == 0:
+            return [_local_provider("sk-inner", request_model)]
+        return [_local_provider("up", request_model)]
+
+    async def fake_process_request(request, provider, *args, **kwargs):
+        if isinstance(request, ModerationRequest):
+            moderated.append(request.input)
+            return JSONResponse({"results": [{"flagged": request.input == "bad"}]})
+        return JSONResponse({"ok": True})
+
+    monkeypatch.setattr(handler_module, "get_right_order_providers", fake_order)
+    monkeypatch.setattr(handler_module, "process_request", fake_process_request)
+    moderation_verdict_cache.clear()
+
+    def request(text):
+        return RequestModel(model="gpt-4o", messages=[{"role": "user", "content": text}])
+
+    assert (await handler.request_model(request("good"), 0, BackgroundTasks())).status_code == 200
+    response = await handler.request_model(request("bad"), 0, BackgroundTasks())
+    assert response.status_code == 400
+    assert info["is_flagged"] is True
+    # 结论缓存命中时不再调用审查接口
+    assert (await handler.request_model(request("good"), 0, BackgroundTasks())).status_code == 200
+    assert moderated == ["good", "bad"]
+    moderation_verdict_cache.clear()
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils
+from core.utils import ApiKeyList
+from utils import get_cached_models, get_cached_models_response, cached_models_response, etag_matches
+
+
+def _app():
+    config = {
+        "providers": [{"provider": "up", "model": ["gpt-4o", "claude"]}],
+        "api_keys": [{"api": "sk-a", "model": ["up/*"]}, {"api": "sk-b", "model": ["up/claude"]}],
+    }
+    return SimpleNamespace(state=SimpleNamespace(config=config, api_list=ApiKeyList(config["api_keys"])))
+
+
+def _render(models):
+    return {"object": "list", "data": models}
+
+
+def test_models_are_cached_per_api_key_until_config_update(monkeypatch):
+    app = _app()
+    calls = []
+    original = utils.post_all_models
+    monkeypatch.setattr(utils, "post_all_models", lambda *args: calls.append(args[0]) or original(*args))
+
+    assert [m["id"] for m in get_cached_models(app, 0)] == ["claude", "gpt-4o"]
+    assert [m["id"] for m in get_cached_models(app, 1)] == ["claude"]
+    body, etag = get_cached_models_response(app, 0, "openai", _render)
+    assert get_cached_models_response(app, 0, "openai", _render) == (body, etag)
+    assert json.loads(body)["data"][0]["id"] == "claude"
+    assert calls == [0, 1]
+
+    app.state.api_list = ApiKeyList(app.state.config["api_keys"])  # update_config 会整体重建 api_list
+    get_cached_models(app, 0)
+    assert calls == [0, 1, 0]
+
+
+def test_etag_short_circuit():
+    body, etag = b'{"data":[]}', '"abc"'
+    assert etag_matches(f'W/{etag}, "other"', etag)
+    assert not etag_matches(None, etag)
+
+    response = cached_models_response(etag, body, etag)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+
+    response = cached_models_response('"stale"', body, etag)
+    assert response.status_code == 200
+    assert response.body == body
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.middleware import (
+    get_request_json,
+    get_validated_request,
+    PARSED_BODY_STATE_KEY,
+    UNIFIED_REQUEST_STATE_KEY,
+)
+from core.models import UnifiedRequest
+
+
+def _request(body: bytes, state: dict) -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "headers": [], "state": state}
+    return Request(scope, receive)
+
+
+@pytest.mark.asyncio
+async def test_get_request_json_reuses_middleware_result():
+    """中间件已解析的请求体直接复用，不再读取 body。"""
+    parsed = {"model": "gpt-4o", "messages": []}
+    request = _request(b"not json", {PARSED_BODY_STATE_KEY: parsed})
+    assert await get_request_json(request) is parsed
+
+
+@pytest.mark.asyncio
+async def test_get_request_json_parses_once_without_middleware():
+    state = {}
+    request = _request(b'{"a": 1}', state)
+    assert await get_request_json(request) == {"a": 1}
+    assert state[PARSED_BODY_STATE_KEY] == {"a": 1}
+
+
+def test_unified_validation_does_not_pollute_shared_body():
+    """UnifiedRequest 校验不能向共享的 parsed_body 写入 data 字段。"""
+    parsed = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}]}
+    model = UnifiedRequest.model_validate(dict(parsed)).data
+    assert "data" not in parsed
+
+    request = _request(b"", {UNIFIED_REQUEST_STATE_KEY: model})
+    assert get_validated_request(request, "chat") is model
+    assert get_validated_request(request, "image") is None
@@ -0,0 +1,103 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.models import RequestModel
+from core.request import get_payload, PayloadCache
+from core.channels import get_channel
+
+
+def _provider(name: str) -> dict:
+    return {
+        "provider": name,
+        "base_url": "https://api.example.com/v1/chat/completions",
+        "api": ["sk-a", "sk-b"],
+        "model": ["gpt-4o"],
+        "preferences": {"post_body_parameter_overrides": {"all": {"temperature": 0.1}}},
+    }
+
+
+@pytest.mark.asyncio
+async def test_retry_reuses_adapter_build_and_swaps_key(monkeypatch):
+    """同引擎同配置的重试只调用一次渠道适配器，并替换为新的 key。"""
+    channel = get_channel("openai")
+    calls = 0
+    original_adapter = channel.request_adapter
+
+    async def counting_adapter(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return await original_adapter(*args, **kwargs)
+
+    monkeypatch.setattr(channel, "request_adapter", counting_adapter)
+
+    request = RequestModel(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+    cache = PayloadCache()
+
+    _, headers_a, payload_a = await get_payload(request, "openai", _provider("p1"), "sk-a", payload_cache=cache)
+    _, headers_b, payload_b = await get_payload(request, "openai", _provider("p2"), "sk-b", payload_cache=cache)
+
+    assert calls == 1
+    assert "sk-b" in headers_b["Authorization"]
+    assert "sk-a" in headers_a["Authorization"]
+    assert payload_a == payload_b
+    assert payload_b["temperature"] == 0.1
+
+    # 返回的是副本，修改不会污染缓存
+    payload_b["messages"].append({"role": "user", "content": "extra"})
+    _, _, payload_c = await get_payload(request, "openai", _provider("p1"), "sk-a", payload_cache=cache)
+    assert payload_c == payload_a
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_key_swap_uses_channel_auth_header_only(monkeypatch):
+    """换 key 只重建渠道声明的认证头，不对其它值做字符串替换；key 出现在 URL 中时不跨 key 复用。"""
+    channel = get_channel("openai")
+    original_adapter = channel.request_adapter
+
+    async def adapter_with_key_in_other_header(request, engine, provider, api_key=None):
+        url, headers, payload = await original_adapter(request, engine, provider, api_key)
+        headers["X-Trace"] = "trace-sk-a-1"
+        return url, headers, payload
+
+    monkeypatch.setattr(channel, "request_adapter", adapter_with_key_in_other_header)
+    request = RequestModel(model="gpt-4o", messages=[{"role": "user", "content": "sk-a"}])
+    cache = PayloadCache()
+    await get_payload(request, "openai", _provider("p1"), "sk-b", payload_cache=cache)
+    _, headers, payload = await get_payload(request, "openai", _provider("p2"), "sk-a", payload_cache=cache)
+    assert headers["Authorization"] == "Bearer sk-a"
+    assert headers["X-Trace"] == "trace-sk-a-1"
+    assert payload["messages"][0]["content"] == "sk-a"
+    assert cache.hits == 1
+
+    # 构建结果的其它头里含有 key 时无法安全换 key，重新构建
+    cache = PayloadCache()
+    await get_payload(request, "openai", _provider("p1"), "sk-a", payload_cache=cache)
+    await get_payload(request, "openai", _provider("p2"), "sk-b", payload_cache=cache)
+    assert cache.hits == 0 and cache.misses == 2
+
+
+def test_fingerprint_covers_only_fields_read_by_adapters():
+    """代理、限流、权重等不影响构建的配置不同的兄弟渠道共用指纹；适配器读取的字段不同则不复用。"""
+    cache = PayloadCache()
+    base = _provider("p1")
+    sibling = _provider("p2")
+    sibling["preferences"] = {
+        **sibling["preferences"],
+        "proxy": "socks5://127.0.0.1:1080",
+        "api_key_rate_limit": "10/min",
+        "weight": 3,
+        "system_prompt": "be brief",
+    }
+    sibling["remark"] = "backup"
+    assert cache.provider_fingerprint(base) == cache.provider_fingerprint(sibling)
+
+    other_url = {**_provider("p3"), "base_url": "https://other.example.com/v1/chat/completions"}
+    assert cache.provider_fingerprint(other_url) != cache.provider_fingerprint(base)
+    routed = _provider("p4")
+    routed["preferences"] = {**routed["preferences"], "route": "fallback"}
+    assert cache.provider_fingerprint(routed) != cache.provider_fingerprint(base)
@@ -0,0 +1,104 @@
+import os
+import sys
+import copy
+import asyncio
+import tracemalloc
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.models import RequestModel
+from core.request import _prepend_system_prompt
+from core.channels.gemini_channel import get_gemini_payload
+from core.channels.vertex_channel import get_vertex_gemini_payload
+
+IMAGE = "data:image/png;base64," + "A" * 200_000
+
+
+def _request(turns=200, model="gemini-2.5-pro"):
+    messages = [{"role": "system", "content": "be brief"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": [
+            {"type": "text", "text": f"question {i} " + "x" * 2000},
+            {"type": "image_url", "image_url": {"url": IMAGE}},
+        ]})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "y" * 2000})
+    return RequestModel(model=model, messages=messages)
+
+
+def _provider():
+    return {
+        "provider": "g",
+        "base_url": "https://generativelanguage.googleapis.com/v1beta",
+        "project_id": "p",
+        "model": [{"gemini-2.5-pro": "gemini-2.5-pro"}],
+    }
+
+
+def _peak(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.asyncio
+async def test_gemini_payload_reads_messages_without_copying():
+    request = _request()
+    before = request.model_dump()
+
+    _, _, payload = await get_gemini_payload(request, "gemini", _provider(), "key")
+    assert request.model_dump() == before
+    assert [c["role"] for c in payload["contents"][:2]] == ["user", "model"]
+    # 文本直接引用原消息中的字符串
+    assert payload["contents"][1]["parts"][0]["text"] is request.messages[2].content
+
+
+@pytest.mark.asyncio
+async def test_vertex_payload_keeps_request_roles():
+    request = _request(turns=2)
+    _, _, payload = await get_vertex_gemini_payload(request, "vertex-gemini", _provider(), "AQ.key")
+    assert [c["role"] for c in payload["contents"]] == ["user", "model", "user", "model"]
+    assert request.messages[2].role == "assistant"
+
+
+def test_prepend_system_prompt_shares_untouched_messages():
+    request = _request()
+    prepared, peak = _peak(lambda: _prepend_system_prompt(request, "channel prompt"))
+    _, deepcopy_peak = _peak(lambda: copy.deepcopy(request.messages))
+
+    assert prepared.messages[0].content == "channel prompt\n\nbe brief"
+    assert request.messages[0].content == "be brief"
+    assert all(a is b for a, b in zip(prepared.messages[1:], request.messages[1:]))
+    # 未显式设置的默认参数不会被序列化往返“固化”
+    assert prepared.model_fields_set == request.model_fields_set
+    # 内存基准：远小于复制整段对话的开销
+    assert peak * 10 < deepcopy_peak
+
+
+def _inline_data_size(payload):
+    return sum(
+        sys.getsizeof(part["inlineData"]["data"])
+        for content in payload["contents"] for part in content["parts"] if "inlineData" in part
+    )
+
+
+@pytest.mark.parametrize("builder, engine, api_key", [
+    (get_gemini_payload, "gemini", "key"),
+    (get_vertex_gemini_payload, "vertex-gemini", "AQ.key"),
+])
+def test_gemini_payload_peak_memory_excludes_messages_dump(builder, engine, api_key):
+    request = _request()
+
+    def build():
+        return asyncio.run(builder(request, engine, _provider(), api_key))[2]
+
+    build()  # 预热工具转换缓存、模块导入等一次性开销
+    payload, peak = _peak(build)
+    _, dump_peak = _peak(lambda: request.model_dump(exclude_unset=True))
+
+    # 除 inline_data 必需的 base64 截取外，额外开销小于“构建 contents + 完整 dump 整段对话”
+    assert peak - _inline_data_size(payload) < dump_peak * 2
@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.handler import init_preference, get_preference, _resolve_preference
+
+
+CONFIG = {
+    "preferences": {"model_timeout": {"gpt-4": 30, "claude": 60, "default": 100}},
+    "providers": [
+        {"provider": "p1", "preferences": {"model_timeout": {"o1": 300, "default": 50}}},
+        {"provider": "p2"},
+    ],
+}
+
+
+def test_memoised_resolution_keeps_fuzzy_semantics():
+    table = init_preference(CONFIG, "model_timeout", 600)
+    cases = [
+        ("p1", ("o1-preview", "o1-preview")),
+        ("p1", ("gpt-4o", "my-alias")),
+        ("p2", ("gpt-4o", "gpt-4o")),
+        ("p2", ("claude-3-opus", "alias")),
+        ("p2", ("unknown", "unknown")),
+        ("p3", ("gpt-4-turbo", "gpt-4-turbo")),
+    ]
+    expected = [_resolve_preference(table, c, m[0], m[1], 600) for c, m in cases]
+    assert expected == [300, 50, 30, 100, 100, 30]
+
+    for _ in range(2):
+        assert [get_preference(table, c, m, 600) for c, m in cases] == expected
+    assert len(table.resolved) == len(cases)
+
+
+def test_rebuilt_table_starts_with_empty_cache():
+    table = init_preference(CONFIG, "model_timeout", 600)
+    get_preference(table, "p2", ("gpt-4o", "gpt-4o"), 600)
+    updated = {**CONFIG, "preferences": {"model_timeout": {"gpt-4": 45}}}
+    new_table = init_preference(updated, "model_timeout", 600)
+    assert new_table.resolved == {}
+    assert get_preference(new_table, "p2", ("gpt-4o", "gpt-4o"), 600) == 45
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import core.raw_capture as raw_capture
+from core.raw_capture import (
+    get_sample_rate,
+    decide_capture,
+    start_deferred_capture,
+    defer_capture,
+    finalize_capture,
+    PENDING_CAPTURE_KEY,
+    CAPTURE_FULL,
+    CAPTURE_FAILURES,
+    CAPTURE_NONE,
+)
+
+
+CONFIG = {
+    "preferences": {"log_raw_data_sample_rate": {"gpt-4": 0.5, "default": 0.1}},
+    "api_keys": [
+        {"api": "sk-a", "preferences": {"log_raw_data_sample_rate": 20}},
+        {"api": "sk-b", "preferences": {"log_raw_data_capture_failures": False}},
+    ],
+}
+
+
+def test_sample_rate_precedence():
+    assert get_sample_rate(CONFIG, 0, "gpt-4o") == 0.2  # API Key 级，百分比写法
+    assert get_sample_rate(CONFIG, 1, "gpt-4o") == 0.5  # 全局按模型前缀
+    assert get_sample_rate(CONFIG, None, "claude") == 0.1
+    assert get_sample_rate({}, None, None) == 1.0
+
+
+def test_decide_capture(monkeypatch):
+    monkeypatch.setattr(raw_capture._sampler, "random", lambda: 0.99)
+    assert decide_capture(CONFIG, 0, "gpt-4o", 0) == CAPTURE_NONE
+    assert decide_capture({}, None, None, 24) == CAPTURE_FULL
+    assert decide_capture(CONFIG, 0, "gpt-4o", 24) == CAPTURE_FAILURES
+    assert decide_capture(CONFIG, 1, "gpt-4o", 24) == CAPTURE_NONE
+
+    monkeypatch.setattr(raw_capture._sampler, "random", lambda: 0.01)
+    assert decide_capture(CONFIG, 0, "gpt-4o", 24) == CAPTURE_FULL
+
+
+@pytest.mark.asyncio
+async def test_deferred_capture_materializes_only_on_failure():
+    info = {"success": False, "raw_data_expires_at": None}
+    start_deferred_capture(info, 24, {"authorization": "Bearer x", "x-test": "1"}, b'{"model": "m"}')
+    assert defer_capture(info, upstream_request_headers={"api-key": "k"}, upstream_request_body={"model": "m", "file": b"x"})
+    assert defer_capture(info, upstream_response_body='{"error": "boom"}')
+
+    await finalize_capture(info)
+    assert PENDING_CAPTURE_KEY not in info
+    assert info["raw_data_expires_at"] is not None
+    assert "authorization" not in info["request_headers"]
+    assert "file" not in info["upstream_request_body"]
+    assert "boom" in info["upstream_response_body"]
+
+    ok = {"success": True, "raw_data_expires_at": None}
+    start_deferred_capture(ok, 24, {}, b"{}")
+    await finalize_capture(ok)
+    assert ok == {"success": True, "raw_data_expires_at": None}
+    assert defer_capture(ok, upstream_response_body="x") is False
+
+
+def test_zero_rate_is_respected(monkeypatch):
+    """采样率 0 / 关闭失败采集不能被当作未配置。"""
+    monkeypatch.setattr(raw_capture._sampler, "random", lambda: 0.0)
+    config = {"preferences": {"log_raw_data_sample_rate": 0, "log_raw_data_capture_failures": False}}
+    assert get_sample_rate(config, None, "m") == 0.0
+    assert decide_capture(config, None, "m", 24) == CAPTURE_NONE
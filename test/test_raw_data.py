@@ -0,0 +1,55 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from db import Base, RequestRawData
+from core.raw_data import (
+    pop_raw_fields,
+    build_raw_rows,
+    add_raw_rows,
+    load_raw_fields,
+    merge_inline_fields,
+    compress_text,
+    decompress_text,
+)
+
+
+def test_compress_roundtrip():
+    text = "你好" * 1000
+    data = compress_text(text)
+    assert len(data) < len(text.encode("utf-8"))
+    assert decompress_text(data, "gzip") == text
+
+
+def test_pop_raw_fields_keeps_summary():
+    info = {"model": "m", "request_body": "body\x00", "response_body": "", "retry_path": "[]"}
+    fields = pop_raw_fields(info)
+    assert fields == {"request_body": "body"}
+    assert info == {"model": "m", "retry_path": "[]"}
+
+
+@pytest.mark.asyncio
+async def test_side_table_roundtrip_with_inline_fallback():
+    """侧表中的字段优先；旧版本内联在主表中的字段作为兜底。"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda c: Base.metadata.create_all(c, tables=[RequestRawData.__table__]))
+
+    rows = await build_raw_rows({"request_body": "req", "response_body": "resp"}, datetime.now(timezone.utc))
+    async with AsyncSession(engine) as session:
+        add_raw_rows(session, 7, rows)
+        await session.commit()
+        loaded = await load_raw_fields(session, 7)
+        assert await load_raw_fields(session, 8) == {}
+
+    assert loaded == {"request_body": "req", "response_body": "resp"}
+    merged = merge_inline_fields(loaded, {"request_headers": "{}", "request_body": "old"})
+    assert merged["request_body"] == "req"
+    assert merged["request_headers"] == "{}"
+    assert merged["upstream_response_body"] is None
+    await engine.dispose()
@@ -0,0 +1,72 @@
+import os
+import sys
+import contextlib
+from datetime import datetime, timezone, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import core.retention as retention
+from db import Base, RequestStat, ChannelStat, RequestRawData
+
+
+@pytest_asyncio.fixture
+async def session_factory(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=[RequestStat.__table__, ChannelStat.__table__, RequestRawData.__table__]
+            )
+        )
+
+    @contextlib.asynccontextmanager
+    async def scope():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    monkeypatch.setattr(retention, "async_session_scope", scope)
+    monkeypatch.setattr(retention, "DB_TYPE", "sqlite")
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 3)
+    monkeypatch.setattr(retention, "RETENTION_BATCH_PAUSE", 0)
+    monkeypatch.setattr(retention, "_raw_data_cleaned_until", None)
+    yield scope
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_raw_data_purged_in_batches_only_once(session_factory):
+    """只清空已过期行的原始字段；第二次调用只处理新过期的行。"""
+    now = datetime.now(timezone.utc)
+    async with session_factory() as session:
+        for i in range(10):
+            expires = now - timedelta(hours=1) if i % 2 else now + timedelta(hours=1)
+            session.add(RequestStat(request_id=str(i), request_body="body", raw_data_expires_at=expires))
+        await session.commit()
+
+    assert await retention.purge_expired_raw_data(now) == 5
+    assert await retention.purge_expired_raw_data(now + timedelta(minutes=1)) == 0
+    assert await retention.purge_expired_raw_data(now + timedelta(hours=2)) == 5
+
+    async with session_factory() as session:
+        remaining = (await session.execute(
+            select(func.count()).where(RequestStat.request_body.isnot(None))
+        )).scalar()
+    assert remaining == 0
+
+
+@pytest.mark.asyncio
+async def test_delete_expired_logs_by_id_range(session_factory):
+    now = datetime.now(timezone.utc)
+    async with session_factory() as session:
+        for i in range(10):
+            session.add(RequestStat(request_id=str(i), timestamp=now - timedelta(days=i)))
+            session.add(ChannelStat(request_id=str(i), timestamp=now - timedelta(days=i)))
+        await session.commit()
+
+    assert await retention.delete_expired_logs(now - timedelta(days=4, hours=12)) == (5, 5)
+    assert await retention.delete_expired_logs(now - timedelta(days=4, hours=12)) == (0, 0)
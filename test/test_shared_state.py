@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import asyncio
+import multiprocessing
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import core.shared_state as shared_state
+from core.shared_state import SharedState, set_shared_state, notify_config_changed, run_config_sync, launcher_worker_count
+from core.utils import ThreadSafeCircularList
+from core.channel_manager import ChannelManager
+
+
+@pytest.fixture
+def shared(tmp_path):
+    # 同一个文件上的两个实例模拟两个 worker 进程
+    path = str(tmp_path / "shared_state.db")
+    set_shared_state(SharedState(path))
+    yield path
+    set_shared_state(None)
+
+
+def test_sliding_window_is_shared_between_workers(shared):
+    worker_a, worker_b = SharedState(shared), SharedState(shared)
+    limits = [(2, 60)]
+    assert worker_a.hit("k", limits) is False
+    assert worker_b.hit("k", limits) is False
+    assert worker_a.hit("k", limits) is True
+    assert worker_b.hit("k", limits, record=False) is True
+    # 不限流的默认值不落盘
+    assert worker_a.hit("other", [(999999, 60)]) is False
+    assert worker_a.get_counter("missing") == 0
+
+
+@pytest.mark.asyncio
+async def test_round_robin_and_cooling_span_workers(shared):
+    worker_a = ThreadSafeCircularList(["k1", "k2", "k3"], shared_scope="provider:p")
+    worker_b = ThreadSafeCircularList(["k1", "k2", "k3"], shared_scope="provider:p")
+    picked = [await worker_a.next(), await worker_b.next(), await worker_a.next(), await worker_b.next()]
+    assert picked == ["k1", "k2", "k3", "k1"]
+
+    await worker_a.set_cooling("k2", cooling_time=60)
+    assert await worker_b.is_rate_limited("k2", is_check=True) is True
+    assert await worker_b.next() == "k3"
+
+    # 未指定 shared_scope 的列表（如 Vertex 区域轮询）保持进程内状态
+    local = ThreadSafeCircularList(["r1", "r2"])
+    assert [await local.next(), await local.next()] == ["r1", "r2"]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_spans_workers(shared):
+    worker_a = ThreadSafeCircularList(["key"], rate_limit="2/min", shared_scope="api_key")
+    worker_b = ThreadSafeCircularList(["key"], rate_limit="2/min", shared_scope="api_key")
+    assert await worker_a.is_rate_limited("key") is False
+    assert await worker_b.is_rate_limited("key") is False
+    assert await worker_a.is_rate_limited("key") is True
+    assert await worker_b.is_all_rate_limited() is True
+
+
+@pytest.mark.asyncio
+async def test_channel_cooldown_spans_workers(shared):
+    worker_a, worker_b = ChannelManager(cooldown_period=300), ChannelManager(cooldown_period=300)
+    await worker_a.exclude_model("openai", "gpt-4o")
+    assert await worker_b.is_model_excluded("openai", "gpt-4o") is True
+    assert await worker_b.is_model_excluded("openai", "gpt-4o-mini") is False
+    providers = [{"provider": "openai", "model": [{"gpt-4o": "gpt-4o"}], "preferences": {}}]
+    assert await worker_b.get_available_providers(providers) == []
+
+
+@pytest.mark.asyncio
+async def test_config_change_triggers_reload_in_other_workers(shared, monkeypatch):
+    monkeypatch.setattr(shared_state, "CONFIG_SYNC_INTERVAL", 0.01)
+    writer = SimpleNamespace(state=SimpleNamespace())
+    follower = SimpleNamespace(state=SimpleNamespace(shared_config_generation=0))
+    reloaded = asyncio.Event()
+
+    async def reload():
+        reloaded.set()
+
+    task = asyncio.create_task(run_config_sync(follower, reload))
+    try:
+        notify_config_changed(writer)
+        await asyncio.wait_for(reloaded.wait(), timeout=2)
+        assert follower.state.shared_config_generation == writer.state.shared_config_generation == 1
+    finally:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_failed_request_is_removed_from_shared_window(shared):
+    worker_a = ThreadSafeCircularList(["key"], rate_limit="1/min", shared_scope="provider:p")
+    worker_b = ThreadSafeCircularList(["key"], rate_limit="1/min", shared_scope="provider:p")
+    assert await worker_a.next("m") == "key"
+    # 上游未真正处理的失败请求撤销后不占用限流额度
+    await worker_a.discard_last_request("key", "m")
+    assert await worker_b.next("m") == "key"
+
+
+def test_unlimited_fixed_priority_pick_is_read_only(shared):
+    state = SharedState(shared)
+    candidate = lambda position: ("cooling", "rate")
+    assert state._pick_operation(None, 2, candidate, [(999999, 60)])[1] is False
+    assert state._pick_operation("cursor", 2, candidate, [(999999, 60)])[1] is True
+    assert state._pick_operation(None, 2, candidate, [(10, 60)])[1] is True
+
+
+@pytest.mark.asyncio
+async def test_cursor_lease_rotates_within_each_worker(shared, monkeypatch):
+    import core.utils as core_utils
+    monkeypatch.setattr(core_utils, "SHARED_CURSOR_LEASE", True)
+    worker_a = ThreadSafeCircularList(["k1", "k2", "k3"], shared_scope="provider:lease")
+    worker_b = ThreadSafeCircularList(["k1", "k2", "k3"], shared_scope="provider:lease")
+    picked_a = [await worker_a.next() for _ in range(3)]
+    picked_b = [await worker_b.next() for _ in range(3)]
+    assert picked_a == picked_b == ["k1", "k2", "k3"]
+    # 每个 worker 每轮只写一次游标
+    assert SharedState(shared).get_counter("provider:lease|cursor") == 6
+
+    await worker_a.set_cooling("k1", cooling_time=60)
+    assert await worker_b.next() == "k2"
+
+
+def test_launcher_worker_count_detects_uvicorn_workers(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr(sys, "argv", ["uvicorn", "main:app", "--workers", "3"])
+    assert launcher_worker_count() == 3
+    monkeypatch.setattr(sys, "argv", ["uvicorn", "main:app", "--workers=2"])
+    assert launcher_worker_count() == 2
+    monkeypatch.setattr(sys, "argv", ["uvicorn", "main:app"])
+    assert launcher_worker_count() == 1
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert launcher_worker_count() == 4
+
+
+BENCH_WORKERS = 4
+BENCH_REQUESTS = 300
+BENCH_CONCURRENCY = 20
+
+
+def _bench_worker(path, results):
+    """模拟一个 worker 进程：并发选 key，同时记录事件循环的最大停顿"""
+    set_shared_state(SharedState(path))
+    keys = ThreadSafeCircularList(["k1", "k2", "k3"], rate_limit="100000/min", shared_scope="provider:bench")
+
+    async def run():
+        picked = []
+        lag = 0.0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal lag
+            while not done.is_set():
+                before = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lag = max(lag, time.perf_counter() - before - 0.001)
+
+        async def client(count):
+            for _ in range(count):
+                picked.append(await keys.next("m"))
+
+        tick = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await asyncio.gather(*(client(BENCH_REQUESTS // BENCH_CONCURRENCY) for _ in range(BENCH_CONCURRENCY)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await tick
+        return picked, elapsed, lag
+
+    results.put(asyncio.run(run()))
+
+
+def test_multi_worker_pick_throughput(shared):
+    """多 worker 吞吐基准：每次选 key 一个事务，sqlite 调用不阻塞事件循环"""
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_bench_worker, args=(shared, results)) for _ in range(BENCH_WORKERS)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=60) for _ in workers]
+    wall = time.perf_counter() - start
+    for worker in workers:
+        worker.join(timeout=10)
+
+    total = BENCH_WORKERS * BENCH_REQUESTS
+    counts = Counter(key for picked, _, _ in outcomes for key in picked)
+    # 共享游标保证轮询在所有 worker 之间连续
+    assert sum(counts.values()) == total
+    assert max(counts.values()) - min(counts.values()) <= 1
+    assert SharedState(shared).get_counter("provider:bench|cursor") == total
+
+    max_lag = max(lag for _, _, lag in outcomes)
+    print(f"\n{BENCH_WORKERS} workers x {BENCH_REQUESTS} picks: {total / wall:.0f} picks/s, max loop lag {max_lag * 1000:.1f} ms")
+    assert max_lag < 0.5
@@ -0,0 +1,124 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.middleware import StatsMiddleware
+from core.moderation import ModerationVerdictCache
+
+
+def _middleware(downstream):
+    return StatsMiddleware(downstream, debug=False)
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+@pytest.mark.asyncio
+async def test_flagged_verdict_cancels_pending_upstream():
+    """审查不通过时取消仍在等待上游的下游任务，并且不放行任何响应。"""
+    upstream_cancelled = asyncio.Event()
+    current_info = {}
+
+    async def downstream(scope, receive, send):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            # 取消到达时已标记为审查取消，渠道不会记失败
+            assert current_info["moderation_cancelled"] is True
+            upstream_cancelled.set()
+            raise
+
+    sent = []
+    rejected = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def moderation():
+        await asyncio.sleep(0.01)
+        return True
+
+    async def reject():
+        rejected.append(True)
+
+    middleware = _middleware(downstream)
+    await middleware._run_with_speculative_moderation(
+        {}, _receive, send, asyncio.create_task(moderation()), current_info, reject
+    )
+    assert upstream_cancelled.is_set()
+    assert rejected == [True]
+    assert sent == []
+
+
+@pytest.mark.asyncio
+async def test_response_is_held_until_clean_verdict():
+    """上游先返回时，响应被挂起直到审查通过。"""
+    verdict = asyncio.get_running_loop().create_future()
+
+    async def downstream(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = []
+
+    async def send(message):
+        assert verdict.done()
+        sent.append(message)
+
+    async def moderation():
+        await asyncio.sleep(0.01)
+        verdict.set_result(False)
+        return False
+
+    async def reject():
+        raise AssertionError("should not reject")
+
+    middleware = _middleware(downstream)
+    await middleware._run_with_speculative_moderation(
+        {}, _receive, send, asyncio.create_task(moderation()), {}, reject
+    )
+    assert [m["type"] for m in sent] == ["http.response.start", "http.response.body"]
+
+
+def test_verdict_cache_lru_and_ttl():
+    cache = ModerationVerdictCache(max_items=2, ttl=3600)
+    cache.put("a", False)
+    cache.put("b", True)
+    assert cache.get("a") is False
+    cache.put("c", False)
+    assert cache.get("b") is None
+    assert cache.get("a") is False
+
+    expired = ModerationVerdictCache(max_items=2, ttl=1)
+    expired.put("x", True)
+    expired._items[expired.make_key("x")] = (True, 0)
+    assert expired.get("x") is None
+
+
+@pytest.mark.asyncio
+async def test_moderation_cancel_skips_channel_failure_stats(monkeypatch):
+    """审查取消的请求不计入渠道失败；普通取消仍然记录。"""
+    import core.handler as handler
+
+    recorded = []
+    monkeypatch.setattr(handler, "_fire_and_forget_channel_stats", lambda *args, **kwargs: recorded.append(kwargs))
+
+    def cancelled_client(*args, **kwargs):
+        raise asyncio.CancelledError()
+
+    from types import SimpleNamespace
+    app = SimpleNamespace(state=SimpleNamespace(config={}, client_manager=SimpleNamespace(get_client=cancelled_client)))
+    provider = {"provider": "p", "engine": "openai", "base_url": "https://x/v1", "model": ["m"], "_model_dict_cache": {"m": "m"}}
+
+    from core.models import RequestModel
+    request = RequestModel(model="m", messages=[{"role": "user", "content": "hi"}])
+    for flagged in (True, False):
+        info = {"request_id": "r", "api_key": "k", "moderation_cancelled": flagged}
+        with pytest.raises(asyncio.CancelledError):
+            await handler.process_request(request, provider, None, app, lambda: info, None)
+    assert [kwargs["success"] for kwargs in recorded] == [False]
@@ -0,0 +1,125 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from db import Base, RequestStat, ChannelStat, RequestStatRollup, ChannelStatRollup, StatsRollupState
+import core.stats_rollup as stats_rollup
+from core.stats_rollup import (
+    floor_hour,
+    ceil_hour,
+    request_rollup_row,
+    channel_rollup_row,
+    merge_rollup_rows,
+    add_request_rollups,
+    add_channel_rollups,
+    REQUEST_MEASURES,
+    prepare_rollups,
+    rollups_ready,
+)
+
+
+def test_hour_boundaries():
+    dt = datetime(2024, 5, 1, 10, 30, 15, tzinfo=timezone.utc)
+    assert floor_hour(dt) == datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    assert ceil_hour(dt) == datetime(2024, 5, 1, 11, tzinfo=timezone.utc)
+    exact = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    assert ceil_hour(exact) == exact
+    # SQLite 读回的 naive 时间按 UTC 处理
+    assert floor_hour(datetime(2024, 5, 1, 10, 5)) == exact
+
+
+def test_request_row_dims_and_latency_buckets():
+    ts = datetime(2024, 5, 1, 10, 30, tzinfo=timezone.utc)
+    row = request_rollup_row(
+        {"provider": "p", "model": "m", "status_code": 429, "process_time": 3.2, "total_tokens": 10},
+        timestamp=ts,
+    )
+    assert row["bucket"] == floor_hour(ts)
+    assert row["status_class"] == 4
+    assert row["latency_le_5s"] == 1 and row["latency_le_1s"] == 0
+    assert row["api_key"] == "" and row["success"] is False
+
+    other = request_rollup_row({"provider": "p", "model": "m", "status_code": 429, "process_time": 40}, timestamp=ts)
+    assert other["dims_key"] == row["dims_key"]
+    merged = merge_rollup_rows([row, other], REQUEST_MEASURES)
+    assert len(merged) == 1
+    assert merged[0]["request_count"] == 2
+    assert merged[0]["latency_gt_30s"] == 1
+    assert merged[0]["total_tokens"] == 10
+
+
+@pytest.mark.asyncio
+async def test_sqlite_upsert_accumulates():
+    """同一 (bucket, dims_key) 的多次写入应累加而不是冲突。"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=[RequestStatRollup.__table__, ChannelStatRollup.__table__]
+            )
+        )
+
+    ts = datetime(2024, 5, 1, 10, 30, tzinfo=timezone.utc)
+    async with AsyncSession(engine) as session:
+        for _ in range(3):
+            await add_request_rollups(
+                session, [request_rollup_row({"provider": "p", "model": "m", "success": True, "total_tokens": 5}, timestamp=ts)]
+            )
+            await add_channel_rollups(session, [channel_rollup_row("p", "m", "sk-1", True, timestamp=ts)])
+        await session.commit()
+
+        request_rows = (await session.execute(select(RequestStatRollup))).scalars().all()
+        channel_rows = (await session.execute(select(ChannelStatRollup))).scalars().all()
+
+    assert len(request_rows) == 1
+    assert request_rows[0].request_count == 3
+    assert request_rows[0].total_tokens == 15
+    assert len(channel_rows) == 1
+    assert channel_rows[0].request_count == 3
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_non_primary_worker_sees_rollups_ready_from_watermarks(tmp_path, monkeypatch):
+    """回填在主 worker 中完成后，其它 worker 读取回填状态即可使用 rollup"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=[
+            RequestStat.__table__, ChannelStat.__table__, RequestStatRollup.__table__,
+            ChannelStatRollup.__table__, StatsRollupState.__table__,
+        ]))
+
+    @asynccontextmanager
+    async def session_scope():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    monkeypatch.setattr(stats_rollup, "async_session_scope", session_scope)
+    monkeypatch.setattr(stats_rollup, "ROLLUP_READY_RECHECK_INTERVAL", 0)
+    monkeypatch.setattr(stats_rollup, "_rollups_ready", False)
+
+    async with session_scope() as session:
+        session.add(RequestStat(provider="p", model="m"))
+        session.add(ChannelStat(provider="p", model="m"))
+        await add_channel_rollups(session, [channel_rollup_row("p", "m", "sk-1", True)])
+        await session.commit()
+
+    # 首次部署：清空旧 rollup，水位为清空时原始表的最大 id
+    assert await prepare_rollups() == (1, 1)
+    async with session_scope() as session:
+        assert (await session.execute(select(ChannelStatRollup))).scalars().all() == []
+    assert await rollups_ready() is False
+
+    async with session_scope() as session:
+        session.add(StatsRollupState(name="request_stats_backfilled_id", value=1))
+        session.add(StatsRollupState(name="channel_stats_backfilled_id", value=1))
+        await session.commit()
+    assert await rollups_ready() is True
+    await engine.dispose()
@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.plugins.stream_utils import ThinkingTagSplitter
+
+
+def _split(splitter, chunks):
+    segments = []
+    for chunk in chunks:
+        segments.extend(splitter.feed(chunk))
+    segments.extend(splitter.flush())
+    merged = []
+    for kind, text in segments:
+        if merged and merged[-1][0] == kind:
+            merged[-1] = (kind, merged[-1][1] + text)
+        else:
+            merged.append((kind, text))
+    return merged
+
+
+def test_tags_split_across_chunks():
+    text = "intro<think>step 1\nstep 2</think>answer <b>bold</b>"
+    expected = [("content", "intro"), ("reasoning", "step 1\nstep 2"), ("content", "answer <b>bold</b>")]
+    for size in (1, 2, 3, 5, len(text)):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert _split(ThinkingTagSplitter("<think>", "</think>"), chunks) == expected
+
+
+def test_only_possible_tag_prefix_is_held_back():
+    splitter = ThinkingTagSplitter(open_tag=None, close_tag="</thinking>", start_inside=True)
+    assert splitter.feed("a < b") == [("reasoning", "a < b")]
+    assert splitter.feed("done </THINK") == [("reasoning", "done ")]
+    assert splitter.feed("ING>after <thinking>x") == [("content", "after <thinking>x")]
+    assert splitter.flush() == []
+
+
+def test_unfinished_tag_is_flushed_as_text():
+    splitter = ThinkingTagSplitter("<think>", "</think>", start_inside=True)
+    assert splitter.feed("reason</thi") == [("reasoning", "reason")]
+    assert splitter.flush() == [("reasoning", "</thi")]
+
+
+@pytest.mark.asyncio
+async def test_claude_thinking_transformer_uses_splitter():
+    from plugins.claude_thinking import ThinkingStreamTransformer
+
+    transformer = ThinkingStreamTransformer()
+    outputs = []
+    for piece in ["plan</thin", "king>Hi", "!"]:
+        line = "data: " + json.dumps({"choices": [{"delta": {"content": piece}}]})
+        outputs.extend(await transformer.transform_line(line))
+    outputs.extend(await transformer.transform_line("data: [DONE]"))
+
+    deltas = [json.loads(o[6:])["choices"][0]["delta"] for o in outputs if o.startswith("data: {")]
+    assert deltas == [{"reasoning_content": "plan"}, {"content": "Hi"}, {"content": "!"}]
+    assert outputs[-1] == "data: [DONE]\n"
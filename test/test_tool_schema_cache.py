@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.tool_cache import convert_tools_cached, tools_fingerprint, clear_tool_cache
+from core.channels.claude_channel import convert_claude_tools_cached
+
+
+def _functions(description="Search files"):
+    return [{
+        "name": "search",
+        "description": description,
+        "parameters": {
+            "type": "object",
+            "properties": {"query": {"$ref": "#/$defs/Query"}},
+            "defs": {"Query": {"type": "string"}},
+        },
+    }]
+
+
+def test_fingerprint_ignores_key_order():
+    assert tools_fingerprint([{"a": 1, "b": 2}]) == tools_fingerprint([{"b": 2, "a": 1}])
+    assert tools_fingerprint([{"a": 1}]) != tools_fingerprint([{"a": 2}])
+    assert tools_fingerprint([{"a": object()}]) is None
+
+
+def test_conversion_runs_once_per_tool_list():
+    clear_tool_cache()
+    calls = []
+
+    def convert(tools):
+        calls.append(tools)
+        return [dict(tool, converted=True) for tool in tools]
+
+    first = convert_tools_cached("test", [{"name": "a"}], convert)
+    second = convert_tools_cached("test", [{"name": "a"}], convert)
+    assert len(calls) == 1
+    # 外层列表每次都是新的，追加不会污染缓存
+    assert first is not second and first[0] is second[0]
+    first.append({"name": "plugin"})
+    assert len(convert_tools_cached("test", [{"name": "a"}], convert)) == 1
+
+    convert_tools_cached("other", [{"name": "a"}], convert)
+    assert len(calls) == 2
+
+
+def test_claude_conversion_resolves_refs_without_touching_input():
+    clear_tool_cache()
+    functions = _functions()
+    tools = convert_claude_tools_cached(functions)
+    assert tools[0]["input_schema"]["properties"]["query"] == {"type": "string"}
+    assert "defs" not in tools[0]["input_schema"]
+    assert functions == _functions()
+
+    assert convert_claude_tools_cached(_functions())[0] is tools[0]
+    assert convert_claude_tools_cached(_functions("changed"))[0]["description"] == "changed"
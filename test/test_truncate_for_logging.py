@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import base64
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.utils import truncate_for_logging
+
+
+def test_long_data_uri_is_elided_without_breaking_json():
+    url = "data:image/png;base64," + base64.b64encode(os.urandom(300_000)).decode()
+    body = json.dumps({"model": "m", "messages": [{"role": "user", "content": [{"type": "image_url", "image_url": {"url": url}}]}]})
+
+    result = truncate_for_logging(body.encode("utf-8"))
+    parsed = json.loads(result)
+    kept = parsed["messages"][0]["content"][0]["image_url"]["url"]
+    assert kept.startswith("data:image/png;base64,")
+    assert "截断" in kept
+    assert len(result) < 3000
+
+
+def test_items_and_depth_limits():
+    result = json.loads(truncate_for_logging(json.dumps({"items": list(range(60))}), max_items=50))
+    assert result["items"][-1] == "[... 10 更多项]"
+    assert len(result["items"]) == 51
+
+    deep = {"v": 1}
+    for _ in range(10):
+        deep = {"x": deep}
+    result = truncate_for_logging(json.dumps(deep), max_depth=3)
+    assert json.loads(result) == {"x": {"x": {"x": "[已截断：已达到最大深度]"}}}
+
+
+def test_escape_sequences_are_not_split():
+    body = json.dumps("你" * 1000)  # ensure_ascii 默认输出 \\uXXXX 转义
+    result = truncate_for_logging(body, max_str_length=2000)
+    assert json.loads(result).startswith("你")
+
+
+def test_sse_and_non_json_inputs():
+    sse = 'data: {"choices": [{"delta": {"content": "hi"}}]}\n\ndata: [DONE]\n'
+    assert truncate_for_logging(sse) == sse
+    assert truncate_for_logging("plain text") == '"plain text"'
+    assert truncate_for_logging({"k": "v"}) == '{"k": "v"}'
@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 import httpx
 import asyncio
 import h2.exceptions
@@ -8,7 +9,7 @@ import time as time_module
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
 from collections import defaultdict
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional, Tuple
 from ruamel.yaml import YAML, YAMLError
 from datetime import datetime, timedelta, timezone
 
@@ -17,10 +18,12 @@ from db import async_session_scope, ChannelStat, AppConfig, DISABLE_DATABASE, DB
 from core.env import env_bool
 
 from core.log_config import logger
+from core.shared_state import get_shared_state
 from core.utils import (
     safe_get,
     get_model_dict,
     ThreadSafeCircularList,
+    ApiKeyList,
     provider_api_circular_list,
 )
 
@@ -29,6 +32,11 @@ class InMemoryRateLimiter:
         self.requests = defaultdict(list)
 
     async def is_rate_limited(self, key: str, limits) -> bool:
+        # 多 worker 模式下限流窗口保存在共享状态中
+        shared = get_shared_state()
+        if shared is not None:
+            return await shared.ahit(f"global|{key}", limits)
+
         now = time()
 
         # 检查所有速率限制条件
@@ -301,6 +309,67 @@ def save_api_yaml(config_data):
                 pass
         raise RuntimeError(f"Failed to save api.yaml to '{target_path}': {e}") from e
 
+# ============== 增量应用配置 ==============
+# 配置更新时只重建发生变化的运行时结构：
+# 未变化渠道的 ThreadSafeCircularList（限流窗口、冷却状态、轮询游标）与模型映射会被原样保留。
+
+# provider -> 构建 ThreadSafeCircularList 时使用的配置签名
+_provider_key_list_signatures: Dict[str, tuple] = {}
+# provider -> (模型配置签名, model_dict)
+_provider_model_dicts: Dict[str, tuple] = {}
+
+
+def _config_signature(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+def _apply_provider_key_list(provider, items, disabled_keys) -> None:
+    """按需重建渠道的 API key 轮询列表；仅禁用集合变化时原地更新"""
+    name = provider['provider']
+    rate_limit = safe_get(provider, "preferences", "api_key_rate_limit", default={"default": "999999/min"})
+    schedule_algorithm = safe_get(provider, "preferences", "api_key_schedule_algorithm", default="round_robin")
+    base_signature = (tuple(items), _config_signature(rate_limit), schedule_algorithm)
+    signature = base_signature + (frozenset(disabled_keys),)
+
+    previous = _provider_key_list_signatures.get(name)
+    if previous is not None and name in provider_api_circular_list:
+        if previous == signature:
+            return
+        if previous[:3] == base_signature:
+            provider_api_circular_list[name].update_disabled_keys(disabled_keys)
+            _provider_key_list_signatures[name] = signature
+            return
+
+    provider_api_circular_list[name] = ThreadSafeCircularList(
+        items=items,
+        rate_limit=rate_limit,
+        schedule_algorithm=schedule_algorithm,
+        provider_name=name,
+        disabled_keys=disabled_keys,
+        shared_scope=f"provider:{name}",
+    )
+    _provider_key_list_signatures[name] = signature
+
+def _get_model_dict_incremental(provider) -> dict:
+    """模型配置未变化时复用上一次构建的 model_dict"""
+    name = provider['provider']
+    signature = (_config_signature(provider.get('model')), provider.get('model_prefix', ''))
+    cached = _provider_model_dicts.get(name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    model_dict = get_model_dict(provider)
+    _provider_model_dicts[name] = (signature, model_dict)
+    return model_dict
+
+def _prune_removed_providers(current_names, keyed_names) -> None:
+    """清理已删除渠道（或已不再配置 api key 的渠道）的运行时状态"""
+    for name in list(_provider_key_list_signatures):
+        if name not in keyed_names:
+            _provider_key_list_signatures.pop(name, None)
+            provider_api_circular_list.pop(name, None)
+    for name in list(_provider_model_dicts):
+        if name not in current_names:
+            _provider_model_dicts.pop(name, None)
+
 async def update_config(config_data, use_config_url=False, skip_model_fetch=False, save_to_file=True, save_to_db: bool = False):
     for index, provider in enumerate(config_data['providers']):
         if provider.get('project_id'):
@@ -336,22 +405,10 @@ async def update_config(config_data, use_config_url=False, skip_model_fetch=Fals
             
             if isinstance(provider_api, str):
                 items, disabled_keys = parse_api_keys([provider_api])
-                provider_api_circular_list[provider['provider']] = ThreadSafeCircularList(
-                    items=items,
-                    rate_limit=safe_get(provider, "preferences", "api_key_rate_limit", default={"default": "999999/min"}),
-                    schedule_algorithm=safe_get(provider, "preferences", "api_key_schedule_algorithm", default="round_robin"),
-                    provider_name=provider['provider'],
-                    disabled_keys=disabled_keys
-                )
+                _apply_provider_key_list(provider, items, disabled_keys)
             if isinstance(provider_api, list):
                 items, disabled_keys = parse_api_keys(provider_api)
-                provider_api_circular_list[provider['provider']] = ThreadSafeCircularList(
-                    items=items,
-                    rate_limit=safe_get(provider, "preferences", "api_key_rate_limit", default={"default": "999999/min"}),
-                    schedule_algorithm=safe_get(provider, "preferences", "api_key_schedule_algorithm", default="round_robin"),
-                    provider_name=provider['provider'],
-                    disabled_keys=disabled_keys
-                )
+                _apply_provider_key_list(provider, items, disabled_keys)
 
         if "models.inference.ai.azure.com" in provider['base_url'] and not provider.get("model"):
             provider['model'] = [
@@ -367,7 +424,7 @@ async def update_config(config_data, use_config_url=False, skip_model_fetch=Fals
         if provider.get("tools") is None:
             provider["tools"] = True
 
-        provider["_model_dict_cache"] = get_model_dict(provider)
+        provider["_model_dict_cache"] = _get_model_dict_incremental(provider)
         
         # 规范化渠道分组字段，支持单值与多值
         groups = provider.get("groups")
@@ -386,6 +443,11 @@ async def update_config(config_data, use_config_url=False, skip_model_fetch=Fals
         
         config_data['providers'][index] = provider
 
+    _prune_removed_providers(
+        {provider['provider'] for provider in config_data['providers']},
+        {provider['provider'] for provider in config_data['providers'] if provider.get('api')},
+    )
+
     for index, api_key in enumerate(config_data['api_keys']):
         if "api" in api_key:
             config_data['api_keys'][index]["api"] = str(api_key["api"])
@@ -445,7 +507,8 @@ async def update_config(config_data, use_config_url=False, skip_model_fetch=Fals
             config_data['api_keys'][index]['model'] = ["all"]
             api_keys_db[index]['model'] = ["all"]
 
-    api_list = [item["api"] for item in api_keys_db]
+    # 带哈希索引的 key 列表：鉴权/统计中的 api_list.index(token) 为 O(1)
+    api_list = ApiKeyList(api_keys_db)
     # logger.info(json.dumps(config_data, indent=4, ensure_ascii=False))
 
     # 管理阶段：只在显式请求保存时（save_to_file=True）才同步写回本地 api.yaml。
@@ -585,7 +648,7 @@ async def load_config(app=None):
                     "preferences": {},
                 }
         if not conf_seed or not isinstance(conf_seed, dict):
-            return {}, {}, []
+            return {}, {}, ApiKeyList()
 
     # 4) 规范化配置（不写回文件，避免启动时污染）
     config, api_keys_db, api_list = await update_config(
@@ -1072,7 +1135,7 @@ def post_all_models(api_index, config, api_list, models_list):
                         if not isinstance(p_groups, list) or not p_groups:
                             p_groups = ['default']
                         if allowed_groups.intersection(set(p_groups)):
-                            for model_item in models_list[provider]:
+                            for model_item in models_list.get(provider, []):
                                 if model_item not in unique_models:
                                     unique_models.add(model_item)
                                     model_info = {
@@ -1134,7 +1197,7 @@ def post_all_models(api_index, config, api_list, models_list):
 
                         if allowed_groups.intersection(set(p_groups)):
                             # 直接使用配置的模型名，不做归一化
-                            if model in models_list[provider]:
+                            if model in models_list.get(provider, []):
                                 if model not in unique_models:
                                     unique_models.add(model)
                                     model_info = {
@@ -1201,6 +1264,114 @@ def post_all_models(api_index, config, api_list, models_list):
     all_models.sort(key=lambda x: x["id"])
     return all_models
 
+def build_local_models_list(config, api_list) -> Dict[str, List[str]]:
+    """
+    在进程内计算被当作渠道引用的本地聚合器 Key（sk-）可用的模型列表
+
+    按引用关系递归解析（下层 Key 先解析），不再通过回环 HTTP 请求 /v1/models。
+    出现循环引用时，回到正在解析的 Key 的那一环按空列表处理。
+
+    Returns:
+        {聚合器 Key: [模型名, ...]}
+    """
+    models_list: Dict[str, List[str]] = {}
+    resolving = set()
+
+    def resolve(api_key: str) -> None:
+        if api_key in models_list:
+            return
+        if api_key in resolving:
+            logger.warning(f"Local API key reference cycle detected: {api_key[:11]}")
+            return
+        resolving.add(api_key)
+        local_index = api_list.index(api_key)
+        for rule in safe_get(config, 'api_keys', local_index, 'model', default=[]) or []:
+            provider_name = str(rule).split("/")[0]
+            if provider_name.startswith("sk-") and provider_name in api_list:
+                resolve(provider_name)
+        models_list[api_key] = [
+            item["id"] for item in post_all_models(local_index, config, api_list, models_list)
+        ]
+        resolving.discard(api_key)
+
+    for item in safe_get(config, 'api_keys', default=[]) or []:
+        for rule in item.get("model") or []:
+            provider_name = str(rule).split("/")[0]
+            if provider_name.startswith("sk-") and provider_name in api_list:
+                resolve(provider_name)
+    return models_list
+
+def get_local_models_list(app, config=None, api_list=None) -> Dict[str, List[str]]:
+    """
+    返回 app.state.models_list，配置更新（api_list 被整体重建）后自动重新计算
+
+    传入 config / api_list（请求固定的那一代配置）且已不是当前一代时，按传入的配置现场计算。
+    """
+    if api_list is not None and api_list is not getattr(app.state, "api_list", None):
+        return build_local_models_list(config or {}, api_list)
+    api_list = getattr(app.state, "api_list", None)
+    if getattr(app.state, "models_list", None) is None or getattr(app.state, "models_list_source", None) is not api_list:
+        app.state.models_list = build_local_models_list(getattr(app.state, "config", None) or {}, api_list or [])
+        app.state.models_list_source = api_list
+    return app.state.models_list
+
+def _model_list_cache(app) -> Dict[Any, Any]:
+    """按 API Key 缓存的模型列表；配置更新（api_list 被整体重建）后整体失效"""
+    api_list = getattr(app.state, "api_list", None)
+    if getattr(app.state, "model_list_cache", None) is None or getattr(app.state, "model_list_cache_source", None) is not api_list:
+        app.state.model_list_cache = {}
+        app.state.model_list_cache_source = api_list
+    return app.state.model_list_cache
+
+def get_cached_models(app, api_index) -> List[dict]:
+    """返回 post_all_models 的缓存结果（调用方不要原地修改）"""
+    cache = _model_list_cache(app)
+    key = ("models", api_index)
+    if key not in cache:
+        cache[key] = post_all_models(api_index, app.state.config, app.state.api_list, get_local_models_list(app))
+    return cache[key]
+
+def get_cached_models_response(app, api_index, variant: str, render: Callable[[List[dict]], Any]) -> Tuple[bytes, str]:
+    """
+    返回预序列化的模型列表响应体及其 ETag
+
+    Args:
+        app: FastAPI 应用实例
+        api_index: API key 索引
+        variant: 响应格式标识（如 openai / gemini），不同格式分别缓存
+        render: 将模型列表转换为响应内容的函数
+
+    Returns:
+        (JSON 字节, ETag)
+    """
+    cache = _model_list_cache(app)
+    key = (variant, api_index)
+    entry = cache.get(key)
+    if entry is None:
+        body = json.dumps(render(get_cached_models(app, api_index)), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        entry = cache[key] = (body, etag)
+    return entry
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中 ETag（支持多值、弱校验与 *）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def cached_models_response(if_none_match: Optional[str], body: bytes, etag: str):
+    """ETag 命中时返回 304，否则直接返回预序列化的响应体"""
+    from starlette.responses import Response
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 def get_all_models(config, allowed_groups=None):
     """
     获取所有模型列表。
@@ -1318,9 +1489,45 @@ async def query_channel_key_stats(
         )
         return sorted_stats
 
+    if not start_dt:
+        start_dt = datetime.now(timezone.utc) - timedelta(hours=24)
+
+    from core.stats_rollup import rollups_ready, query_channel_key_counts
+    if await rollups_ready():
+        stats_from_db = await query_channel_key_counts(provider_name, start_dt, end_dt)
+    else:
+        stats_from_db = await _query_channel_key_stats_raw(provider_name, start_dt, end_dt)
+
+    key_stats = []
+    for row in stats_from_db:
+        success_count = int(row["success_count"] or 0)
+        total_requests = int(row["total_requests"] or 0)
+        key_stats.append(
+            {
+                "api_key": row["provider_api_key"],
+                "success_count": success_count,
+                "total_requests": total_requests,
+                "success_rate": success_count / total_requests
+                if total_requests > 0
+                else 0,
+            }
+        )
+    # Sort the results by success rate and total requests
+    sorted_stats = sorted(
+        key_stats,
+        key=lambda item: (item["success_rate"], item["total_requests"]),
+        reverse=True,
+    )
+    return sorted_stats
+
+
+async def _query_channel_key_stats_raw(
+    provider_name: str,
+    start_dt: datetime,
+    end_dt: Optional[datetime] = None,
+) -> List[Dict]:
+    """直接聚合 ChannelStat 原始表（rollup 未就绪时使用）"""
     async with async_session_scope() as session:
-        if not start_dt:
-            start_dt = datetime.now(timezone.utc) - timedelta(hours=24)
         query = (
             select(
                 ChannelStat.provider_api_key,
@@ -1335,26 +1542,7 @@ async def query_channel_key_stats(
             query = query.where(ChannelStat.timestamp < end_dt)
         query = query.group_by(ChannelStat.provider_api_key)
         result = await session.execute(query)
-        stats_from_db = result.mappings().all()
-    key_stats = []
-    for row in stats_from_db:
-        key_stats.append(
-            {
-                "api_key": row.provider_api_key,
-                "success_count": row.success_count,
-                "total_requests": row.total_requests,
-                "success_rate": row.success_count / row.total_requests
-                if row.total_requests > 0
-                else 0,
-            }
-        )
-    # Sort the results by success rate and total requests
-    sorted_stats = sorted(
-        key_stats,
-        key=lambda item: (item["success_rate"], item["total_requests"]),
-        reverse=True,
-    )
-    return sorted_stats
+        return [dict(row) for row in result.mappings().all()]
 
 
 async def get_sorted_api_keys(